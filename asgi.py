@@ -0,0 +1,116 @@
+"""ASGI entry point.
+
+Cover letter generation is served by the async pipeline, so many concurrent
+generations share the pooled AsyncOpenAI client instead of each holding a
+worker thread. Every other route is passed through to the Flask app.
+
+    uvicorn asgi:application --host 127.0.0.1 --port 5000
+"""
+import asyncio
+import json
+
+from asgiref.wsgi import WsgiToAsgi
+
+from async_pipeline import AsyncCoverLetterGenerator, close_async_client
+from cover_letter_generator import metrics
+from main import app as flask_app, db, job_queue
+from pipeline import PipelineError
+from rate_limiter import request_class
+
+flask_asgi = WsgiToAsgi(flask_app)
+generator = AsyncCoverLetterGenerator()
+
+
+async def read_body(receive) -> bytes:
+    """Read the full request body."""
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+    return body
+
+
+def request_user(scope) -> str:
+    """Who a request is for, from the X-User-Id header or the client address."""
+    for name, value in scope.get("headers", []):
+        if name == b"x-user-id" and value:
+            return value.decode("latin-1")
+    client = scope.get("client")
+    return client[0] if client else "local"
+
+
+async def send_json(send, status: int, payload: dict):
+    """Send a JSON response with the CORS header the React frontend needs."""
+    body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("ascii")),
+            (b"access-control-allow-origin", b"*"),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def generate_cover_letter(scope, receive, send):
+    """Generate a cover letter on the async pipeline."""
+    try:
+        data = json.loads(await read_body(receive) or b"{}")
+    except json.JSONDecodeError:
+        await send_json(send, 400, {"error": "Invalid JSON body"})
+        return
+
+    resume, job_desc, sample_letter = await asyncio.gather(
+        asyncio.to_thread(db.get_document, 'resume', data.get('resume_name')),
+        asyncio.to_thread(db.get_document, 'job_description', data.get('job_description_name')),
+        asyncio.to_thread(db.get_document, 'cover_letter', data.get('sample_letter_name'))
+    )
+    if not all([resume, job_desc, sample_letter]):
+        await send_json(send, 400, {"error": "Missing required documents"})
+        return
+
+    try:
+        with request_class(user=request_user(scope)):
+            async with metrics.arun():
+                result = await generator.agenerate(
+                    resume['content'],
+                    [sample_letter['content']],
+                    data.get('preferences', ''),
+                    job_desc['content'],
+                    sample_letter['content']
+                )
+        await send_json(send, 200, result)
+    except PipelineError as e:
+        print(f"\nError during generation stage '{e.stage}': {e}")
+        await send_json(send, 500, {"error": str(e), "stage": e.stage})
+    except Exception as e:
+        print(f"\nError during generation: {e}")
+        await send_json(send, 500, {"error": str(e)})
+
+
+async def lifespan(receive, send):
+    """Resume background jobs on startup; close the shared OpenAI connection pool on shutdown."""
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await asyncio.to_thread(job_queue.resume)
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await asyncio.to_thread(job_queue.shutdown, False)
+            await close_async_client()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+    elif (scope["type"] == "http" and scope["method"] == "POST"
+            and scope["path"].rstrip("/") == "/api/generate-cover-letter"):
+        await generate_cover_letter(scope, receive, send)
+    else:
+        await flask_asgi(scope, receive, send)
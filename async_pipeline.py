@@ -0,0 +1,198 @@
+import asyncio
+import os
+from typing import TYPE_CHECKING, Dict, Generator, List, Optional, Tuple
+
+import httpx
+
+from cover_letter_generator import (
+    CoverLetterGenerator, Step, T, db, metrics, USER_PROFILE_FORMAT, JOB_ANALYSIS_FORMAT, ALIGNMENT_FORMAT, COVER_LETTER_FORMAT
+)
+from pipeline import PipelineError
+from prompt_registry import prompt_registry
+from rate_limiter import rate_limiter
+from retry_policy import deadline_after, deadline_scope, request_options
+from single_flight import async_stage_flights
+from validation import ValidationResult
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+# One pooled HTTP client is shared by every request on the event loop, so
+# concurrent generations reuse a few keep-alive sockets to the API.
+HTTP_LIMITS = httpx.Limits(
+    max_connections=int(os.getenv('OPENAI_MAX_CONNECTIONS', '20')),
+    max_keepalive_connections=int(os.getenv('OPENAI_MAX_KEEPALIVE_CONNECTIONS', '10')),
+    keepalive_expiry=float(os.getenv('OPENAI_KEEPALIVE_EXPIRY', '60'))
+)
+HTTP_TIMEOUT = httpx.Timeout(float(os.getenv('OPENAI_TIMEOUT', '300')), connect=10.0)
+
+_async_client: Optional["AsyncOpenAI"] = None
+_limited_async_client = (None, None)  # (client, its rate-limited wrapper)
+
+
+def get_async_client():
+    """Get the shared AsyncOpenAI client, creating it on first use, behind the shared rate limiter."""
+    global _async_client, _limited_async_client
+    if _async_client is None:
+        from openai import AsyncOpenAI
+        _async_client = AsyncOpenAI(
+            api_key=os.getenv('OPENAI_API_KEY'),
+            max_retries=0,  # retried by RetryPolicy, which knows the pipeline deadline
+            http_client=httpx.AsyncClient(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+        )
+    if _limited_async_client[0] is not _async_client:
+        _limited_async_client = (_async_client, rate_limiter.wrap_async(_async_client))
+    return _limited_async_client[1]
+
+
+async def close_async_client():
+    """Close the shared client and its connection pool."""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
+
+
+class AsyncCoverLetterGenerator(CoverLetterGenerator):
+    """CoverLetterGenerator whose stages await the shared AsyncOpenAI client.
+
+    Prompts, message building, stage caching, validation and retries are the
+    same as in the synchronous generator: both drive the steps of
+    _completion_steps, this one awaiting each step's I/O. Database reads and
+    writes (the stage cache, metrics and prompt reloads) run on worker
+    threads so they don't block the event loop.
+    """
+
+    async def avalidate_response_detailed(self, response: str, expected_format: str = "") -> ValidationResult:
+        """Validate a response locally, falling back to the LLM validator when undecided."""
+        return await self._arun_steps(self._validation_steps(response, expected_format))
+
+    async def aget_completion_with_validation(self, messages: List[Dict[str, str]], model: str = "gpt-4o",
+                                              expected_format: str = "", stage: str = "completion",
+                                              cache: bool = False, prompt_name: Optional[str] = None) -> Tuple[bool, str]:
+        """Get completion from OpenAI API with validation and retries."""
+        async with metrics.astage(stage, model) as stage_metrics:
+            return await self._arun_steps(self._completion_steps(messages, model, expected_format, stage_metrics,
+                                                                 stage, cache, prompt_name))
+
+    async def _arun_steps(self, steps: "Generator[Step, object, T]") -> "T":
+        """Carry out the steps of _completion_steps or _validation_steps without blocking the event loop."""
+        result, error = None, None
+        while True:
+            try:
+                step, argument = steps.throw(error) if error else steps.send(result)
+            except StopIteration as done:
+                return done.value
+            result, error = None, None
+            try:
+                if step == "complete":
+                    model, messages = argument
+                    result = await get_async_client().chat.completions.create(model=model, messages=messages,
+                                                                              **request_options())
+                elif step == "cached":
+                    result = await asyncio.to_thread(db.get_cached_stage, argument)
+                elif step == "save":
+                    await asyncio.to_thread(db.save_cached_stage, *argument)
+                elif step == "sleep":
+                    await asyncio.sleep(argument)
+                elif step == "shared":
+                    key, make_steps = argument
+                    result = await async_stage_flights.do(key, lambda: self._arun_steps(make_steps()))
+            except Exception as e:
+                error = e
+
+    async def _aload_prompts(self) -> None:
+        """Reload the prompts on a worker thread if they have changed, so reading them doesn't block the loop."""
+        if prompt_registry.is_stale():
+            await asyncio.to_thread(prompt_registry.refresh)
+
+    async def aprocess_user_info(self, resume: str, previous_letters: List[str], preferences: Optional[str] = None,
+                                 biography: Optional[str] = None, job_description: str = "") -> str:
+        """Stage 1: Process and organize user information."""
+        await self._aload_prompts()
+        messages, report = self._user_info_messages(resume, previous_letters, preferences, biography, job_description)
+        print(f"Candidate profile prompt: {report.describe()}")
+        success, response = await self.aget_completion_with_validation(
+            messages,
+            model="gpt-4o",
+            expected_format=USER_PROFILE_FORMAT,
+            stage="process_user_info",
+            cache=True,
+            prompt_name="info_manager"
+        )
+        if success:
+            return response
+        return f"Error processing user information: {response}"
+
+    async def aanalyze_job(self, job_description: str) -> str:
+        """Stage 2: Analyze job description."""
+        await self._aload_prompts()
+        success, response = await self.aget_completion_with_validation(
+            self._job_analysis_messages(job_description),
+            model="gpt-4o",
+            expected_format=JOB_ANALYSIS_FORMAT,
+            stage="analyze_job",
+            cache=True,
+            prompt_name="job_analyzer"
+        )
+        if success:
+            return response
+        return f"Error analyzing job: {response}"
+
+    async def aalign_profile_with_job(self, user_profile: str, job_analysis: str) -> str:
+        """Stage 3: Match user profile with job requirements."""
+        await self._aload_prompts()
+        success, response = await self.aget_completion_with_validation(
+            self._alignment_messages(user_profile, job_analysis),
+            model="gpt-4o",
+            expected_format=ALIGNMENT_FORMAT,
+            stage="align_profile_with_job",
+            cache=True,
+            prompt_name="alignment"
+        )
+        if success:
+            return response
+        return f"Error in alignment: {response}"
+
+    async def agenerate_cover_letter(self, alignment_data: str, sample_letter: str) -> str:
+        """Stage 4: Generate the final cover letter."""
+        await self._aload_prompts()
+        success, response = await self.aget_completion_with_validation(
+            self._cover_letter_messages(alignment_data, sample_letter),
+            model="o1-preview",
+            expected_format=COVER_LETTER_FORMAT,
+            stage="generate_cover_letter"
+        )
+        if success:
+            return response
+        return f"Error generating cover letter: {response}"
+
+    async def agenerate(self, resume: str, previous_letters: List[str], preferences: Optional[str],
+                        job_description: str, sample_letter: str) -> Dict[str, str]:
+        """Run the whole pipeline: profile and job analysis concurrently, then alignment, then the letter.
+
+        Every request made by the pipeline shares one deadline (PIPELINE_DEADLINE).
+        """
+        with deadline_scope(deadline_after()):
+            user_profile, job_analysis = await asyncio.gather(
+                self.aprocess_user_info(resume, previous_letters, preferences, job_description=job_description),
+                self.aanalyze_job(job_description)
+            )
+            for stage, output in (("user_profile", user_profile), ("job_analysis", job_analysis)):
+                if output.startswith("Error"):
+                    raise PipelineError(stage, output)
+
+            alignment = await self.aalign_profile_with_job(user_profile, job_analysis)
+            if alignment.startswith("Error"):
+                raise PipelineError("alignment", alignment)
+
+            cover_letter = await self.agenerate_cover_letter(alignment, sample_letter)
+            if cover_letter.startswith("Error"):
+                raise PipelineError("cover_letter", cover_letter)
+
+        return {
+            "cover_letter": cover_letter,
+            "user_profile": user_profile,
+            "job_analysis": job_analysis,
+            "alignment": alignment
+        }
@@ -0,0 +1,167 @@
+"""Per-call latency of DocumentDB with a fresh connection per call versus pooled connections.
+
+The server scenario serves reads from the threaded Flask dev server, where
+every request runs on a new thread, with per-thread connections versus the
+pool.
+
+    python benchmarks/db_benchmark.py --calls 2000
+    python benchmarks/db_benchmark.py --server-requests 2000 --server-clients 8
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import DocumentDB
+
+
+class UnpooledDocumentDB(DocumentDB):
+    """DocumentDB as it was before pooling: a new, untuned connection for every call."""
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path)
+
+
+class ThreadLocalDocumentDB(DocumentDB):
+    """DocumentDB with one tuned connection per thread, as it was before the bounded pool."""
+
+    @contextmanager
+    def _connect(self):
+        conn = getattr(self._local, "thread_conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, cached_statements=256)
+            for pragma, value in self.PRAGMAS.items():
+                conn.execute(f"PRAGMA {pragma} = {value}")
+            self._local.thread_conn = conn
+        with conn:
+            yield conn
+
+
+def seed(db: DocumentDB, documents: int):
+    """Fill the database with documents, a biography and prompts."""
+    for i in range(documents):
+        db.save_document("resume", f"resume-{i}", "Experienced engineer. " * 200)
+        db.save_document("job_description", f"job-{i}", "We are hiring. " * 200,
+                         {"company": f"Company {i}", "position": "Engineer"})
+    db.save_biography("# Biography\n" + "Built things. " * 500, "seed")
+    for name in ("info_manager", "job_analyzer", "alignment", "validator"):
+        db.save_prompt(name, f"You are the {name} prompt. " * 50, name)
+
+
+def time_calls(label: str, func, calls: int) -> dict:
+    """Time calls to func and return latency statistics in microseconds."""
+    timings = []
+    for i in range(calls):
+        start = time.perf_counter()
+        func(i)
+        timings.append((time.perf_counter() - start) * 1e6)
+    timings.sort()
+    return {
+        "operation": label,
+        "mean": statistics.mean(timings),
+        "p50": timings[len(timings) // 2],
+        "p95": timings[int(len(timings) * 0.95) - 1],
+    }
+
+
+def run(db: DocumentDB, calls: int, documents: int) -> list:
+    operations = {
+        "get_document": lambda i: db.get_document("resume", f"resume-{i % documents}"),
+        "list_documents": lambda i: db.list_documents("job_description"),
+        "get_prompt": lambda i: db.get_prompt("info_manager"),
+        "get_biography": lambda i: db.get_biography(),
+        "save_document": lambda i: db.save_document("cover_letter", f"letter-{i % documents}", "Dear team. " * 100),
+    }
+    return [time_calls(label, func, calls) for label, func in operations.items()]
+
+
+def run_server(db: DocumentDB, requests: int, clients: int, documents: int) -> dict:
+    """Serve the web app from the threaded dev server on db and time concurrent document reads."""
+    import logging
+    import database
+    from werkzeug.serving import make_server
+    from main import app
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    database._shared_db = db
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}/api"
+    paths = [f"/documents/resume/resume-{i % documents}" for i in range(documents)]
+    paths += ["/documents/job_description", "/prompts/info_manager", "/biography"]
+
+    def fetch(i: int) -> float:
+        start = time.perf_counter()
+        with urllib.request.urlopen(base + paths[i % len(paths)]) as response:
+            response.read()
+        return (time.perf_counter() - start) * 1e6
+
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            timings = sorted(pool.map(fetch, range(requests)))
+        elapsed = time.perf_counter() - start
+    finally:
+        server.shutdown()
+        server.server_close()
+    return {
+        "operation": "flask threaded",
+        "mean": statistics.mean(timings),
+        "p50": timings[len(timings) // 2],
+        "p95": timings[int(len(timings) * 0.95) - 1],
+        "throughput": requests / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=1000, help="Calls per operation")
+    parser.add_argument("--documents", type=int, default=50, help="Documents of each type to seed")
+    parser.add_argument("--server-requests", type=int, default=1000,
+                        help="Requests to the threaded Flask server (0 to skip it)")
+    parser.add_argument("--server-clients", type=int, default=8, help="Concurrent clients of the server")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for label, db_class in (("fresh connection", UnpooledDocumentDB), ("pooled", DocumentDB)):
+            db = db_class(os.path.join(tmp, f"{db_class.__name__}.db"))
+            seed(db, args.documents)
+            results[label] = run(db, args.calls, args.documents)
+            db.close()
+
+        server = {}
+        if args.server_requests:
+            for label, db_class in (("per-thread", ThreadLocalDocumentDB), ("pooled", DocumentDB)):
+                db = db_class(os.path.join(tmp, f"server-{db_class.__name__}.db"))
+                seed(db, args.documents)
+                server[label] = run_server(db, args.server_requests, args.server_clients, args.documents)
+                db.close()
+
+    print(f"{'operation':<16}{'fresh mean':>12}{'fresh p95':>12}{'pooled mean':>13}{'pooled p95':>12}{'speedup':>9}")
+    for before, after in zip(results["fresh connection"], results["pooled"]):
+        print(f"{before['operation']:<16}{before['mean']:>10.1f}us{before['p95']:>10.1f}us"
+              f"{after['mean']:>11.1f}us{after['p95']:>10.1f}us{before['mean'] / after['mean']:>8.1f}x")
+
+    if server:
+        before, after = server["per-thread"], server["pooled"]
+        print(f"\nThreaded Flask server, {args.server_requests} requests from {args.server_clients} clients "
+              "(a new thread per request):")
+        print(f"{'connections':<16}{'mean':>12}{'p95':>12}{'req/s':>9}")
+        for label, result in server.items():
+            print(f"{label:<16}{result['mean']:>10.1f}us{result['p95']:>10.1f}us{result['throughput']:>9.0f}")
+        print(f"pooled speedup: {before['mean'] / after['mean']:.1f}x mean, "
+              f"{after['throughput'] / before['throughput']:.1f}x throughput")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Prompt size and coverage of the editor's rolling context over a long session.
+
+Simulates an editing session offline: every turn gives a distinct
+instruction, and folds are summarized at once with a stand-in summary that
+names the instructions it covers. After each turn it checks that the next
+request still carries every earlier instruction, verbatim or in the
+summary, and exits non-zero if one went missing (as instruction 1 did
+after turns 7-9 with the defaults, when turns left the verbatim window
+before their batch was folded).
+
+    python benchmarks/editor_benchmark.py
+    python benchmarks/editor_benchmark.py --turns 100 --keep-turns 6 --fold-batch 4
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from editor_context import EditorContext
+from tokens import count_message_tokens
+
+LETTER = ("Dear Hiring Manager,\n\n" + "I build reliable services and care about the people who use them. " * 30
+          + "\n\nSincerely,\nAlex")
+
+
+def instruction(turn: int) -> str:
+    return f"Instruction {turn}: keep point {turn} in mind."
+
+
+def simulate(turns: int, keep_turns: int, fold_batch: int) -> list:
+    """Run the session; returns (turn, prompt tokens, verbatim turns, missing instructions) per turn."""
+    context = EditorContext("You are a cover letter editor.", LETTER, keep_turns, fold_batch)
+    rows = []
+    for turn in range(1, turns + 1):
+        messages = context.build_messages(instruction(turn))
+        sent = "\n".join(message["content"] for message in messages)
+        missing = [earlier for earlier in range(1, turn) if f"Instruction {earlier}:" not in sent]
+        rows.append((turn, count_message_tokens(messages), len(context.window()), missing))
+        context.record_turn(instruction(turn), f"Done: point {turn} applied.")
+        older = context.turns_to_fold()
+        if older:
+            # The stand-in summary keeps every instruction it has seen, as the real one is asked to
+            covered = [t.user for t in context.turns[:context.folded + len(older)]]
+            context.fold("\n".join(covered), len(older))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--keep-turns", type=int, default=6)
+    parser.add_argument("--fold-batch", type=int, default=4)
+    args = parser.parse_args()
+
+    rows = simulate(args.turns, args.keep_turns, args.fold_batch)
+    print(f"{'turn':>5}{'prompt tokens':>15}{'verbatim':>10}  missing")
+    for turn, tokens, verbatim, missing in rows:
+        print(f"{turn:>5}{tokens:>15}{verbatim:>10}  {', '.join(map(str, missing)) or '-'}")
+
+    failures = [(turn, missing) for turn, _, _, missing in rows if missing]
+    if failures:
+        print(f"\nFAIL: {len(failures)} requests dropped earlier instructions, first on turn {failures[0][0]} "
+              f"(instructions {', '.join(map(str, failures[0][1]))})")
+        sys.exit(1)
+    print(f"\nOK: every request carried all earlier instructions; "
+          f"prompt peaked at {max(tokens for _, tokens, _, _ in rows)} tokens")
+
+
+if __name__ == "__main__":
+    main()
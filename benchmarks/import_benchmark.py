@@ -0,0 +1,112 @@
+"""Start-up cost of the app's modules and of the `list` CLI command.
+
+Each measurement runs in a fresh interpreter (in a temporary directory with
+its own documents.db), since imports are only paid once per process. Module
+import times come from `python -X importtime`; the command is timed wall-clock.
+The budget applies to the command's time over a bare interpreter start
+(`python -c pass`), which varies a lot between machines and virtualenvs.
+Exits non-zero when that exceeds --budget-ms or when a deferred module is
+imported eagerly, so it guards against a heavy import creeping back in at
+module level.
+
+    python benchmarks/import_benchmark.py
+    python benchmarks/import_benchmark.py --runs 10 --budget-ms 100 --show 15
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ["cover_letter_generator", "main", "asgi"]
+
+# Modules that should only be imported when they are first needed
+DEFERRED = ["openai", "dotenv", "rich.console", "rich.markdown", "rich.live", "rich.prompt", "email.utils",
+            "concurrent.futures", "pipeline", "rate_limiter", "editor_context", "biography_merge", "prompt_budget"]
+
+
+def run_python(args: List[str], cwd: str) -> subprocess.CompletedProcess:
+    env = dict(os.environ, PYTHONPATH=ROOT, OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "benchmark"))
+    return subprocess.run([sys.executable] + args, cwd=cwd, env=env, capture_output=True, text=True)
+
+
+def import_times(module: str, cwd: str) -> Dict[str, int]:
+    """Cumulative import time in microseconds of every module loaded by importing module."""
+    result = run_python(["-X", "importtime", "-c", f"import {module}"], cwd)
+    if result.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{result.stderr[-2000:]}")
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def time_command(args: List[str], cwd: str, runs: int) -> List[float]:
+    """Wall-clock milliseconds of running python with args, once per run."""
+    # The first run creates the database tables, which later runs don't pay for
+    run_python(args, cwd)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = run_python(args, cwd)
+        timings.append((time.perf_counter() - start) * 1000)
+        if result.returncode != 0:
+            raise RuntimeError(f"command failed:\n{result.stderr[-2000:]}")
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="Timed runs of the list command")
+    parser.add_argument("--budget-ms", type=float, default=100.0,
+                        help="Fail if the list command's median takes longer than this over a bare interpreter")
+    parser.add_argument("--show", type=int, default=10, help="Slowest imports to show per module")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        report = {"modules": {}, "deferred_loaded": {}}
+        for module in MODULES:
+            times = import_times(module, workdir)
+            report["modules"][module] = times.get(module, 0) / 1000
+            report["deferred_loaded"][module] = [name for name in DEFERRED if name in times]
+            print(f"\nimport {module}: {times.get(module, 0) / 1000:.1f} ms")
+            for name, micros in sorted(times.items(), key=lambda item: item[1], reverse=True)[1:args.show + 1]:
+                print(f"  {micros / 1000:8.1f} ms  {name}")
+
+        baseline = statistics.median(time_command(["-c", "pass"], workdir, args.runs))
+        timings = time_command([os.path.join(ROOT, "cover_letter_generator.py"), "list", "resume"], workdir, args.runs)
+
+    median = statistics.median(timings)
+    report["interpreter_ms"] = baseline
+    report["list_command_ms"] = {"median": median, "min": min(timings), "max": max(timings)}
+    print(f"\ncover_letter_generator.py list resume: median {median:.1f} ms "
+          f"(min {min(timings):.1f}, max {max(timings):.1f}) over {args.runs} runs")
+    print(f"bare interpreter: median {baseline:.1f} ms, so the command adds {median - baseline:.1f} ms")
+
+    eager = report["deferred_loaded"]["cover_letter_generator"]
+    if eager:
+        print(f"Deferred modules loaded at import: {', '.join(eager)}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    over_budget = median - baseline > args.budget_ms
+    if over_budget or eager:
+        print(f"FAILED: over the {args.budget_ms:.0f} ms budget" if over_budget
+              else "FAILED: deferred modules imported eagerly")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""An in-process stand-in for the OpenAI client, for offline benchmarks.
+
+MockOpenAIClient answers chat.completions.create() with the canned,
+format-valid responses from mock_openai_server, after a simulated
+time-to-first-token and token generation time. Both are drawn from
+distributions seeded by the request contents, so the same request always
+takes the same time regardless of thread scheduling.
+
+    import cover_letter_generator
+    cover_letter_generator.client = MockOpenAIClient(latency=0.2, tokens_per_second=80)
+"""
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+from typing import Dict, Iterator, List
+
+from mock_openai_server import CANNED_RESPONSES, count_tokens, detect_stage
+
+
+class MockOpenAIClient:
+    def __init__(self, latency: float = 0.2, latency_sigma: float = 0.3, tokens_per_second: float = 80.0,
+                 tokens_per_second_jitter: float = 0.2, seed: int = 0):
+        """Simulate an LLM backend.
+
+        latency is the median time to first token in seconds, drawn from a
+        log-normal distribution with the given sigma. Output is produced at
+        tokens_per_second, varied by +/- tokens_per_second_jitter (a fraction).
+        A tokens_per_second of 0 returns the whole response at once.
+        """
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.tokens_per_second = tokens_per_second
+        self.tokens_per_second_jitter = tokens_per_second_jitter
+        self.seed = seed
+        self.calls: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def _timing(self, model: str, messages: List[Dict[str, str]]):
+        """Time to first token and output rate for a request, fixed by its contents."""
+        digest = hashlib.sha256(json.dumps([self.seed, model, messages], sort_keys=True).encode("utf-8")).digest()
+        rng = random.Random(digest)
+        first_token = self.latency * math.exp(rng.gauss(0.0, self.latency_sigma)) if self.latency else 0.0
+        rate = self.tokens_per_second * (1 + rng.uniform(-self.tokens_per_second_jitter, self.tokens_per_second_jitter))
+        return first_token, rate
+
+    def create(self, model: str, messages: List[Dict[str, str]], stream: bool = False, **kwargs):
+        """Return a canned completion shaped like the OpenAI SDK's response objects."""
+        stage = detect_stage(messages)
+        with self._lock:
+            self.calls[stage] = self.calls.get(stage, 0) + 1
+        content = CANNED_RESPONSES[stage]
+        usage = SimpleNamespace(
+            prompt_tokens=sum(count_tokens(message.get("content") or "") for message in messages),
+            completion_tokens=count_tokens(content)
+        )
+        usage.total_tokens = usage.prompt_tokens + usage.completion_tokens
+        first_token, rate = self._timing(model, messages)
+
+        time.sleep(first_token)
+        if stream:
+            return self._stream(content, rate, usage)
+        if rate:
+            time.sleep(usage.completion_tokens / rate)
+        return SimpleNamespace(
+            id=f"chatcmpl-mock-{uuid.uuid4().hex[:12]}",
+            model=model,
+            choices=[SimpleNamespace(index=0, message=SimpleNamespace(role="assistant", content=content),
+                                     finish_reason="stop")],
+            usage=usage
+        )
+
+    @staticmethod
+    def _stream(content: str, rate: float, usage) -> Iterator[SimpleNamespace]:
+        """Yield chunks of a few words, then a final usage-only chunk."""
+        words = content.split(" ")
+        for i in range(0, len(words), 3):
+            piece = " ".join(words[i:i + 3]) + (" " if i + 3 < len(words) else "")
+            if rate:
+                time.sleep(count_tokens(piece) / rate)
+            yield SimpleNamespace(
+                choices=[SimpleNamespace(index=0, delta=SimpleNamespace(content=piece), finish_reason=None)],
+                usage=None
+            )
+        yield SimpleNamespace(choices=[], usage=usage)
@@ -0,0 +1,265 @@
+"""Throughput and latency of the generation pipeline, Flask routes and DocumentDB against a mock LLM.
+
+The module-level OpenAI client in cover_letter_generator is replaced by
+MockOpenAIClient, so no network calls are made and runs are repeatable.
+Everything runs in a temporary directory with its own documents.db.
+
+    python benchmarks/pipeline_benchmark.py --requests 40 --concurrency 8
+    python benchmarks/pipeline_benchmark.py --scenarios flask-read,db --requests 2000 --latency 0
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_llm import MockOpenAIClient
+
+SCENARIOS = ["generator", "flask-generate", "flask-stream", "flask-read", "db"]
+
+RESUME = "Backend engineer. Six years of Python, Go and SQL. Led an event-driven migration. " * 20
+SAMPLE_LETTER = "Dear Hiring Manager, I am excited to apply. " * 30
+JOB_DESCRIPTION = "We are hiring a backend engineer to build reliable APIs with Python and SQL. " * 15
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, int(round(fraction * len(ordered))) - 1)]
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process so far."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def drive(label: str, func: Callable[[int], None], requests: int, concurrency: int) -> Dict:
+    """Call func(i) for i in range(requests) from a pool of concurrency threads and collect statistics."""
+    timings = []
+    errors = []
+
+    def timed(i: int):
+        start = time.perf_counter()
+        try:
+            func(i)
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+            return
+        timings.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(timed, range(requests)))
+    elapsed = time.perf_counter() - start
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = {
+        "scenario": label,
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": len(errors),
+        "throughput_per_s": len(timings) / elapsed if elapsed else 0.0,
+        "traced_peak_mb": traced_peak / (1024 * 1024),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    if timings:
+        result.update({
+            "mean_ms": sum(timings) / len(timings),
+            "p50_ms": percentile(timings, 0.50),
+            "p90_ms": percentile(timings, 0.90),
+            "p95_ms": percentile(timings, 0.95),
+            "p99_ms": percentile(timings, 0.99),
+        })
+    if errors:
+        result["first_error"] = errors[0]
+    return result
+
+
+def job_description(i: int, repeat_jobs: bool) -> str:
+    """A job description per request; distinct unless repeat_jobs, so stages miss the stage cache."""
+    return JOB_DESCRIPTION if repeat_jobs else f"{JOB_DESCRIPTION}\n\nRequisition {i}"
+
+
+def build_scenarios(args) -> Dict[str, Callable[[int], None]]:
+    # Imported here, after the working directory has moved to the temporary
+    # one, so the shared DocumentDB opens its file there.
+    from cover_letter_generator import CoverLetterGenerator, db, initialize_default_prompts
+    from pipeline import build_generation_pipeline
+
+    initialize_default_prompts()
+    import main
+
+    client = main.app.test_client()
+    generator = CoverLetterGenerator()
+
+    db.save_document("resume", "bench-resume", RESUME)
+    db.save_document("cover_letter", "bench-letter", SAMPLE_LETTER)
+    for i in range(args.requests):
+        db.save_document("job_description", f"bench-job-{i}", job_description(i, args.repeat_jobs))
+
+    def generation_request(i: int) -> Dict:
+        return {
+            "resume_name": "bench-resume",
+            "job_description_name": f"bench-job-{i}",
+            "sample_letter_name": "bench-letter",
+            "preferences": "Friendly and direct",
+        }
+
+    def run_generator(i: int):
+        build_generation_pipeline(
+            generator, RESUME, [SAMPLE_LETTER], "Friendly and direct", job_description(i, args.repeat_jobs), SAMPLE_LETTER
+        ).run()
+
+    def run_flask_generate(i: int):
+        response = client.post("/api/generate-cover-letter", json=generation_request(i))
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}: {response.get_json()}")
+
+    def run_flask_stream(i: int):
+        response = client.post("/api/generate-cover-letter/stream", json=generation_request(i))
+        body = response.get_data(as_text=True)
+        if "event: done" not in body:
+            raise RuntimeError(body[-200:])
+
+    read_routes = [
+        "/api/documents/job_description?limit=20",
+        "/api/documents/resume/bench-resume",
+        "/api/search?q=reliable%20APIs&limit=10",
+        "/api/prompts",
+        "/api/biography/versions",
+    ]
+
+    def run_flask_read(i: int):
+        response = client.get(read_routes[i % len(read_routes)])
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code} for {read_routes[i % len(read_routes)]}")
+
+    def run_db(i: int):
+        operation = i % 5
+        if operation == 0:
+            db.get_document("job_description", f"bench-job-{i % args.requests}")
+        elif operation == 1:
+            db.list_documents("job_description", limit=20)
+        elif operation == 2:
+            db.get_prompt("info_manager")
+        elif operation == 3:
+            db.search_documents("backend engineer", limit=10)
+        else:
+            db.save_document("cover_letter", f"bench-output-{i % 50}", SAMPLE_LETTER)
+
+    return {
+        "generator": run_generator,
+        "flask-generate": run_flask_generate,
+        "flask-stream": run_flask_stream,
+        "flask-read": run_flask_read,
+        "db": run_db,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma-separated subset of {SCENARIOS}")
+    parser.add_argument("--requests", type=int, default=20, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=4, help="Worker threads issuing requests")
+    parser.add_argument("--latency", type=float, default=0.2, help="Median seconds to first token")
+    parser.add_argument("--latency-sigma", type=float, default=0.3, help="Log-normal spread of the latency")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="Output rate (0 = instant)")
+    parser.add_argument("--tokens-per-second-jitter", type=float, default=0.2, help="+/- fraction of the output rate")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat-jobs", action="store_true",
+                        help="Use one job description for every request, so repeated stages hit the stage cache")
+    parser.add_argument("--rate-limits", metavar="RPM,TPM",
+                        help="Pace every model at these requests and tokens per minute (unpaced by default, "
+                             "the mock has no limits)")
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="Show the app's own console output")
+    args = parser.parse_args()
+
+    selected = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(selected) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    output_path = os.path.abspath(args.json) if args.json else None
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        app_output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        with app_output:
+            scenarios = build_scenarios(args)
+
+        import cover_letter_generator
+        mock = MockOpenAIClient(args.latency, args.latency_sigma, args.tokens_per_second,
+                                args.tokens_per_second_jitter, args.seed)
+        cover_letter_generator.client = mock
+        from rate_limiter import ModelLimits, rate_limiter
+        if args.rate_limits:
+            rpm, tpm = (int(value) for value in args.rate_limits.split(","))
+            rate_limiter.limits = {model: ModelLimits(rpm, tpm) for model in ("gpt-4o", "o1-preview")}
+        else:
+            rate_limiter.limits = {}
+
+        for name in selected:
+            if not args.repeat_jobs:
+                cover_letter_generator.db.clear_stage_cache()
+            print(f"Running {name} ({args.requests} requests, concurrency {args.concurrency})...")
+            with contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO()):
+                results.append(drive(name, scenarios[name], args.requests, args.concurrency))
+
+        stage_summary = cover_letter_generator.metrics.summary()
+        cover_letter_generator.db.close()
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    print(f"\n{'scenario':<16}{'ok/total':>10}{'req/s':>9}{'p50':>10}{'p95':>10}{'p99':>10}{'traced':>10}{'rss':>9}")
+    for result in results:
+        ok = f"{result['requests'] - result['errors']}/{result['requests']}"
+        rss = f"{result['peak_rss_mb']:.0f}MB" if result["peak_rss_mb"] is not None else "n/a"
+        if "p50_ms" in result:
+            latencies = f"{result['p50_ms']:>8.1f}ms{result['p95_ms']:>8.1f}ms{result['p99_ms']:>8.1f}ms"
+        else:
+            latencies = f"{'-':>10}{'-':>10}{'-':>10}"
+        print(f"{result['scenario']:<16}{ok:>10}{result['throughput_per_s']:>9.1f}{latencies}"
+              f"{result['traced_peak_mb']:>8.1f}MB{rss:>9}")
+        if "first_error" in result:
+            print(f"  first error: {result['first_error']}")
+
+    print(f"\n{'stage':<24}{'count':>7}{'p50':>10}{'p95':>10}{'cache hits':>12}")
+    for stage, summary in stage_summary.items():
+        print(f"{stage:<24}{summary['count']:>7}{summary['p50_ms']:>8.1f}ms{summary['p95_ms']:>8.1f}ms"
+              f"{summary['cache_hit_rate']:>11.0%}")
+    print(f"\nMock LLM calls by stage: {json.dumps(mock.calls, sort_keys=True)}")
+    if args.rate_limits:
+        from rate_limiter import rate_limiter
+        for model, stats in rate_limiter.stats().items():
+            if stats["granted"]:
+                print(f"Rate limiter {model}: {stats['granted']} requests, "
+                      f"wait p50 {stats['wait_p50_ms']:.1f}ms p95 {stats['wait_p95_ms']:.1f}ms")
+
+    if output_path:
+        with open(output_path, "w") as f:
+            json.dump({"settings": vars(args), "results": results, "stages": stage_summary,
+                       "llm_calls": mock.calls}, f, indent=2)
+        print(f"Results written to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
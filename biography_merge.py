@@ -0,0 +1,202 @@
+import math
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from validation import HEADING_PATTERN, normalize_heading
+
+HEADING_LINE = re.compile(r"^\s{0,3}(#{1,6})\s+(.+?)\s*#*\s*$")
+FENCE_LINE = re.compile(r"^\s{0,3}(```|~~~)")
+WORD_PATTERN = re.compile(r"[a-z0-9][a-z0-9+#]*")
+
+STOPWORDS = {
+    "the", "and", "for", "with", "that", "this", "from", "have", "has", "had", "was", "were", "are", "been",
+    "will", "would", "into", "about", "also", "their", "they", "them", "his", "her", "she", "him", "our",
+    "your", "you", "who", "which", "what", "when", "where", "while", "than", "then", "over", "under", "more",
+    "most", "some", "such", "only", "other", "very", "can", "not", "but", "all", "any", "each", "new",
+    "including", "through", "using", "used", "work", "worked", "working",
+}
+
+# A section is touched when it scores at least this fraction of the best
+# section's relevance, and at most this many sections are sent to the model.
+RELEVANCE_RATIO = 0.5
+MIN_SHARED_TERMS = 2
+MAX_TOUCHED_SECTIONS = 3
+
+
+@dataclass
+class Section:
+    """A top-level section of a Markdown biography; heading is empty for text before the first heading."""
+    heading: str
+    text: str
+
+    @property
+    def key(self) -> str:
+        return normalize_heading(self.heading)
+
+
+@dataclass
+class MergePlan:
+    """The sections of the current biography that an update touches."""
+    level: int
+    sections: List[Section]
+    touched: List[int]
+
+    @property
+    def touched_sections(self) -> List[Section]:
+        return [self.sections[i] for i in self.touched]
+
+    @property
+    def untouched_headings(self) -> List[str]:
+        return [section.heading for i, section in enumerate(self.sections)
+                if i not in self.touched and section.heading]
+
+
+def split_sections(markdown: str, level: Optional[int] = None) -> Tuple[int, List[Section]]:
+    """Split Markdown at its top-level headings (the shallowest level used, outside code fences).
+
+    Returns the heading level and the sections; joining the section texts
+    gives back the original document.
+    """
+    lines = markdown.splitlines(keepends=True)
+    headings = []
+    in_fence = False
+    for i, line in enumerate(lines):
+        if FENCE_LINE.match(line):
+            in_fence = not in_fence
+            continue
+        match = None if in_fence else HEADING_LINE.match(line)
+        if match:
+            headings.append((i, len(match.group(1)), match.group(2)))
+
+    if level is None:
+        level = min((depth for _, depth, _ in headings), default=1)
+    starts = [(i, heading) for i, depth, heading in headings if depth == level]
+
+    sections = []
+    if not starts or starts[0][0] > 0:
+        end = starts[0][0] if starts else len(lines)
+        sections.append(Section("", "".join(lines[:end])))
+    for n, (start, heading) in enumerate(starts):
+        end = starts[n + 1][0] if n + 1 < len(starts) else len(lines)
+        sections.append(Section(heading, "".join(lines[start:end])))
+    return level, sections
+
+
+def join_sections(sections: List[Section]) -> str:
+    """Join sections back into one document, separating them with a blank line."""
+    parts = [section.text.strip("\n") for section in sections if section.text.strip()]
+    return "\n\n".join(parts) + "\n"
+
+
+def _terms(text: str) -> set:
+    return {word for word in WORD_PATTERN.findall(text.lower()) if len(word) > 2 and word not in STOPWORDS}
+
+
+def _relevance(sections: List[Section], new_content: str) -> List[float]:
+    """Score each section by the IDF-weighted terms it shares with the new content."""
+    section_terms = [_terms(section.text) for section in sections]
+    new_terms = _terms(new_content)
+    scores = []
+    for terms in section_terms:
+        shared = new_terms & terms
+        if len(shared) < MIN_SHARED_TERMS:
+            scores.append(0.0)
+            continue
+        weight = sum(
+            math.log((len(sections) + 1) / (1 + sum(1 for other in section_terms if term in other))) + 1
+            for term in shared
+        )
+        # Long sections share more words by chance, so damp their score
+        scores.append(weight / math.sqrt(len(terms)))
+    return scores
+
+
+def plan_merge(current_content: str, new_content: str, notes: str = "") -> Optional[MergePlan]:
+    """Work out which sections of the current biography an update touches.
+
+    Sections are touched when the new content uses their heading, the notes
+    name them, or they share enough distinctive words with the new content.
+    Returns None when the whole biography should be rewritten instead: when
+    it has no sections, when the notes ask to replace or remove content, or
+    when every section is touched anyway.
+    """
+    if "remove" in notes.lower() or "replace" in notes.lower():
+        return None
+    level, sections = split_sections(current_content)
+    headed = [i for i, section in enumerate(sections) if section.heading]
+    if not headed:
+        return None
+
+    new_headings = {normalize_heading(match.group(1)) for match in HEADING_PATTERN.finditer(new_content)}
+    normalized_notes = f" {normalize_heading(notes)} "
+    touched = [
+        i for i in headed
+        if sections[i].key in new_headings or f" {sections[i].key} " in normalized_notes
+    ]
+
+    if not touched and not new_headings:
+        scores = _relevance(sections, new_content)
+        best = max(scores[i] for i in headed)
+        if best > 0:
+            ranked = sorted(headed, key=lambda i: scores[i], reverse=True)
+            touched = [i for i in ranked if scores[i] >= best * RELEVANCE_RATIO][:MAX_TOUCHED_SECTIONS]
+
+    if len(touched) == len(headed):
+        return None
+    return MergePlan(level, sections, sorted(touched))
+
+
+def _shift_headings(markdown: str, delta: int) -> str:
+    """Move every heading in markdown delta levels deeper (or shallower when negative)."""
+    if not delta:
+        return markdown
+
+    def shift(match):
+        depth = min(6, max(1, len(match.group(1)) + delta))
+        return "#" * depth + " "
+
+    return re.sub(r"^(#{1,6})\s+", shift, markdown, flags=re.MULTILINE)
+
+
+def apply_merge(plan: MergePlan, merged: str) -> str:
+    """Splice the model's updated sections back into the biography.
+
+    Each returned section replaces the touched section with the same heading.
+    A returned section that matches an untouched one only adds the lines that
+    section doesn't already have, since the model never saw its content; any
+    other returned section is added after the last touched section, or at
+    the end.
+    """
+    response_level, response_sections = split_sections(merged.strip() + "\n")
+    if not any(section.heading for section in response_sections) and len(plan.touched) == 1:
+        # A bare body for a single section: keep the original heading line
+        heading_line = plan.touched_sections[0].text.splitlines()[0]
+        response_sections = [Section(plan.touched_sections[0].heading, f"{heading_line}\n\n{merged.strip()}\n")]
+    elif response_level != plan.level:
+        _, response_sections = split_sections(_shift_headings(merged.strip() + "\n", plan.level - response_level),
+                                              plan.level)
+
+    sections = list(plan.sections)
+    by_key = {section.key: i for i, section in enumerate(sections) if section.heading}
+    insert_at = (plan.touched[-1] + 1) if plan.touched else len(sections)
+    has_headings = any(section.heading for section in response_sections)
+    added = []
+    for section in response_sections:
+        # Drop blank sections and any preamble ("Here are the updated sections:")
+        if not section.text.strip() or (has_headings and not section.heading):
+            continue
+        index = by_key.get(section.key) if section.heading else None
+        if index is not None and index in plan.touched:
+            sections[index] = section
+        elif index is not None:
+            existing = {line.strip() for line in sections[index].text.splitlines()}
+            body = section.text.splitlines()[1:]
+            extra = [line for line in body if line.strip() and line.strip() not in existing]
+            if extra:
+                sections[index] = Section(sections[index].heading,
+                                          sections[index].text.rstrip("\n") + "\n" + "\n".join(extra) + "\n")
+        else:
+            added.append(section)
+    sections[insert_at:insert_at] = added
+    return join_sections(sections)
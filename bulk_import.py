@@ -0,0 +1,254 @@
+import io
+import json
+import os
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import IO, Deque, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from database import DOCUMENT_TABLES
+
+TEXT_SUFFIXES = {".txt", ".md"}
+PDF_SUFFIX = ".pdf"
+JSONL_SUFFIXES = {".jsonl", ".ndjson"}
+
+# Documents saved per transaction
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', '500'))
+# Processes extracting PDF text (default: one per CPU)
+PDF_IMPORT_WORKERS = int(os.getenv('PDF_IMPORT_WORKERS', '0')) or None
+
+
+@dataclass
+class ImportedDocument:
+    """A document read from an import source, or the reason it couldn't be read."""
+    source: str
+    name: str
+    content: str = ""
+    metadata: Optional[Dict] = None
+    error: Optional[str] = None
+
+
+@dataclass
+class ImportReport:
+    """What a bulk import saved, skipped and failed on."""
+    imported: int = 0
+    skipped: int = 0
+    errors: List[Dict[str, str]] = field(default_factory=list)
+    seconds: float = 0.0
+
+    def to_dict(self) -> Dict:
+        return {"imported": self.imported, "skipped": self.skipped, "errors": self.errors,
+                "seconds": round(self.seconds, 3)}
+
+    def describe(self) -> str:
+        rate = f" ({self.imported / self.seconds:.0f}/s)" if self.seconds and self.imported else ""
+        return (f"Imported {self.imported} documents in {self.seconds:.1f}s{rate}, "
+                f"skipped {self.skipped} empty, {len(self.errors)} errors")
+
+
+def document_name(path: str) -> str:
+    """Name a document after its path, without the extension; folders are joined with '-'."""
+    stem = os.path.splitext(path)[0].replace("\\", "/").strip("/")
+    return "-".join(part for part in stem.split("/") if part)
+
+
+def extract_pdf_text(source: Union[str, bytes]) -> str:
+    """Extract the text of a PDF from a path or its bytes. Runs in a worker process."""
+    from PyPDF2 import PdfReader
+    reader = PdfReader(io.BytesIO(source) if isinstance(source, bytes) else source)
+    return "\n\n".join((page.extract_text() or "").strip() for page in reader.pages).strip()
+
+
+def _read_text(data: bytes) -> str:
+    try:
+        return data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return data.decode("latin-1")
+
+
+class _PdfExtractor:
+    """Extracts PDF text on a process pool, started on the first PDF."""
+
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers or PDF_IMPORT_WORKERS or os.cpu_count() or 1
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pending: Deque[Tuple[str, str, Future]] = deque()
+
+    def submit(self, source: str, name: str, pdf: Union[str, bytes]):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        self._pending.append((source, name, self._pool.submit(extract_pdf_text, pdf)))
+
+    def results(self, keep: Optional[int] = None) -> Iterator[ImportedDocument]:
+        """Yield finished PDFs in order, waiting for the oldest while more than keep are pending."""
+        while self._pending and (self._pending[0][2].done() or (keep is not None and len(self._pending) > keep)):
+            source, name, future = self._pending.popleft()
+            try:
+                yield ImportedDocument(source, name, future.result())
+            except Exception as e:
+                yield ImportedDocument(source, name, error=f"Could not read PDF: {e}")
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+
+def _with_pdfs(entries: Iterable[Tuple[str, str, Optional[bytes]]], path_root: Optional[str],
+               workers: Optional[int]) -> Iterator[ImportedDocument]:
+    """Turn (source, relative path, bytes or None to read from disk) entries into documents.
+
+    Text files are yielded as they are read. PDFs are extracted in parallel
+    and yielded as they finish, with at most a few per worker queued so a
+    large import doesn't hold every PDF in memory.
+    """
+    extractor = _PdfExtractor(workers)
+    limit = extractor.workers * 4
+    try:
+        for source, relative, data in entries:
+            suffix = os.path.splitext(relative)[1].lower()
+            name = document_name(relative)
+            if suffix == PDF_SUFFIX:
+                extractor.submit(source, name, data if data is not None else os.path.join(path_root, relative))
+                yield from extractor.results(keep=limit)
+                continue
+            try:
+                if data is None:
+                    with open(os.path.join(path_root, relative), "rb") as f:
+                        data = f.read()
+                yield ImportedDocument(source, name, _read_text(data))
+            except OSError as e:
+                yield ImportedDocument(source, name, error=str(e))
+            yield from extractor.results()
+        yield from extractor.results(keep=0)
+    finally:
+        extractor.close()
+
+
+def iter_directory(path: str, workers: Optional[int] = None) -> Iterator[ImportedDocument]:
+    """Documents from the .txt, .md and .pdf files under a directory, in path order."""
+    def entries():
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for filename in sorted(files):
+                if os.path.splitext(filename)[1].lower() in TEXT_SUFFIXES | {PDF_SUFFIX}:
+                    relative = os.path.relpath(os.path.join(root, filename), path)
+                    yield relative, relative, None
+    return _with_pdfs(entries(), path, workers)
+
+
+def iter_zip(archive: Union[str, IO[bytes]], workers: Optional[int] = None) -> Iterator[ImportedDocument]:
+    """Documents from the .txt, .md and .pdf files in a zip archive (a path or a seekable file)."""
+    with zipfile.ZipFile(archive) as zf:
+        def entries():
+            for info in zf.infolist():
+                suffix = os.path.splitext(info.filename)[1].lower()
+                if info.is_dir() or suffix not in TEXT_SUFFIXES | {PDF_SUFFIX}:
+                    continue
+                if os.path.basename(info.filename).startswith("._") or info.filename.startswith("__MACOSX/"):
+                    continue
+                yield info.filename, info.filename, zf.read(info)
+        yield from _with_pdfs(entries(), None, workers)
+
+
+def iter_jsonl(lines: Iterable[Union[str, bytes]], source: str = "jsonl") -> Iterator[ImportedDocument]:
+    """Documents from JSON lines with name and content (and company and position for job descriptions)."""
+    for number, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = _read_text(line)
+        if not line.strip():
+            continue
+        where = f"{source}:{number}"
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield ImportedDocument(where, "", error=f"Invalid JSON: {e}")
+            continue
+        if not isinstance(record, dict) or not record.get("name"):
+            yield ImportedDocument(where, "", error="Each line needs a name and content")
+            continue
+        metadata = record.get("metadata")
+        if not isinstance(metadata, dict):
+            metadata = {key: record[key] for key in ("company", "position") if key in record}
+        yield ImportedDocument(where, str(record["name"]), str(record.get("content") or ""), metadata or None)
+
+
+def iter_path(path: str, workers: Optional[int] = None) -> Iterator[ImportedDocument]:
+    """Documents from a directory, a zip archive, a JSONL file or a single text or PDF file."""
+    suffix = os.path.splitext(path)[1].lower()
+    if os.path.isdir(path):
+        return iter_directory(path, workers)
+    if suffix == ".zip":
+        return iter_zip(path, workers)
+    if suffix in JSONL_SUFFIXES:
+        return _iter_jsonl_file(path)
+    if suffix in TEXT_SUFFIXES | {PDF_SUFFIX}:
+        directory, filename = os.path.split(path)
+        return _with_pdfs([(path, filename, None)], directory or ".", workers)
+    raise ValueError(f"Can't import {path}: expected a directory, .zip, .jsonl, .txt, .md or .pdf")
+
+
+def iter_uploads(files: Iterable[Tuple[str, IO[bytes]]], workers: Optional[int] = None) -> Iterator[ImportedDocument]:
+    """Documents from uploaded (filename, file) pairs: zip archives, JSONL files and single documents."""
+    loose = []
+    for filename, stream in files:
+        suffix = os.path.splitext(filename)[1].lower()
+        if suffix == ".zip":
+            yield from iter_zip(stream, workers)
+        elif suffix in JSONL_SUFFIXES:
+            yield from iter_jsonl(stream, filename)
+        elif suffix in TEXT_SUFFIXES | {PDF_SUFFIX}:
+            loose.append((filename, stream))
+        else:
+            yield ImportedDocument(filename, "", error="Unsupported file type; expected .zip, .jsonl, .txt, .md or .pdf")
+    # Single files share one PDF pool, and are only read once it gets to them
+    yield from _with_pdfs(((filename, filename, stream.read()) for filename, stream in loose), None, workers)
+
+
+def _iter_jsonl_file(path: str) -> Iterator[ImportedDocument]:
+    with open(path, "rb") as f:
+        yield from iter_jsonl(f, os.path.basename(path))
+
+
+def import_documents(db, doc_type: str, documents: Iterable[ImportedDocument],
+                     batch_size: Optional[int] = None) -> ImportReport:
+    """Save documents of one type, batch_size per transaction, as they are read.
+
+    Empty documents are skipped and unreadable ones reported, without
+    stopping the import.
+    """
+    if doc_type not in DOCUMENT_TABLES:
+        raise ValueError(f"Unknown document type '{doc_type}'")
+    batch_size = batch_size or IMPORT_BATCH_SIZE
+    report = ImportReport()
+    start = time.perf_counter()
+    batch: List[Tuple[str, str, Optional[Dict]]] = []
+    sources: List[str] = []
+
+    def flush():
+        saved = db.save_documents(doc_type, batch)
+        report.imported += saved
+        if saved < len(batch):
+            report.errors.append({"source": f"{sources[0]} .. {sources[-1]}",
+                                  "error": f"Failed to save a batch of {len(batch)} documents"})
+        batch.clear()
+        sources.clear()
+
+    for document in documents:
+        if document.error:
+            report.errors.append({"source": document.source, "error": document.error})
+            continue
+        content = document.content.strip()
+        if not document.name or not content:
+            report.skipped += 1
+            continue
+        batch.append((document.name, content, document.metadata))
+        sources.append(document.source)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    report.seconds = time.perf_counter() - start
+    return report
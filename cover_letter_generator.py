@@ -1,39 +1,154 @@
-from openai import OpenAI
-from dotenv import load_dotenv
-from rich.markdown import Markdown
-from rich.console import Console
-from rich.table import Table
-from rich.prompt import Prompt, Confirm
 import os
 import json
-from typing import Dict, List, Tuple, Optional
-from database import DocumentDB
+import contextvars
+import hashlib
+import sys
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, Generator, Iterator, List, Tuple, TypeVar, Optional
+from database import DOCUMENT_TABLES, shared_db as db
+from instrumentation import MetricsRecorder
+from retry_policy import DeadlineExceeded, RetryPolicy, classify_error, request_options
+from prompt_registry import prompt_registry
+from single_flight import stage_flights
+
+if TYPE_CHECKING:
+    # Imported where they are used, so the CLI's document commands start quickly
+    from biography_merge import MergePlan
+    from prompt_budget import BudgetReport
+    from validation import ValidationResult
+
+T = TypeVar("T")
+# A piece of I/O requested by the shared completion logic: (step name, argument)
+Step = Tuple[str, object]
+
+# The OpenAI SDK takes about half a second to import, so the client is only
+# created when the first request is made. Assign a stand-in here to replace it.
+client = None
+metrics = MetricsRecorder(db)
+
+_limited_client = (None, None)  # (client, its rate-limited wrapper)
+
+def get_client():
+    """Get the OpenAI client, creating it on first use, behind the shared rate limiter."""
+    global client, _limited_client
+    if client is None:
+        from dotenv import load_dotenv
+        from openai import OpenAI
+        load_dotenv()
+        # Retries are handled by RetryPolicy, which knows the pipeline deadline
+        client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'), max_retries=0)
+    if _limited_client[0] is not client:
+        from rate_limiter import rate_limiter
+        _limited_client = (client, rate_limiter.wrap(client))
+    return _limited_client[1]
+
+_console = None
+
+def get_console():
+    """Get the rich Console, creating it on first use; rich.console takes about 40 ms to import."""
+    global _console
+    if _console is None:
+        from rich.console import Console
+        _console = Console()
+    return _console
+
+class _SharedConsole:
+    """Stands in for the Console so output can be written through it without importing rich up front."""
+
+    def __getattr__(self, name):
+        return getattr(get_console(), name)
+
+console = _SharedConsole()
+
+# Expected output formats for each pipeline stage, used by the validators
+USER_PROFILE_FORMAT = """# Professional Profile
+[Profile content]
+
+# Key Qualifications
+* [Qualifications]
 
-# Load environment variables and initialize clients
-load_dotenv()
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-console = Console()
-db = DocumentDB()
+# Experience Highlights
+* [Highlights]
+
+# Education & Certifications
+* [Education details]"""
+
+JOB_ANALYSIS_FORMAT = """# Core Requirements
+* [Requirements]
+
+# Preferred Qualifications
+* [Qualifications]
+
+# Key Responsibilities
+* [Responsibilities]"""
+
+ALIGNMENT_FORMAT = """# Key Matches
+* [Matches]
+
+# Areas to Address
+* [Areas]
+
+# Recommended Focus Points
+* [Points]"""
+
+COVER_LETTER_FORMAT = "[Professional letter format with clear paragraphs and standard business letter structure]"
 
 class CoverLetterGenerator:
     def __init__(self):
-        # Load prompts from the database
-        self.info_manager_prompt = self._load_prompt("info_manager")
-        self.job_analyzer_prompt = self._load_prompt("job_analyzer")
-        self.alignment_prompt = self._load_prompt("alignment")
-        self.validator_prompt = self._load_prompt("validator")
         self.max_retries = 3
+        self.retry_policy = RetryPolicy()
+        # How many responses each validation path (local or llm) decided
+        self.validation_paths = {"local": 0, "llm": 0}
+        self._stats_lock = threading.Lock()
+
+    # Prompts are read from the shared registry on each use, so edits take
+    # effect on the next generation
+    @property
+    def info_manager_prompt(self) -> str:
+        return prompt_registry.get("info_manager")
+
+    @property
+    def job_analyzer_prompt(self) -> str:
+        return prompt_registry.get("job_analyzer")
+
+    @property
+    def alignment_prompt(self) -> str:
+        return prompt_registry.get("alignment")
 
-    def _load_prompt(self, name: str) -> str:
-        """Load a prompt from the database."""
-        prompt = db.get_prompt(name)
-        if not prompt:
-            raise ValueError(f"Prompt '{name}' not found in database. Please initialize prompts first.")
-        return prompt["content"]
+    @property
+    def validator_prompt(self) -> str:
+        return prompt_registry.get("validator")
 
     def validate_response(self, response: str, expected_format: str = "") -> bool:
         """Validate if the response is proper and not an error message."""
-        messages = [
+        return self.validate_response_detailed(response, expected_format).valid
+
+    def validate_response_detailed(self, response: str, expected_format: str = "") -> "ValidationResult":
+        """Validate a response locally, falling back to the LLM validator when undecided."""
+        return self._run_steps(self._validation_steps(response, expected_format))
+
+    def _validation_steps(self, response: str, expected_format: str = "") -> "Generator[Step, object, ValidationResult]":
+        """The steps of validate_response_detailed; see _completion_steps."""
+        from validation import ValidationResult, validate_locally
+        result = validate_locally(response, expected_format)
+        if result.valid is None:
+            try:
+                validation_response = yield "complete", ("gpt-4o", self._validator_messages(response, expected_format))
+                stage_metrics = metrics.current_stage()
+                if stage_metrics:
+                    stage_metrics.add_usage(validation_response.usage)
+                valid = validation_response.choices[0].message.content.strip() == "VALID"
+            except Exception:
+                valid = False
+            result = ValidationResult(valid, f"local check undecided ({result.reason})", path="llm")
+        with self._stats_lock:
+            self.validation_paths[result.path] += 1
+        return result
+
+    def _validator_messages(self, response: str, expected_format: str = "") -> List[Dict[str, str]]:
+        """Build the messages asking the validator model to judge a response."""
+        return [
             {"role": "system", "content": self.validator_prompt},
             {"role": "user", "content": f"""Please validate this response:
 
@@ -46,122 +161,251 @@ Expected format (if any):
 Is this a valid, helpful response? Reply with exactly VALID or INVALID."""}
         ]
 
-        try:
-            validation_response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=messages
-            )
-            result = validation_response.choices[0].message.content.strip()
-            return result == "VALID"
-        except Exception:
-            return False
-
-    def get_completion_with_validation(self, messages: List[Dict[str, str]], model: str = "gpt-4o", expected_format: str = "") -> Tuple[bool, str]:
-        """Get completion from OpenAI API with validation and retries."""
+    def _stage_cache_key(self, stage: str, model: str, messages: List[Dict[str, str]]) -> str:
+        """Hash the stage name, prompt content, model and input text into a cache key."""
+        prompt = "\n".join(m["content"] for m in messages if m["role"] == "system")
+        input_text = "\n".join(m["content"] for m in messages if m["role"] != "system")
+        payload = json.dumps([stage, prompt, model, input_text])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get_completion_with_validation(self, messages: List[Dict[str, str]], model: str = "gpt-4o", expected_format: str = "",
+                                       stage: str = "completion", cache: bool = False,
+                                       prompt_name: Optional[str] = None) -> Tuple[bool, str]:
+        """Get completion from OpenAI API with validation and retries.
+
+        Timing, token usage, retries and validation details are recorded under
+        the stage name. With cache=True, validated results are cached per stage,
+        prompt, model and input; prompt_name ties the entry to the ai_prompts
+        row whose changes should invalidate it. Concurrent cached calls with
+        the same key share one request, counted as cache hits for the callers
+        that joined it.
+        """
+        with metrics.stage(stage, model) as stage_metrics:
+            return self._run_steps(self._completion_steps(messages, model, expected_format, stage_metrics,
+                                                          stage, cache, prompt_name))
+
+    def _run_steps(self, steps: "Generator[Step, object, T]") -> "T":
+        """Carry out the steps of _completion_steps or _validation_steps on this thread."""
+        result, error = None, None
+        while True:
+            try:
+                step, argument = steps.throw(error) if error else steps.send(result)
+            except StopIteration as done:
+                return done.value
+            result, error = None, None
+            try:
+                if step == "complete":
+                    model, messages = argument
+                    result = get_client().chat.completions.create(model=model, messages=messages, **request_options())
+                elif step == "cached":
+                    result = db.get_cached_stage(argument)
+                elif step == "save":
+                    db.save_cached_stage(*argument)
+                elif step == "sleep":
+                    time.sleep(argument)
+                elif step == "shared":
+                    key, make_steps = argument
+                    result = stage_flights.do(key, lambda: self._run_steps(make_steps()))
+            except Exception as e:
+                error = e
+
+    def _completion_steps(self, messages: List[Dict[str, str]], model: str, expected_format: str,
+                          stage_metrics, stage: str, cache: bool,
+                          prompt_name: Optional[str]) -> "Generator[Step, object, Tuple[bool, str]]":
+        """The cache, single-flight, retry and validation logic of get_completion_with_validation.
+
+        It is shared with the async generator, so it doesn't do any I/O
+        itself: it yields (step, argument) pairs and is sent each step's
+        result, or has its exception thrown in, by _run_steps or
+        AsyncCoverLetterGenerator._arun_steps. The steps are
+        "complete" (model, messages) -> a chat completion, "cached" key ->
+        the cached text or None, "save" (key, stage, model, text,
+        prompt_name), "sleep" seconds, and "shared" (key, make_steps) ->
+        ((success, text), shared) from running make_steps() as the one
+        in-flight call for key.
+        """
+        cache_key = None
+        if cache:
+            cache_key = self._stage_cache_key(stage, model, messages)
+            cached = yield "cached", cache_key
+            if cached is not None:
+                print(f"\nStage cache hit for {stage}")
+                stage_metrics.cache_hit = True
+                stage_metrics.success = True
+                return True, cached
+
+        def attempts():
+            return self._attempt_steps(messages, model, expected_format, stage_metrics, stage, cache_key, prompt_name)
+
+        if cache_key is None:
+            return (yield from attempts())
+        # Identical calls already in flight (say, two users generating for the
+        # same job description) share that request's validated result
+        while True:
+            try:
+                (success, result), shared = yield "shared", (cache_key, attempts)
+            except DeadlineExceeded as e:
+                stage_metrics.error = str(e)
+                return False, str(e)
+            if not shared:
+                return success, result
+            if success:
+                print(f"\nShared in-flight request for {stage}")
+                stage_metrics.cache_hit = True
+                stage_metrics.success = True
+                return True, result
+            # The request we joined failed, perhaps on its own deadline; try again
+
+    def _attempt_steps(self, messages: List[Dict[str, str]], model: str, expected_format: str,
+                       stage_metrics, stage: str, cache_key: Optional[str],
+                       prompt_name: Optional[str]) -> "Generator[Step, object, Tuple[bool, str]]":
+        """Request a completion until one passes validation, retrying API errors per the retry policy."""
         for attempt in range(self.max_retries):
+            stage_metrics.retries = attempt
             try:
                 print(f"\nAttempt {attempt + 1} - Sending request to OpenAI:")
                 print("Model:", model)
                 print("Messages:", json.dumps(messages, indent=2))
-                
-                response = client.chat.completions.create(
-                    model=model,
-                    messages=messages
-                )
+
+                response = yield "complete", (model, messages)
+                stage_metrics.add_usage(response.usage)
                 result = response.choices[0].message.content
-                
+
                 print("\nReceived response from OpenAI:")
                 print("Raw response:", result[:500] + "..." if len(result) > 500 else result)
 
                 # Validate the response
                 print("\nValidating response...")
-                if self.validate_response(result, expected_format):
+                validation_start = time.perf_counter()
+                validation = yield from self._validation_steps(result, expected_format)
+                stage_metrics.validation_ms += (time.perf_counter() - validation_start) * 1000
+                stage_metrics.validation_path = validation.path
+                print(f"Response validation decided by {validation.path}: {validation.reason}")
+                if validation.valid:
                     print("Response validation: VALID")
+                    if cache_key:
+                        yield "save", (cache_key, stage, model, result, prompt_name)
+                    stage_metrics.success = True
                     return True, result
-                
+
+                # The API is fine, so regenerate straight away
                 print("Response validation: INVALID")
                 console.print(f"[yellow]Attempt {attempt + 1}: Invalid response detected. Retrying...[/yellow]")
                 continue
 
+            except DeadlineExceeded as e:
+                stage_metrics.error = str(e)
+                return False, str(e)
             except Exception as e:
+                kind = classify_error(e)
                 print(f"\nError in attempt {attempt + 1}:")
-                print("Error type:", type(e).__name__)
+                print("Error type:", type(e).__name__, f"({kind})")
                 print("Error message:", str(e))
-                
-                if attempt == self.max_retries - 1:
-                    return False, str(e)
-                console.print(f"[yellow]Attempt {attempt + 1}: Error occurred. Retrying...[/yellow]")
-                continue
+                stage_metrics.error = f"{kind}: {e}"
 
-        return False, "Failed to generate a valid response after multiple attempts"
-
-    def process_user_info(self, resume: str, previous_letters: List[str], preferences: Optional[str] = None) -> str:
-        """Stage 1: Process and organize user information."""
-        letters_text = "\n---\n".join(previous_letters)
+                if attempt == self.max_retries - 1 or not self.retry_policy.should_retry(kind):
+                    return False, str(e)
+                try:
+                    delay = self.retry_policy.wait(attempt, kind, e)
+                except DeadlineExceeded as deadline_error:
+                    stage_metrics.error = str(deadline_error)
+                    return False, str(deadline_error)
+                console.print(f"[yellow]Attempt {attempt + 1}: {type(e).__name__} ({kind}). "
+                              f"Retrying in {delay:.1f}s...[/yellow]")
+                yield "sleep", delay
+
+        stage_metrics.error = "Failed to generate a valid response after multiple attempts"
+        return False, stage_metrics.error
+
+    def _user_info_messages(self, resume: str, previous_letters: List[str], preferences: Optional[str] = None,
+                            biography: Optional[str] = None,
+                            job_description: str = "") -> Tuple[List[Dict[str, str]], "BudgetReport"]:
+        """Build the Stage 1 messages for the candidate profile within the stage's token budget.
+
+        The resume and preferences are always sent in full. The previous
+        letters and the biography share what is left of the budget, keeping
+        the paragraphs most relevant to the job description. Input that fits
+        is sent whole whatever the job, so its Stage 1 cache entry is shared
+        by every job; trimmed input is cached per set of kept paragraphs.
+        """
+        from prompt_budget import STAGE_TOKEN_BUDGETS, fit_sections
+        instructions = "Please analyze the following information and provide a candidate profile:"
+        # Section labels count toward the budget along with the instructions
+        labels = "Resume:\nPrevious Cover Letters:\nBiography:\nPreferences:"
+        kept, report = fit_sections(
+            STAGE_TOKEN_BUDGETS["process_user_info"],
+            {"system_prompt": self.info_manager_prompt, "instructions": f"{instructions}\n{labels}",
+             "resume": resume, "preferences": preferences or ""},
+            {"letters": (previous_letters, 0.5), "biography": ([biography] if biography else [], 0.5)},
+            query=job_description,
+            separator="\n---\n"
+        )
+        letters_text = "\n---\n".join(kept["letters"])
+        biography_text = f"\nBiography:\n{kept['biography'][0]}\n" if kept["biography"] else ""
         preferences_text = f"\nPreferences:\n{preferences}" if preferences else ""
         
-        content = f"""Please analyze the following information and provide a candidate profile:
+        content = f"""{instructions}
 
 Resume:
 {resume}
 
 Previous Cover Letters:
 {letters_text}
-{preferences_text}"""
+{biography_text}{preferences_text}"""
 
         messages = [
             {"role": "system", "content": self.info_manager_prompt},
             {"role": "user", "content": content}
         ]
+        return messages, report
+
+    def process_user_info(self, resume: str, previous_letters: List[str], preferences: Optional[str] = None,
+                          biography: Optional[str] = None, job_description: str = "") -> str:
+        """Stage 1: Process and organize user information."""
+        messages, report = self._user_info_messages(resume, previous_letters, preferences, biography, job_description)
+        console.print(f"[dim]Candidate profile prompt: {report.describe()}[/dim]")
 
         success, response = self.get_completion_with_validation(
             messages, 
             model="gpt-4o",
-            expected_format="""# Professional Profile
-[Profile content]
-
-# Key Qualifications
-* [Qualifications]
-
-# Experience Highlights
-* [Highlights]
-
-# Education & Certifications
-* [Education details]"""
+            expected_format=USER_PROFILE_FORMAT,
+            stage="process_user_info",
+            cache=True,
+            prompt_name="info_manager"
         )
         if success:
             return response
         return f"Error processing user information: {response}"
 
-    def analyze_job(self, job_description: str) -> str:
-        """Stage 2: Analyze job description."""
+    def _job_analysis_messages(self, job_description: str) -> List[Dict[str, str]]:
+        """Build the Stage 2 messages for the job analysis."""
         content = f"""Please analyze the following job description:
 
 {job_description}"""
 
-        messages = [
+        return [
             {"role": "system", "content": self.job_analyzer_prompt},
             {"role": "user", "content": content}
         ]
 
+    def analyze_job(self, job_description: str) -> str:
+        """Stage 2: Analyze job description."""
+        messages = self._job_analysis_messages(job_description)
+
         success, response = self.get_completion_with_validation(
             messages, 
             model="gpt-4o",
-            expected_format="""# Core Requirements
-* [Requirements]
-
-# Preferred Qualifications
-* [Qualifications]
-
-# Key Responsibilities
-* [Responsibilities]"""
+            expected_format=JOB_ANALYSIS_FORMAT,
+            stage="analyze_job",
+            cache=True,
+            prompt_name="job_analyzer"
         )
         if success:
             return response
         return f"Error analyzing job: {response}"
 
-    def align_profile_with_job(self, user_profile: str, job_analysis: str) -> str:
-        """Stage 3: Match user profile with job requirements."""
+    def _alignment_messages(self, user_profile: str, job_analysis: str) -> List[Dict[str, str]]:
+        """Build the Stage 3 messages for the profile-job alignment."""
         content = f"""Please analyze how well the candidate matches the job requirements:
 
 Candidate Profile:
@@ -170,29 +414,29 @@ Candidate Profile:
 Job Analysis:
 {job_analysis}"""
         
-        messages = [
+        return [
             {"role": "system", "content": self.alignment_prompt},
             {"role": "user", "content": content}
         ]
 
+    def align_profile_with_job(self, user_profile: str, job_analysis: str) -> str:
+        """Stage 3: Match user profile with job requirements."""
+        messages = self._alignment_messages(user_profile, job_analysis)
+
         success, response = self.get_completion_with_validation(
             messages, 
             model="gpt-4o",
-            expected_format="""# Key Matches
-* [Matches]
-
-# Areas to Address
-* [Areas]
-
-# Recommended Focus Points
-* [Points]"""
+            expected_format=ALIGNMENT_FORMAT,
+            stage="align_profile_with_job",
+            cache=True,
+            prompt_name="alignment"
         )
         if success:
             return response
         return f"Error in alignment: {response}"
 
-    def generate_cover_letter(self, alignment_data: str, sample_letter: str) -> str:
-        """Stage 4: Generate the final cover letter."""
+    def _cover_letter_messages(self, alignment_data: str, sample_letter: str) -> List[Dict[str, str]]:
+        """Build the Stage 4 messages for the cover letter."""
         content = f"""You are a skilled professional writer. Generate a compelling, natural-sounding cover letter (about 300 words) that:
 1. Uses the sample letter as a style guide for tone and format
 2. Focuses on the key points identified in the alignment analysis
@@ -206,21 +450,56 @@ Alignment Analysis:
 Sample Letter for Style:
 {sample_letter}"""
         
-        messages = [
+        return [
             {"role": "user", "content": content}
         ]
 
+    def generate_cover_letter(self, alignment_data: str, sample_letter: str) -> str:
+        """Stage 4: Generate the final cover letter."""
+        messages = self._cover_letter_messages(alignment_data, sample_letter)
+
         success, response = self.get_completion_with_validation(
             messages, 
             model="o1-preview",
-            expected_format="[Professional letter format with clear paragraphs and standard business letter structure]"
+            expected_format=COVER_LETTER_FORMAT,
+            stage="generate_cover_letter"
         )
         if success:
             return response
         return f"Error generating cover letter: {response}"
 
+    def generate_cover_letter_stream(self, alignment_data: str, sample_letter: str) -> Iterator[str]:
+        """Stage 4: Generate the final cover letter, yielding text as the model produces it.
+
+        Tokens cannot be taken back once they have been sent, so the finished
+        letter is not retried; callers can validate the joined text themselves.
+        """
+        messages = self._cover_letter_messages(alignment_data, sample_letter)
+        with metrics.stage("generate_cover_letter", "o1-preview") as stage_metrics:
+            stream = get_client().chat.completions.create(
+                model="o1-preview",
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            for chunk in stream:
+                stage_metrics.add_usage(chunk.usage)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+            stage_metrics.success = True
+
     def process_biography_update(self, new_content: str, current_content: Optional[str], notes: str) -> str:
-        """Process and merge biography updates."""
+        """Process and merge biography updates.
+        
+        When the update only touches some sections of the current biography,
+        only those sections are sent to the model and the result is spliced
+        back in; otherwise the whole biography is rewritten.
+        """
+        from biography_merge import plan_merge
+        plan = plan_merge(current_content, new_content, notes) if current_content else None
+        if plan is not None:
+            return self._merge_biography_sections(plan, new_content, notes)
+        
         content = f"""Please process this biographical information update:
 
 New Content:
@@ -247,12 +526,54 @@ Please create a comprehensive, well-organized biography that:
         success, response = self.get_completion_with_validation(
             messages, 
             model="gpt-4o",
-            expected_format="[Well-formatted markdown biography with clear sections and professional tone]"
+            expected_format="[Well-formatted markdown biography with clear sections and professional tone]",
+            stage="process_biography_update"
         )
         if success:
             return response
         return f"Error processing biography update: {response}"
 
+    def _merge_biography_sections(self, plan: "MergePlan", new_content: str, notes: str) -> str:
+        """Merge an update into just the biography sections it touches."""
+        from biography_merge import apply_merge, join_sections
+        heading_marker = "#" * plan.level
+        touched = plan.touched_sections
+        print(f"Updating biography sections: {', '.join(section.heading for section in touched) or '(new section)'} "
+              f"({len(touched)} of {len(plan.untouched_headings) + len(touched)})")
+        
+        content = f"""Please process this biographical information update. Only the sections of the biography that the update touches are shown; the rest of the biography stays as it is.
+
+New Content:
+{new_content}
+
+Current Sections:
+{join_sections(touched) if touched else 'None of the existing sections cover this information'}
+
+Other Sections (not shown):
+{', '.join(plan.untouched_headings) or 'None'}
+
+Notes:
+{notes}
+
+Please return only the updated sections, in Markdown, that:
+1. Keep each shown section's "{heading_marker} " heading exactly as it is
+2. Merge the new information into the section it belongs to, adding a new "{heading_marker} " section only for information that fits none of the shown or other sections
+3. Maintain a professional and consistent tone
+4. Preserve specific details, achievements, and metrics
+5. Remove any redundant information
+Do not repeat the other sections or add any commentary."""
+
+        expected_format = "\n".join(f"{heading_marker} {section.heading}\n[Updated section content]" for section in touched)
+        success, response = self.get_completion_with_validation(
+            [{"role": "user", "content": content}],
+            model="gpt-4o",
+            expected_format=expected_format or "[One or more markdown biography sections with headings]",
+            stage="merge_biography_sections"
+        )
+        if success:
+            return apply_merge(plan, response)
+        return f"Error processing biography update: {response}"
+
 class CoverLetterEditor:
     def __init__(self):
         self.chat_history = []
@@ -265,13 +586,23 @@ You can suggest improvements to:
 - Content and emphasis
 - Specific phrases or sentences
 Be constructive and explain your suggestions clearly."""
+        from concurrent.futures import ThreadPoolExecutor
+        from response_cache import ResponseCache
+        self.context = None
+        self._summary_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="editor-summary")
+        self._pending_summary = None
+        self.response_cache = ResponseCache()
     
     def start_editing_session(self, cover_letter: str) -> None:
         """Start a new editing session with the given cover letter."""
+        from rich.markdown import Markdown
+        from editor_context import EditorContext
+        
         self.chat_history = [
             {"role": "system", "content": self.system_prompt},
             {"role": "assistant", "content": "I'm here to help you edit your cover letter. What would you like me to help you with?"}
         ]
+        self.context = EditorContext(self.system_prompt, cover_letter)
         
         # Display the cover letter
         console.print("\n[green]Current Cover Letter:[/green]")
@@ -281,7 +612,29 @@ Be constructive and explain your suggestions clearly."""
         self.current_letter = cover_letter
     
     def process_message(self, message: str) -> None:
-        """Process a user message and get AI response."""
+        """Process a user message and get AI response.
+        
+        Only the system prompt, the latest draft, a summary of older turns and
+        the most recent turns are sent, so each turn costs about the same
+        however long the session has run. A request identical to an earlier
+        one (same model, draft and history) is answered from the response
+        cache unless the message starts with \\nocache.
+        """
+        from rate_limiter import INTERACTIVE, request_class
+        # Someone is waiting on an editor turn, so its requests (and the
+        # summary it starts) go ahead of queued generations
+        with request_class(INTERACTIVE):
+            self._handle_message(message)
+    
+    def _handle_message(self, message: str) -> None:
+        use_cache = True
+        if message.startswith("\\nocache"):
+            message = message[len("\\nocache"):].strip()
+            use_cache = False
+            if not message:
+                console.print("[yellow]Add your message after \\nocache[/yellow]")
+                return
+        
         # Check for model switch command
         if message.startswith("\\4o") or message.startswith("\\o1"):
             new_model = "gpt-4o" if message.startswith("\\4o") else "o1-preview"
@@ -292,35 +645,129 @@ Be constructive and explain your suggestions clearly."""
                 return
             self.current_model = new_model
         
-        # Add context about the cover letter if this is the first user message
-        if len(self.chat_history) == 2:  # Only system prompt and initial assistant message
-            message = f"Here's my cover letter:\n\n{self.current_letter}\n\n{message}"
-        
-        # Add user message to history
-        self.chat_history.append({"role": "user", "content": message})
+        self._wait_for_summary()
+        messages = self.context.build_messages(message)
+        cached = self.response_cache.get(self.current_model, messages) if use_cache else None
         
         try:
-            # Get AI response
-            response = client.chat.completions.create(
-                model=self.current_model,
-                messages=self.chat_history
-            )
-            ai_response = response.choices[0].message.content
+            # Stream the AI response onto the screen as it is written
+            console.print("\n[green]AI Editor:[/green]")
+            with metrics.stage("editor_turn", self.current_model) as stage_metrics:
+                if cached is not None:
+                    ai_response = render_stream(iter([cached]))
+                    stage_metrics.cache_hit = True
+                    stage_metrics.success = True
+                    usage = None
+                else:
+                    ai_response, usage = self._stream_response(messages)
+                    stage_metrics.add_usage(usage)
+                    stage_metrics.success = True
+                    if ai_response.strip():
+                        self.response_cache.put(self.current_model, messages, ai_response)
             
-            # Add AI response to history
+            # Add the turn to the transcript and the context window
+            self.chat_history.append({"role": "user", "content": message})
             self.chat_history.append({"role": "assistant", "content": ai_response})
+            if self.context.record_turn(message, ai_response):
+                self.current_letter = self.context.draft
             
-            # Display response
-            console.print("\n[green]AI Editor:[/green]")
-            console.print(Markdown(ai_response))
+            if cached is not None:
+                console.print(f"[dim]Turn {len(self.context.turns)}: cached response, no tokens sent[/dim]")
+            else:
+                self._report_tokens(messages, usage)
         except Exception as e:
             console.print(f"[red]Error: {str(e)}[/red]")
-            # Remove the failed message from history
-            self.chat_history.pop()
+            return
+        
+        # Summarize turns that left the window while the user reads and types
+        turns = self.context.turns_to_fold()
+        if turns:
+            self._pending_summary = self._summary_pool.submit(
+                contextvars.copy_context().run, self._summarize, turns
+            )
+    
+    def _stream_response(self, messages: List[Dict[str, str]]):
+        """Stream a response onto the screen and return its text and token usage."""
+        stream = get_client().chat.completions.create(
+            model=self.current_model,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        usage = None
+
+        def text_chunks():
+            nonlocal usage
+            for chunk in stream:
+                if chunk.usage:
+                    usage = chunk.usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+
+        return render_stream(text_chunks()), usage
+    
+    def _report_tokens(self, messages: List[Dict[str, str]], usage) -> None:
+        """Show how many tokens this turn sent and what they were spent on."""
+        breakdown = self.context.token_breakdown(messages)
+        sent = usage.prompt_tokens if usage else breakdown["total"]
+        received = f", {usage.completion_tokens} received" if usage else ""
+        console.print(
+            f"[dim]Turn {len(self.context.turns)}: {sent} prompt tokens{received} "
+            f"(draft ~{breakdown['draft']}, summary ~{breakdown['summary']}, "
+            f"last {breakdown['turns']} turns verbatim)[/dim]"
+        )
+    
+    def _summarize(self, turns) -> None:
+        """Fold turns into the running summary; on failure they are retried with the next batch."""
+        try:
+            with metrics.stage("summarize_editor_context", "gpt-4o") as stage_metrics:
+                response = get_client().chat.completions.create(
+                    model="gpt-4o",
+                    messages=self.context.summary_messages(turns)
+                )
+                stage_metrics.add_usage(response.usage)
+                stage_metrics.success = True
+            self.context.fold(response.choices[0].message.content.strip(), len(turns))
+        except Exception as e:
+            print(f"Error summarizing editing session: {e}")
+    
+    def _wait_for_summary(self) -> None:
+        if self._pending_summary is not None:
+            self._pending_summary.result()
+            self._pending_summary = None
+
+def render_stream(chunks: Iterator[str], refresh_interval: float = 0.1) -> str:
+    """Show streamed text as live-updating Markdown and return the full text.
+    
+    Re-rendering Markdown on every chunk would redraw the whole text many
+    times a second, so the display is refreshed at most every refresh_interval.
+    """
+    from rich.live import Live
+    from rich.markdown import Markdown
+    
+    parts = []
+    last_render = 0.0
+    with Live(Markdown(""), console=get_console(), auto_refresh=False, vertical_overflow="visible") as live:
+        for text in chunks:
+            parts.append(text)
+            now = time.perf_counter()
+            if now - last_render >= refresh_interval:
+                live.update(Markdown("".join(parts)), refresh=True)
+                last_render = now
+        live.update(Markdown("".join(parts)), refresh=True)
+    return "".join(parts)
 
 def display_documents(doc_type: str):
-    """Display a table of documents of the specified type."""
+    """Display a table of documents of the specified type, or tab-separated rows when output is piped."""
     docs = db.list_documents(doc_type)
+    if not sys.stdout.isatty():
+        # Plain rows are easier to feed to other tools, and skip importing rich
+        columns = ["name", "created_at"] + (["company", "position"] if doc_type == "job_description" else [])
+        for doc in docs:
+            print("\t".join(str(doc[column] or "") for column in columns))
+        return
+    
+    from rich.table import Table
     
     table = Table(title=f"{doc_type.replace('_', ' ').title()}")
     table.add_column("Name")
@@ -337,8 +784,37 @@ def display_documents(doc_type: str):
     
     console.print(table)
 
+def display_search_results(query: str, doc_type: Optional[str] = None):
+    """Display a table of documents matching a full-text search."""
+    from rich.markup import escape
+    from rich.table import Table
+    
+    # Highlight with control characters so document text can be escaped for rich first
+    results = db.search_documents(query, doc_type, highlight=("\x02", "\x03"))
+    if not results:
+        console.print(f"[yellow]No documents match '{escape(query)}'[/yellow]")
+        return
+    
+    table = Table(title=f"Search results for '{escape(query)}'")
+    if not doc_type:
+        table.add_column("Type")
+    table.add_column("Name")
+    table.add_column("Match")
+    
+    for result in results:
+        snippet = escape(" ".join(result["snippet"].split()))
+        snippet = snippet.replace("\x02", "[bold yellow]").replace("\x03", "[/bold yellow]")
+        row = [escape(result["name"]), snippet]
+        if not doc_type:
+            row.insert(0, result["doc_type"].replace("_", " "))
+        table.add_row(*row)
+    
+    console.print(table)
+
 def select_document(doc_type: str) -> Optional[Dict]:
     """Select a document from the available ones."""
+    from rich.prompt import Prompt
+    
     docs = db.list_documents(doc_type)
     if not docs:
         console.print(f"\n[yellow]No {doc_type.replace('_', ' ')}s found![/yellow]")
@@ -359,8 +835,46 @@ def select_document(doc_type: str) -> Optional[Dict]:
     
     return db.get_document(doc_type, selected_name)
 
+def select_documents(doc_type: str) -> List[Dict]:
+    """Select one or more documents from the available ones."""
+    from rich.prompt import Prompt
+    
+    docs = db.list_documents(doc_type)
+    if not docs:
+        console.print(f"\n[yellow]No {doc_type.replace('_', ' ')}s found![/yellow]")
+        return []
+    
+    display_documents(doc_type)
+    
+    # Create numbered choices
+    choices = {str(i+1): doc["name"] for i, doc in enumerate(docs)}
+    
+    # Display numbered options
+    console.print("\nAvailable options:")
+    for num, name in choices.items():
+        console.print(f"{num}: {name}")
+    
+    while True:
+        selection = Prompt.ask("\nSelect options (comma-separated numbers, or 'all')")
+        if selection.strip().lower() == "all":
+            selected = list(choices.keys())
+        else:
+            selected = [part.strip() for part in selection.split(",") if part.strip()]
+        if selected and all(num in choices for num in selected):
+            break
+        console.print("[red]Please enter valid option numbers[/red]")
+    
+    return [db.get_document(doc_type, choices[num]) for num in dict.fromkeys(selected)]
+
 def main_menu():
     """Display and handle the main menu."""
+    from concurrent.futures import ThreadPoolExecutor
+    from rich.markdown import Markdown
+    from rich.prompt import Confirm, Prompt
+    from rich.table import Table
+    from pipeline import build_generation_pipeline, run_batch_generation, PipelineError
+    
+    generator = CoverLetterGenerator()
     while True:
         console.print("\n=== Cover Letter Generator ===")
         console.print("1. Manage Resumes")
@@ -370,11 +884,12 @@ def main_menu():
         console.print("5. Generate Cover Letter")
         console.print("6. Edit Cover Letter")
         console.print("7. Settings")
-        console.print("8. Exit")
+        console.print("8. Batch Generate Cover Letters")
+        console.print("9. Exit")
         
-        choice = Prompt.ask("Select an option", choices=["1", "2", "3", "4", "5", "6", "7", "8"])
+        choice = Prompt.ask("Select an option", choices=["1", "2", "3", "4", "5", "6", "7", "8", "9"])
         
-        if choice == "8":
+        if choice == "9":
             break
             
         if choice in ["1", "2", "3"]:
@@ -388,9 +903,10 @@ def main_menu():
             console.print("1. List documents")
             console.print("2. Import new document")
             console.print("3. Delete document")
-            console.print("4. Back to main menu")
+            console.print("4. Search documents")
+            console.print("5. Back to main menu")
             
-            sub_choice = Prompt.ask("Select an option", choices=["1", "2", "3", "4"])
+            sub_choice = Prompt.ask("Select an option", choices=["1", "2", "3", "4", "5"])
             
             if sub_choice == "1":
                 display_documents(doc_type)
@@ -428,6 +944,9 @@ def main_menu():
                         console.print("[green]Document deleted successfully![/green]")
                     else:
                         console.print("[red]Failed to delete document[/red]")
+            elif sub_choice == "4":
+                query = Prompt.ask("Search for")
+                display_search_results(query, doc_type)
         
         elif choice == "4":
             console.print("\n=== Biography Management ===")
@@ -469,7 +988,6 @@ def main_menu():
                 notes = Prompt.ask("Enter any notes about this update (optional)", default="")
                 
                 # Process and merge the new information
-                generator = CoverLetterGenerator()
                 updated_bio = generator.process_biography_update(new_content, current_content, notes)
                 
                 if updated_bio.startswith("Error"):
@@ -562,6 +1080,7 @@ def main_menu():
             
             console.print("\n[yellow]Enter your messages to edit the cover letter.[/yellow]")
             console.print("[yellow]Use \\4o or \\o1 at the start of a message to switch AI models.[/yellow]")
+            console.print("[yellow]Start a message with \\nocache to get a fresh response instead of a cached one.[/yellow]")
             console.print("[yellow]Type 'exit' to end the editing session.[/yellow]\n")
             
             while True:
@@ -574,12 +1093,8 @@ def main_menu():
             if Confirm.ask("Would you like to save the edited cover letter?"):
                 name = Prompt.ask("Enter a name for this cover letter")
                 
-                # Get the final version from chat history
-                final_content = ""
-                for msg in reversed(editor.chat_history):
-                    if "cover letter" in msg["content"].lower():
-                        final_content = msg["content"]
-                        break
+                # The editor keeps track of the latest full draft
+                final_content = editor.current_letter
                 
                 if final_content:
                     if db.save_document("cover_letter", name, final_content):
@@ -692,28 +1207,7 @@ def main_menu():
                 
                 elif prompt_choice == "4":
                     if Confirm.ask("This will reset all prompts to their default values. Continue?"):
-                        # Initialize default prompts
-                        default_prompts = {
-                            "info_manager": {
-                                "content": CoverLetterGenerator().info_manager_prompt,
-                                "description": "Analyzes resumes and biographical information"
-                            },
-                            "job_analyzer": {
-                                "content": CoverLetterGenerator().job_analyzer_prompt,
-                                "description": "Analyzes job descriptions"
-                            },
-                            "alignment": {
-                                "content": CoverLetterGenerator().alignment_prompt,
-                                "description": "Matches candidates with job requirements"
-                            },
-                            "validator": {
-                                "content": CoverLetterGenerator().validator_prompt,
-                                "description": "Validates AI responses"
-                            }
-                        }
-                        
-                        for name, data in default_prompts.items():
-                            db.save_prompt(name, data["content"], data["description"])
+                        initialize_default_prompts()
                         
                         console.print("[green]Prompts reset to default values![/green]")
 
@@ -739,61 +1233,120 @@ def main_menu():
             # Get preferences
             preferences = Prompt.ask("Enter any specific preferences (tone, style, etc.)", default="")
             
-            # Generate cover letter
-            generator = CoverLetterGenerator()
-            
             # Get current biography
             current_bio = db.get_biography()
             if current_bio:
                 console.print("[yellow]Using information from your biography...[/yellow]")
             
-            console.print("\n[yellow]Processing your information...[/yellow]")
-            user_profile = generator.process_user_info(
+            stage_titles = {
+                "user_profile": "Candidate Profile",
+                "job_analysis": "Job Analysis",
+                "alignment": "Profile Alignment"
+            }
+
+            def show_stage(stage: str, output: str):
+                if stage not in stage_titles:
+                    return
+                console.print(f"\n[green]{stage_titles[stage]}:[/green]")
+                console.print(Markdown(output))
+
+            console.print("\n[yellow]Processing your information and analyzing the job description...[/yellow]")
+            # Stop the pipeline after the alignment so the letter can be streamed
+            pipeline = build_generation_pipeline(
+                generator,
                 resume_doc["content"],
                 [sample_letter_doc["content"]],
-                f"{preferences}\n\nBiography:\n{current_bio['content'] if current_bio else ''}"
+                preferences,
+                job_doc["content"],
+                None,
+                biography=current_bio["content"] if current_bio else None
             )
-            if user_profile.startswith("Error"):
-                console.print(f"[red]{user_profile}[/red]")
-                continue
-
-            console.print("\n[green]Candidate Profile:[/green]")
-            console.print(Markdown(user_profile))
-
-            console.print("\n[yellow]Analyzing job description...[/yellow]")
-            job_analysis = generator.analyze_job(job_doc["content"])
-            if job_analysis.startswith("Error"):
-                console.print(f"[red]{job_analysis}[/red]")
-                continue
-
-            console.print("\n[green]Job Analysis:[/green]")
-            console.print(Markdown(job_analysis))
-
-            console.print("\n[yellow]Matching your profile with job requirements...[/yellow]")
-            alignment = generator.align_profile_with_job(user_profile, job_analysis)
-            if alignment.startswith("Error"):
-                console.print(f"[red]{alignment}[/red]")
+            try:
+                with metrics.run():
+                    results = pipeline.run(on_stage_complete=show_stage)
+                    console.print("\n[green]Here's your generated cover letter:[/green]\n")
+                    cover_letter = render_stream(
+                        generator.generate_cover_letter_stream(results["alignment"], sample_letter_doc["content"])
+                    )
+            except PipelineError as e:
+                console.print(f"[red]{e}[/red]")
                 continue
-
-            console.print("\n[green]Profile Alignment:[/green]")
-            console.print(Markdown(alignment))
-
-            console.print("\n[yellow]Generating your cover letter...[/yellow]")
-            cover_letter = generator.generate_cover_letter(alignment, sample_letter_doc["content"])
-            if cover_letter.startswith("Error"):
-                console.print(f"[red]{cover_letter}[/red]")
+            except Exception as e:
+                console.print(f"[red]Error generating cover letter: {e}[/red]")
                 continue
             
-            # Save the generated cover letter
-            name = Prompt.ask("Enter a name for this cover letter")
+            # Validate the finished letter while the user picks a name
+            with ThreadPoolExecutor(max_workers=1) as validation_pool:
+                validation = validation_pool.submit(
+                    contextvars.copy_context().run,
+                    generator.validate_response_detailed, cover_letter, COVER_LETTER_FORMAT
+                )
+                
+                # Save the generated cover letter
+                name = Prompt.ask("Enter a name for this cover letter")
+                result = validation.result()
+            if not result.valid:
+                console.print(f"[yellow]Warning: the letter did not pass validation ({result.reason}). "
+                              f"Please review it before sending.[/yellow]")
             if db.save_document("cover_letter", name, cover_letter):
                 console.print("[green]Cover letter saved successfully![/green]")
             else:
                 console.print("[red]Failed to save cover letter[/red]")
                 continue
+
+        elif choice == "8":
+            # Select resume
+            resume_doc = select_document("resume")
+            if not resume_doc:
+                console.print("[red]Please import a resume first![/red]")
+                continue
+            
+            # Select sample cover letter for style
+            sample_letter_doc = select_document("cover_letter")
+            if not sample_letter_doc:
+                console.print("[red]Please import a sample cover letter first![/red]")
+                continue
+            
+            # Select job descriptions
+            job_docs = select_documents("job_description")
+            if not job_docs:
+                console.print("[red]Please import a job description first![/red]")
+                continue
+            
+            # Get preferences
+            preferences = Prompt.ask("Enter any specific preferences (tone, style, etc.)", default="")
+            max_concurrency = int(Prompt.ask("How many letters to generate at once", choices=["1", "2", "4", "8"], default="4"))
+            
+            current_bio = db.get_biography()
+            if current_bio:
+                console.print("[yellow]Using information from your biography...[/yellow]")
+            
+            console.print(f"\n[yellow]Generating {len(job_docs)} cover letters...[/yellow]")
+            saved = 0
+            with metrics.run("batch_pipeline"):
+                for result in run_batch_generation(
+                    generator,
+                    resume_doc["content"],
+                    [sample_letter_doc["content"]],
+                    preferences,
+                    {doc["name"]: doc["content"] for doc in job_docs},
+                    sample_letter_doc["content"],
+                    max_concurrency=max_concurrency,
+                    biography=current_bio["content"] if current_bio else None
+                ):
+                    job_name = result["job_description_name"]
+                    if "error" in result:
+                        console.print(f"[red]{job_name}: {result['error']}[/red]")
+                        continue
+                
+                    name = f"{job_name} - Cover Letter"
+                    if db.save_document("cover_letter", name, result["cover_letter"]):
+                        saved += 1
+                        console.print(f"[green]{job_name}: saved as '{name}'[/green]")
+                    else:
+                        console.print(f"[red]{job_name}: failed to save cover letter[/red]")
             
-            console.print("\n[green]Here's your generated cover letter:[/green]\n")
-            console.print(Markdown(cover_letter))
+            console.print(f"\n[green]Generated {saved} of {len(job_docs)} cover letters.[/green]")
 
 def initialize_default_prompts():
     """Initialize the default prompts in the database if they don't exist."""
@@ -927,7 +1480,66 @@ Return exactly "VALID" if the response is good, or "INVALID" if the response con
             console.print(f"[red]Failed to save default prompt: {name}[/red]")
 
 if __name__ == "__main__":
-    # Initialize prompts if they don't exist
-    if not db.list_prompts():
-        initialize_default_prompts()
-    main_menu() 
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate and manage cover letters. Run without a command for the interactive menu.")
+    commands = parser.add_subparsers(dest="command")
+    list_parser = commands.add_parser("list", help="list stored documents of one type")
+    list_parser.add_argument("doc_type", choices=list(DOCUMENT_TABLES))
+    import_parser = commands.add_parser(
+        "import", help="import documents of one type from a directory, zip or JSONL file (- for JSONL on stdin)")
+    import_parser.add_argument("doc_type", choices=list(DOCUMENT_TABLES))
+    import_parser.add_argument("path")
+    import_parser.add_argument("--batch-size", type=int, help="documents saved per transaction (default 500)")
+    import_parser.add_argument("--workers", type=int, help="processes extracting PDF text (default: one per CPU)")
+    export_parser = commands.add_parser(
+        "export", help="export documents, biography versions and prompts as JSONL or a zip (- for JSONL on stdout)")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--format", choices=["jsonl", "zip"], help="default: from the file extension")
+    export_parser.add_argument("--types", help="comma-separated subset of resume, cover_letter, job_description, "
+                                               "biography, prompt")
+    backup_parser = commands.add_parser("backup", help="copy the database while it is in use")
+    backup_parser.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command in ("import", None):
+        # Settings can come from .env; list, export and backup only need the database
+        from dotenv import load_dotenv
+        load_dotenv()
+
+    if args.command == "list":
+        display_documents(args.doc_type)
+    elif args.command == "import":
+        from bulk_import import import_documents, iter_jsonl, iter_path
+        try:
+            documents = iter_jsonl(sys.stdin.buffer, "stdin") if args.path == "-" else iter_path(args.path, args.workers)
+        except ValueError as e:
+            console.print(f"[red]{e}[/red]")
+            sys.exit(1)
+        report = import_documents(db, args.doc_type, documents, args.batch_size)
+        for error in report.errors:
+            console.print(f"[yellow]{error['source']}: {error['error']}[/yellow]")
+        console.print(f"[green]{report.describe()}[/green]")
+    elif args.command == "export":
+        from data_export import export_to_file, iter_jsonl_export
+        types = [t.strip() for t in args.types.split(",") if t.strip()] if args.types else None
+        try:
+            if args.path == "-":
+                for chunk in iter_jsonl_export(db, types):
+                    sys.stdout.buffer.write(chunk)
+            else:
+                written = export_to_file(db, args.path, args.format, types)
+                console.print(f"[green]Exported {written / 1024:.0f} KB to {args.path}[/green]")
+        except ValueError as e:
+            console.print(f"[red]{e}[/red]")
+            sys.exit(1)
+    elif args.command == "backup":
+        if db.backup(args.path):
+            console.print(f"[green]Backed up the database to {args.path}[/green]")
+        else:
+            sys.exit(1)
+    else:
+        # Initialize prompts if they don't exist
+        if not db.list_prompts(limit=1):
+            initialize_default_prompts()
+        main_menu() 
\ No newline at end of file
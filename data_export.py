@@ -0,0 +1,130 @@
+import io
+import json
+import os
+import re
+import tempfile
+import zipfile
+from collections import deque
+from typing import Iterator, List, Optional
+
+from database import DocumentDB
+
+# Export types, in export order
+EXPORT_TYPES = list(DocumentDB.EXPORT_TABLES)
+
+# Folders for each type in a zip export
+ZIP_FOLDERS = {
+    "resume": "resumes",
+    "cover_letter": "cover_letters",
+    "job_description": "job_descriptions",
+    "biography": "biography",
+    "prompt": "prompts",
+}
+
+# JSONL exports are sent in chunks of about this many bytes
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+UNSAFE_FILENAME = re.compile(r'[\\/:*?"<>|\x00-\x1f]+')
+
+
+def iter_jsonl_export(db, types: Optional[List[str]] = None, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[bytes]:
+    """Export records as JSON lines, yielded in chunks of about chunk_size bytes.
+
+    Each line is one document, biography version or prompt with a type
+    field; lines of one type can be fed back to the JSONL bulk import.
+    """
+    buffer = []
+    size = 0
+    for record in db.iter_export_records(types):
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        buffer.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+class _ChunkSink(io.RawIOBase):
+    """A write-only, unseekable stream that holds written bytes until they are taken."""
+
+    def __init__(self):
+        self.chunks = deque()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def _zip_path(record: dict, used: set) -> str:
+    """A unique file name for a record in the zip."""
+    folder = ZIP_FOLDERS[record["type"]]
+    if record["type"] == "biography":
+        stem = f"v{record['version']:04d}"
+    else:
+        stem = UNSAFE_FILENAME.sub("-", str(record["name"])).strip(". ") or "untitled"
+    path = f"{folder}/{stem}.txt"
+    counter = 2
+    while path in used:
+        path = f"{folder}/{stem} ({counter}).txt"
+        counter += 1
+    used.add(path)
+    return path
+
+
+def iter_zip_export(db, types: Optional[List[str]] = None) -> Iterator[bytes]:
+    """Export records as a zip archive, yielded as it is written.
+
+    Each record's content is a text file in its type's folder, so a folder
+    can be fed back to the directory bulk import. manifest.jsonl, written
+    last, holds every record's other fields and its file name; it is
+    spooled to a temporary file, so only the record being written is held
+    in memory.
+    """
+    sink = _ChunkSink()
+    used = set()
+    with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as manifest, \
+            zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for record in db.iter_export_records(types):
+            path = _zip_path(record, used)
+            archive.writestr(path, record.get("content") or "")
+            fields = {key: value for key, value in record.items() if key != "content"}
+            manifest.write((json.dumps({**fields, "file": path}, ensure_ascii=False) + "\n").encode("utf-8"))
+            data = sink.take()
+            if data:
+                yield data
+        manifest.seek(0)
+        with archive.open("manifest.jsonl", "w") as entry:
+            for block in iter(lambda: manifest.read(EXPORT_CHUNK_SIZE), b""):
+                entry.write(block)
+                data = sink.take()
+                if data:
+                    yield data
+    yield sink.take()
+
+
+def export_to_file(db, path: str, export_format: Optional[str] = None, types: Optional[List[str]] = None) -> int:
+    """Write an export to path (format from its extension unless given); returns the bytes written."""
+    export_format = export_format or ("zip" if path.lower().endswith(".zip") else "jsonl")
+    chunks = iter_zip_export(db, types) if export_format == "zip" else iter_jsonl_export(db, types)
+    written = 0
+    partial = f"{path}.partial"
+    try:
+        with open(partial, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+                written += len(chunk)
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    return written
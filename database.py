@@ -1,17 +1,242 @@
+import difflib
+import hashlib
+import json
+import queue
+import re
 import sqlite3
-from typing import List, Optional, Dict, Tuple
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Dict, Tuple
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
+
+# Most connections a DocumentDB keeps open, and how long a call waits for one
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '8'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+# Most seconds before a prompt saved by another process is picked up
+PROMPT_VERSION_CHECK_INTERVAL = float(os.getenv('PROMPT_VERSION_CHECK_INTERVAL', '1'))
+
+# Tables holding each document type
+DOCUMENT_TABLES = {
+    "resume": "resumes",
+    "cover_letter": "cover_letters",
+    "job_description": "job_descriptions",
+}
+
+# Columns that list queries may select, per table
+LISTABLE_FIELDS = {
+    "resumes": ["id", "name", "content", "created_at", "updated_at"],
+    "cover_letters": ["id", "name", "content", "created_at", "updated_at"],
+    "job_descriptions": ["id", "name", "content", "company", "position", "created_at", "updated_at"],
+    "biography_versions": ["id", "version", "content", "created_at", "notes"],
+    "ai_prompts": ["id", "name", "content", "description", "created_at", "updated_at"],
+}
+
+def line_delta(base: str, content: str) -> List:
+    """Describe content as line ranges copied from base plus new lines.
+    
+    Each item is either [start, end], a slice of base's lines, or a string
+    of new lines.
+    """
+    base_lines = base.splitlines(keepends=True)
+    content_lines = content.splitlines(keepends=True)
+    delta = []
+    matcher = difflib.SequenceMatcher(None, base_lines, content_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            delta.append([i1, i2])
+        elif j2 > j1:
+            delta.append("".join(content_lines[j1:j2]))
+    return delta
+
+
+def apply_line_delta(base: str, delta: List) -> str:
+    """Rebuild content from base and a delta made by line_delta."""
+    base_lines = base.splitlines(keepends=True)
+    parts = []
+    for item in delta:
+        if isinstance(item, str):
+            parts.append(item)
+        else:
+            parts.append("".join(base_lines[item[0]:item[1]]))
+    return "".join(parts)
 
 class DocumentDB:
-    def __init__(self, db_path: str = "documents.db"):
+    # Applied once to every pooled connection. WAL lets readers run alongside a
+    # writer, and NORMAL sync is safe in WAL mode while avoiding an fsync per
+    # commit.
+    PRAGMAS = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -16000,  # 16 MB page cache
+        "mmap_size": 268435456,  # 256 MB
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    }
+
+    # Biography versions are stored as diffs against the previous version, with
+    # a full copy at least this often so rebuilding one applies few diffs
+    BIOGRAPHY_SNAPSHOT_INTERVAL = 10
+
+    JOB_COLUMNS = ["id", "kind", "status", "params", "stages", "result", "error", "error_stage", "attempts",
+                   "created_at", "started_at", "finished_at", "owner", "heartbeat_at"]
+
+    def __init__(self, db_path: str = "documents.db", stage_cache_ttl: int = 7 * 24 * 3600,
+                 stage_cache_max_entries: int = 500, pool_size: Optional[int] = None):
         """Initialize database connection and create tables if they don't exist."""
         self.db_path = db_path
+        self.stage_cache_ttl = stage_cache_ttl
+        self.stage_cache_max_entries = stage_cache_max_entries
+        self.pool_size = max(1, pool_size or DB_POOL_SIZE)
+        # Idle connections, most recently used last so a few stay warm
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._opened = 0
+        self._pool_lock = threading.Lock()
+        # The connection this thread has checked out, so nested calls share it
+        self._local = threading.local()
+        # The last prompt_version read from the database, and when (time.monotonic())
+        self._prompt_version = 0
+        self._prompt_version_read_at: Optional[float] = None
+        self._prompt_version_lock = threading.Lock()
         self._create_tables()
 
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, cached_statements=256, check_same_thread=False)
+        for pragma, value in self.PRAGMAS.items():
+            conn.execute(f"PRAGMA {pragma} = {value}")
+        return conn
+
+    def _checkout(self) -> sqlite3.Connection:
+        """Take an idle connection, open one if the pool isn't full, or wait for one to be returned."""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._pool_lock:
+            opening = self._opened < self.pool_size
+            if opening:
+                self._opened += 1
+        if opening:
+            try:
+                return self._open()
+            except Exception:
+                with self._pool_lock:
+                    self._opened -= 1
+                raise
+        try:
+            return self._idle.get(timeout=DB_POOL_TIMEOUT)
+        except queue.Empty:
+            raise sqlite3.OperationalError(
+                f"Timed out after {DB_POOL_TIMEOUT:.0f}s waiting for one of {self.pool_size} database connections"
+            ) from None
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Check out a pooled connection for the block, committing on success and rolling back on error.
+
+        Connections are opened and tuned once and handed from call to call,
+        whichever thread makes it, so the file open, schema parse and
+        prepared statements are reused even by short-lived threads (the
+        threaded dev server's request threads, pipeline workers). At most
+        pool_size are open; further callers wait for one to be returned.
+        Calls made inside the block on the same thread share its connection.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            with conn:
+                yield conn
+            return
+        conn = self._checkout()
+        self._local.conn = conn
+        try:
+            with conn:
+                yield conn
+        finally:
+            self._local.conn = None
+            self._idle.put(conn)
+
+    @property
+    def prompt_version(self) -> int:
+        """A counter bumped whenever any process saves or deletes a prompt, so PromptRegistry knows to reload.
+
+        It lives in the database, so edits from the CLI reach a running
+        server. The value is re-read at most every
+        PROMPT_VERSION_CHECK_INTERVAL seconds, which keeps checking it before
+        each prompt read cheap; changes made through this instance are seen
+        at once.
+        """
+        now = time.monotonic()
+        with self._prompt_version_lock:
+            read_at = self._prompt_version_read_at
+            if read_at is not None and now - read_at < PROMPT_VERSION_CHECK_INTERVAL:
+                return self._prompt_version
+        try:
+            with self._connect() as conn:
+                row = conn.execute("SELECT value FROM app_state WHERE name = 'prompt_version'").fetchone()
+        except Exception as e:
+            print(f"Error reading prompt version: {e}")
+            return self._prompt_version
+        with self._prompt_version_lock:
+            self._prompt_version = row[0] if row else 0
+            self._prompt_version_read_at = now
+            return self._prompt_version
+
+    @staticmethod
+    def _bump_prompt_version(cursor):
+        """Bump the stored prompt_version in the caller's transaction."""
+        cursor.execute('''
+            INSERT INTO app_state (name, value) VALUES ('prompt_version', 1)
+            ON CONFLICT (name) DO UPDATE SET value = value + 1
+        ''')
+
+    def _prompts_changed(self):
+        """Re-read prompt_version on its next use, once a bump has been committed."""
+        with self._prompt_version_lock:
+            self._prompt_version_read_at = None
+
+    def close(self):
+        """Close the idle pooled connections; the next call opens new ones."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._pool_lock:
+                self._opened -= 1
+
+    def _list_rows(self, table: str, fields: List[str], order_column: str, descending: bool = False,
+                   limit: Optional[int] = None, after=None, error_label: str = "rows") -> List[Dict]:
+        """Select the given columns from a table using keyset pagination on order_column."""
+        invalid = [field for field in fields if field not in LISTABLE_FIELDS[table]]
+        if invalid:
+            raise ValueError(f"Unknown fields for {table}: {', '.join(invalid)}")
+        
+        # The order column is always returned so callers can build the next cursor
+        columns = list(dict.fromkeys([order_column] + fields))
+        query = f"SELECT {', '.join(columns)} FROM {table}"
+        params = []
+        if after is not None:
+            query += f" WHERE {order_column} {'<' if descending else '>'} ?"
+            params.append(after)
+        query += f" ORDER BY {order_column} {'DESC' if descending else 'ASC'}"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute(query, params)
+                return [dict(zip(columns, row)) for row in cursor.fetchall()]
+        except Exception as e:
+            print(f"Error listing {error_label}: {e}")
+            return []
+
     def _create_tables(self):
         """Create necessary tables if they don't exist."""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             
             # Create resumes table
@@ -56,9 +281,21 @@ class DocumentDB:
                     version INTEGER NOT NULL,
                     content TEXT NOT NULL,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    notes TEXT
+                    notes TEXT,
+                    storage TEXT NOT NULL DEFAULT 'full',
+                    base_version INTEGER,
+                    content_hash TEXT
                 )
             ''')
+            cursor.execute('PRAGMA table_info(biography_versions)')
+            if 'storage' not in [column[1] for column in cursor.fetchall()]:
+                # Databases from before diff storage hold a full copy per version
+                cursor.execute("ALTER TABLE biography_versions ADD COLUMN storage TEXT NOT NULL DEFAULT 'full'")
+                cursor.execute('ALTER TABLE biography_versions ADD COLUMN base_version INTEGER')
+                cursor.execute('ALTER TABLE biography_versions ADD COLUMN content_hash TEXT')
+                self._compact_biography_versions(cursor)
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_biography_versions_version ON biography_versions (version)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_biography_versions_hash ON biography_versions (content_hash)')
             
             # Create AI prompts table
             cursor.execute('''
@@ -72,12 +309,136 @@ class DocumentDB:
                 )
             ''')
             
+            # Create pipeline stage cache table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS stage_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    stage TEXT NOT NULL,
+                    prompt_name TEXT,
+                    model TEXT NOT NULL,
+                    output TEXT NOT NULL,
+                    hits INTEGER DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    last_accessed TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_stage_cache_prompt ON stage_cache (prompt_name)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_stage_cache_accessed ON stage_cache (last_accessed)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_stage_cache_stage ON stage_cache (stage, last_accessed)')
+            
+            # Create per-stage generation metrics table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS generation_runs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    run_id TEXT,
+                    stage TEXT NOT NULL,
+                    model TEXT,
+                    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    wall_ms REAL NOT NULL,
+                    validation_ms REAL DEFAULT 0,
+                    prompt_tokens INTEGER DEFAULT 0,
+                    completion_tokens INTEGER DEFAULT 0,
+                    retries INTEGER DEFAULT 0,
+                    cache_hit INTEGER DEFAULT 0,
+                    validation_path TEXT,
+                    success INTEGER DEFAULT 0,
+                    error TEXT
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_generation_runs_started ON generation_runs (started_at)')
+            
+            # Create background generation jobs table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    params TEXT NOT NULL,
+                    stages TEXT NOT NULL DEFAULT '[]',
+                    result TEXT,
+                    error TEXT,
+                    error_stage TEXT,
+                    attempts INTEGER DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    started_at TIMESTAMP,
+                    finished_at TIMESTAMP,
+                    owner TEXT,
+                    heartbeat_at TIMESTAMP
+                )
+            ''')
+            cursor.execute('PRAGMA table_info(jobs)')
+            if 'owner' not in [column[1] for column in cursor.fetchall()]:
+                # Jobs from before heartbeats have no owner, so a running one counts as abandoned
+                cursor.execute('ALTER TABLE jobs ADD COLUMN owner TEXT')
+                cursor.execute('ALTER TABLE jobs ADD COLUMN heartbeat_at TIMESTAMP')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)')
+            
+            # Counters shared by every process using the database (prompt_version)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS app_state (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                )
+            ''')
+            
+            self.fts_enabled = self._create_search_index(cursor)
+            
             conn.commit()
 
+    def _create_search_index(self, cursor) -> bool:
+        """Create the full-text index over all documents and the triggers that keep it in sync.
+        
+        Each document gets FTS rowid id * 3 + its type's position in
+        DOCUMENT_TABLES, so triggers can update it without scanning. Returns
+        False if this SQLite build has no FTS5, in which case search falls back
+        to LIKE queries.
+        """
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'documents_fts'")
+        exists = cursor.fetchone() is not None
+        if not exists:
+            try:
+                cursor.execute('''
+                    CREATE VIRTUAL TABLE documents_fts USING fts5(
+                        doc_type UNINDEXED,
+                        name,
+                        content,
+                        tokenize = 'porter unicode61'
+                    )
+                ''')
+            except sqlite3.OperationalError:
+                return False
+        
+        for offset, (doc_type, table) in enumerate(DOCUMENT_TABLES.items()):
+            rowid = f"{{row}}.id * {len(DOCUMENT_TABLES)} + {offset}"
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN
+                    INSERT INTO documents_fts (rowid, doc_type, name, content)
+                    VALUES ({rowid.format(row="new")}, '{doc_type}', new.name, new.content);
+                END
+            ''')
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE OF name, content ON {table} BEGIN
+                    UPDATE documents_fts SET name = new.name, content = new.content
+                    WHERE rowid = {rowid.format(row="old")};
+                END
+            ''')
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN
+                    DELETE FROM documents_fts WHERE rowid = {rowid.format(row="old")};
+                END
+            ''')
+            if not exists:
+                # Index documents saved before the index existed
+                cursor.execute(f'''
+                    INSERT INTO documents_fts (rowid, doc_type, name, content)
+                    SELECT {rowid.format(row=table)}, '{doc_type}', name, content FROM {table}
+                ''')
+        return True
+
     def save_document(self, doc_type: str, name: str, content: str, metadata: Optional[Dict] = None) -> bool:
         """Save a document to the database."""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
                 
@@ -136,10 +497,43 @@ class DocumentDB:
             print(f"Error saving document: {e}")
             return False
 
+    def save_documents(self, doc_type: str, documents: List[Tuple[str, str, Optional[Dict]]]) -> int:
+        """Save many (name, content, metadata) documents of one type in a single transaction.
+
+        Existing documents with the same name are updated, keeping their
+        created_at. Returns how many were saved: all of them, or 0 if the
+        transaction failed.
+        """
+        table = DOCUMENT_TABLES.get(doc_type)
+        if table is None:
+            print(f"Error saving documents: unknown document type '{doc_type}'")
+            return 0
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        try:
+            with self._connect() as conn:
+                if doc_type == "job_description":
+                    conn.executemany('''
+                        INSERT INTO job_descriptions (name, content, company, position, created_at, updated_at)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        ON CONFLICT(name) DO UPDATE SET content = excluded.content, company = excluded.company,
+                            position = excluded.position, updated_at = excluded.updated_at
+                    ''', [(name, content, (metadata or {}).get('company', ''), (metadata or {}).get('position', ''),
+                           now, now) for name, content, metadata in documents])
+                else:
+                    conn.executemany(f'''
+                        INSERT INTO {table} (name, content, created_at, updated_at)
+                        VALUES (?, ?, ?, ?)
+                        ON CONFLICT(name) DO UPDATE SET content = excluded.content, updated_at = excluded.updated_at
+                    ''', [(name, content, now, now) for name, content, _ in documents])
+                return len(documents)
+        except Exception as e:
+            print(f"Error saving documents: {e}")
+            return 0
+
     def get_document(self, doc_type: str, name: str) -> Optional[Dict]:
         """Retrieve a document by name and type."""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 
                 if doc_type == "resume":
@@ -174,32 +568,25 @@ class DocumentDB:
             print(f"Error retrieving document: {e}")
             return None
 
-    def list_documents(self, doc_type: str) -> List[Dict]:
-        """List all documents of a specific type."""
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                if doc_type == "resume":
-                    cursor.execute('SELECT name, created_at FROM resumes ORDER BY name')
-                elif doc_type == "cover_letter":
-                    cursor.execute('SELECT name, created_at FROM cover_letters ORDER BY name')
-                elif doc_type == "job_description":
-                    cursor.execute('SELECT name, company, position, created_at FROM job_descriptions ORDER BY name')
-                
-                results = cursor.fetchall()
-                if doc_type == "job_description":
-                    return [{"name": r[0], "company": r[1], "position": r[2], "created_at": r[3]} for r in results]
-                else:
-                    return [{"name": r[0], "created_at": r[1]} for r in results]
-        except Exception as e:
-            print(f"Error listing documents: {e}")
+    def list_documents(self, doc_type: str, limit: Optional[int] = None, after: Optional[str] = None,
+                       fields: Optional[List[str]] = None) -> List[Dict]:
+        """List documents of a specific type by name, without their content.
+        
+        Pass limit and the last name of the previous page as after to page
+        through the list.
+        """
+        table = DOCUMENT_TABLES.get(doc_type)
+        if table is None:
             return []
+        default_fields = (["name", "company", "position", "created_at"] if doc_type == "job_description"
+                          else ["name", "created_at"])
+        return self._list_rows(table, fields or default_fields, "name", limit=limit, after=after,
+                               error_label="documents")
 
     def delete_document(self, doc_type: str, name: str) -> bool:
         """Delete a document by name and type."""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 
                 if doc_type == "resume":
@@ -215,22 +602,98 @@ class DocumentDB:
             print(f"Error deleting document: {e}")
             return False
 
+    def search_documents(self, query: str, doc_type: Optional[str] = None, limit: int = 20,
+                         highlight: Tuple[str, str] = ("<mark>", "</mark>")) -> List[Dict]:
+        """Search document names and content, best matches first.
+        
+        Every word in the query must match (the last one as a prefix). Each
+        result has the document type, name, a snippet with matches wrapped in
+        the highlight markers, and a rank (lower is better).
+        """
+        words = re.findall(r"\w+", query)
+        if not words or (doc_type is not None and doc_type not in DOCUMENT_TABLES):
+            return []
+        
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                if self.fts_enabled:
+                    match = " ".join(f'"{word}"' for word in words) + "*"
+                    sql = '''
+                        SELECT doc_type, name,
+                               snippet(documents_fts, 2, ?, ?, '...', 16),
+                               bm25(documents_fts, 0.0, 10.0, 1.0) AS rank
+                        FROM documents_fts
+                        WHERE documents_fts MATCH ?
+                    '''
+                    params = [highlight[0], highlight[1], match]
+                    if doc_type:
+                        sql += ' AND doc_type = ?'
+                        params.append(doc_type)
+                    cursor.execute(sql + ' ORDER BY rank LIMIT ?', params + [limit])
+                    rows = cursor.fetchall()
+                else:
+                    rows = self._search_documents_like(cursor, words, doc_type, limit)
+                return [{"doc_type": r[0], "name": r[1], "snippet": r[2], "rank": r[3]} for r in rows]
+        except Exception as e:
+            print(f"Error searching documents: {e}")
+            return []
+
+    def _search_documents_like(self, cursor, words: List[str], doc_type: Optional[str], limit: int) -> List[Tuple]:
+        """Unranked substring search for SQLite builds without FTS5."""
+        rows = []
+        tables = {doc_type: DOCUMENT_TABLES[doc_type]} if doc_type else DOCUMENT_TABLES
+        for type_name, table in tables.items():
+            conditions = " AND ".join("(name LIKE ? OR content LIKE ?)" for _ in words)
+            params = [f"%{word}%" for word in words for _ in range(2)]
+            cursor.execute(f'''
+                SELECT ?, name, substr(content, 1, 200), 0 FROM {table}
+                WHERE {conditions} ORDER BY name LIMIT ?
+            ''', [type_name] + params + [limit])
+            rows.extend(cursor.fetchall())
+        return rows[:limit]
+
     def save_biography(self, content: str, notes: Optional[str] = None) -> bool:
-        """Save a new version of the biography."""
+        """Save a new version of the biography.
+        
+        Versions are stored as a line diff against the previous version, with
+        a full snapshot at least every BIOGRAPHY_SNAPSHOT_INTERVAL versions so
+        any version is rebuilt from a bounded number of diffs. Content that
+        matches an earlier version exactly (e.g. a revert) is stored as a
+        reference to it.
+        """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 
                 # Get the latest version number
                 cursor.execute('SELECT MAX(version) FROM biography_versions')
                 result = cursor.fetchone()
-                next_version = (result[0] or 0) + 1
+                previous_version = result[0]
+                next_version = (previous_version or 0) + 1
+                
+                content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+                cursor.execute('''
+                    SELECT version FROM biography_versions
+                    WHERE content_hash = ? AND storage != 'ref'
+                    ORDER BY version LIMIT 1
+                ''', (content_hash,))
+                duplicate = cursor.fetchone()
+                
+                if duplicate:
+                    storage, base_version, stored = "ref", duplicate[0], ""
+                elif previous_version is None:
+                    storage, base_version, stored = "full", None, content
+                else:
+                    previous_content, depth = self._biography_content(cursor, previous_version)
+                    storage, base_version, stored = self._encode_biography(content, previous_version,
+                                                                           previous_content, depth)
                 
                 # Insert new version
                 cursor.execute('''
-                    INSERT INTO biography_versions (version, content, notes)
-                    VALUES (?, ?, ?)
-                ''', (next_version, content, notes))
+                    INSERT INTO biography_versions (version, content, notes, storage, base_version, content_hash)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (next_version, stored, notes, storage, base_version, content_hash))
                 
                 conn.commit()
                 return True
@@ -238,56 +701,120 @@ class DocumentDB:
             print(f"Error saving biography: {e}")
             return False
 
+    def _encode_biography(self, content: str, base_version: int, base_content: str,
+                          base_depth: int) -> Tuple[str, Optional[int], str]:
+        """Choose how to store a version: a diff against the base, or a full snapshot.
+        
+        Returns (storage, base_version, stored content).
+        """
+        if base_depth + 1 < self.BIOGRAPHY_SNAPSHOT_INTERVAL:
+            delta = json.dumps(line_delta(base_content, content), separators=(",", ":"))
+            # A diff that is not much smaller than the text isn't worth the rebuild cost
+            if len(delta) < len(content) // 2:
+                return "delta", base_version, delta
+        return "full", None, content
+
+    def _biography_content(self, cursor, version: int) -> Tuple[Optional[str], int]:
+        """Rebuild a version's content; also returns how many diffs were applied."""
+        deltas = []
+        while True:
+            cursor.execute('SELECT storage, base_version, content FROM biography_versions WHERE version = ?',
+                           (version,))
+            row = cursor.fetchone()
+            if row is None:
+                return None, 0
+            storage, base_version, stored = row
+            if storage == "full":
+                break
+            if storage == "delta":
+                deltas.append(stored)
+            version = base_version
+        
+        content = stored
+        for delta in reversed(deltas):
+            content = apply_line_delta(content, json.loads(delta))
+        return content, len(deltas)
+
+    def _compact_biography_versions(self, cursor):
+        """Convert full-copy biography versions to snapshots, diffs and references."""
+        cursor.execute('SELECT version, content FROM biography_versions ORDER BY version')
+        rows = cursor.fetchall()
+        originals = {}
+        depths = {}
+        previous = None
+        for version, content in rows:
+            content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+            if content_hash in originals:
+                target = originals[content_hash]
+                storage, base_version, stored = "ref", target, ""
+                depths[version] = depths[target]
+            else:
+                originals[content_hash] = version
+                if previous is None:
+                    storage, base_version, stored = "full", None, content
+                else:
+                    storage, base_version, stored = self._encode_biography(content, previous[0], previous[1],
+                                                                           depths[previous[0]])
+                depths[version] = depths[previous[0]] + 1 if storage == "delta" else 0
+            cursor.execute('''
+                UPDATE biography_versions SET storage = ?, base_version = ?, content = ?, content_hash = ?
+                WHERE version = ?
+            ''', (storage, base_version, stored, content_hash, version))
+            previous = (version, content)
+        if rows:
+            print(f"Compacted {len(rows)} biography versions")
+
     def get_biography(self, version: Optional[int] = None) -> Optional[Dict]:
         """Get a specific version of the biography or the latest version if no version specified."""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 
                 if version is None:
-                    cursor.execute('SELECT * FROM biography_versions ORDER BY version DESC LIMIT 1')
+                    cursor.execute('''
+                        SELECT id, version, created_at, notes FROM biography_versions
+                        ORDER BY version DESC LIMIT 1
+                    ''')
                 else:
-                    cursor.execute('SELECT * FROM biography_versions WHERE version = ?', (version,))
+                    cursor.execute('SELECT id, version, created_at, notes FROM biography_versions WHERE version = ?',
+                                   (version,))
                 
                 result = cursor.fetchone()
                 if result:
                     return {
                         "id": result[0],
                         "version": result[1],
-                        "content": result[2],
-                        "created_at": result[3],
-                        "notes": result[4]
+                        "content": self._biography_content(cursor, result[1])[0],
+                        "created_at": result[2],
+                        "notes": result[3]
                     }
                 return None
         except Exception as e:
             print(f"Error retrieving biography: {e}")
             return None
 
-    def list_biography_versions(self) -> List[Dict]:
-        """List all biography versions."""
-        try:
-            with sqlite3.connect(self.db_path) as conn:
+    def list_biography_versions(self, limit: Optional[int] = None, after: Optional[int] = None,
+                                fields: Optional[List[str]] = None) -> List[Dict]:
+        """List biography versions, newest first, without their content.
+        
+        Pass limit and the last version number of the previous page as after
+        to page through the history. Use get_biography for a version's content.
+        """
+        rows = self._list_rows("biography_versions", fields or ["id", "version", "created_at", "notes"],
+                               "version", descending=True, limit=limit, after=after,
+                               error_label="biography versions")
+        if rows and "content" in rows[0]:
+            # Stored content may be a diff, so rebuild it
+            with self._connect() as conn:
                 cursor = conn.cursor()
-                cursor.execute('SELECT * FROM biography_versions ORDER BY version DESC')
-                
-                versions = []
-                for row in cursor.fetchall():
-                    versions.append({
-                        "id": row[0],
-                        "version": row[1],
-                        "content": row[2],
-                        "created_at": row[3],
-                        "notes": row[4]
-                    })
-                return versions
-        except Exception as e:
-            print(f"Error listing biography versions: {e}")
-            return []
+                for row in rows:
+                    row["content"] = self._biography_content(cursor, row["version"])[0]
+        return rows
 
     def delete_biography(self) -> bool:
         """Delete all biography versions."""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute('DELETE FROM biography_versions')
                 conn.commit()
@@ -299,7 +826,7 @@ class DocumentDB:
     def save_prompt(self, name: str, content: str, description: str = None) -> bool:
         """Save or update an AI prompt."""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
                 
@@ -316,7 +843,12 @@ class DocumentDB:
                         VALUES (?, ?, ?, ?, ?)
                     ''', (name, content, description, now, now))
                 
+                # Cached stage outputs produced with the old prompt are stale now
+                cursor.execute('DELETE FROM stage_cache WHERE prompt_name = ?', (name,))
+                self._bump_prompt_version(cursor)
+                
                 conn.commit()
+                self._prompts_changed()
                 return True
         except Exception as e:
             print(f"Error saving prompt: {e}")
@@ -325,7 +857,7 @@ class DocumentDB:
     def get_prompt(self, name: str) -> Optional[Dict]:
         """Get an AI prompt by name."""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute('SELECT * FROM ai_prompts WHERE name = ?', (name,))
                 result = cursor.fetchone()
@@ -343,35 +875,30 @@ class DocumentDB:
             print(f"Error retrieving prompt: {e}")
             return None
 
-    def list_prompts(self) -> List[Dict]:
-        """List all AI prompts."""
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT * FROM ai_prompts ORDER BY name')
-                prompts = []
-                for row in cursor.fetchall():
-                    prompts.append({
-                        "id": row[0],
-                        "name": row[1],
-                        "content": row[2],
-                        "description": row[3],
-                        "created_at": row[4],
-                        "updated_at": row[5]
-                    })
-                return prompts
-        except Exception as e:
-            print(f"Error listing prompts: {e}")
-            return []
+    def list_prompts(self, limit: Optional[int] = None, after: Optional[str] = None,
+                     fields: Optional[List[str]] = None) -> List[Dict]:
+        """List AI prompts by name, without their content unless asked for in fields.
+        
+        Pass limit and the last name of the previous page as after to page
+        through the list.
+        """
+        return self._list_rows("ai_prompts", fields or ["id", "name", "description", "created_at", "updated_at"],
+                               "name", limit=limit, after=after, error_label="prompts")
 
     def delete_prompt(self, name: str) -> bool:
         """Delete an AI prompt."""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute('DELETE FROM ai_prompts WHERE name = ?', (name,))
+                deleted = cursor.rowcount
+                cursor.execute('DELETE FROM stage_cache WHERE prompt_name = ?', (name,))
+                if deleted:
+                    self._bump_prompt_version(cursor)
                 conn.commit()
-                return cursor.rowcount > 0
+                if deleted:
+                    self._prompts_changed()
+                return deleted > 0
         except Exception as e:
             print(f"Error deleting prompt: {e}")
             return False
@@ -398,7 +925,7 @@ class DocumentDB:
         }
         
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
                 
@@ -415,9 +942,370 @@ class DocumentDB:
                             INSERT INTO ai_prompts (name, content, description, created_at, updated_at)
                             VALUES (?, ?, ?, ?, ?)
                         ''', (name, data["content"], data["description"], now, now))
+                    cursor.execute('DELETE FROM stage_cache WHERE prompt_name = ?', (name,))
+                self._bump_prompt_version(cursor)
                 
                 conn.commit()
+                self._prompts_changed()
                 return True
         except Exception as e:
             print(f"Error initializing default prompts: {e}")
-            return False 
\ No newline at end of file
+            return False
+
+    def get_cached_stage(self, cache_key: str) -> Optional[str]:
+        """Get a cached pipeline stage output, or None if it is missing or expired."""
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                now = datetime.now()
+                cutoff = (now - timedelta(seconds=self.stage_cache_ttl)).strftime('%Y-%m-%d %H:%M:%S')
+                
+                cursor.execute('SELECT output, created_at FROM stage_cache WHERE cache_key = ?', (cache_key,))
+                result = cursor.fetchone()
+                if not result:
+                    return None
+                
+                if result[1] < cutoff:
+                    cursor.execute('DELETE FROM stage_cache WHERE cache_key = ?', (cache_key,))
+                    conn.commit()
+                    return None
+                
+                cursor.execute('''
+                    UPDATE stage_cache
+                    SET hits = hits + 1, last_accessed = ?
+                    WHERE cache_key = ?
+                ''', (now.strftime('%Y-%m-%d %H:%M:%S'), cache_key))
+                conn.commit()
+                return result[0]
+        except Exception as e:
+            print(f"Error reading stage cache: {e}")
+            return None
+
+    def save_cached_stage(self, cache_key: str, stage: str, model: str, output: str,
+                          prompt_name: Optional[str] = None, max_entries: Optional[int] = None) -> bool:
+        """Cache a pipeline stage output, evicting expired and least recently used entries.
+
+        Each stage keeps at most max_entries entries (stage_cache_max_entries
+        by default), so a busy stage only evicts its own entries.
+        """
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                now = datetime.now()
+                now_text = now.strftime('%Y-%m-%d %H:%M:%S')
+                cutoff = (now - timedelta(seconds=self.stage_cache_ttl)).strftime('%Y-%m-%d %H:%M:%S')
+                
+                cursor.execute('''
+                    INSERT OR REPLACE INTO stage_cache
+                    (cache_key, stage, prompt_name, model, output, hits, created_at, last_accessed)
+                    VALUES (?, ?, ?, ?, ?, 0, ?, ?)
+                ''', (cache_key, stage, prompt_name, model, output, now_text, now_text))
+                
+                # Evict expired entries, then the stage's least recently used ones beyond its size limit
+                cursor.execute('DELETE FROM stage_cache WHERE created_at < ?', (cutoff,))
+                cursor.execute('''
+                    DELETE FROM stage_cache WHERE cache_key IN (
+                        SELECT cache_key FROM stage_cache
+                        WHERE stage = ?
+                        ORDER BY last_accessed DESC
+                        LIMIT -1 OFFSET ?
+                    )
+                ''', (stage, max_entries or self.stage_cache_max_entries))
+                
+                conn.commit()
+                return True
+        except Exception as e:
+            print(f"Error saving to stage cache: {e}")
+            return False
+
+    def clear_stage_cache(self, prompt_name: Optional[str] = None) -> bool:
+        """Clear cached stage outputs, either all of them or those produced with one prompt."""
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                if prompt_name is None:
+                    cursor.execute('DELETE FROM stage_cache')
+                else:
+                    cursor.execute('DELETE FROM stage_cache WHERE prompt_name = ?', (prompt_name,))
+                conn.commit()
+                return True
+        except Exception as e:
+            print(f"Error clearing stage cache: {e}")
+            return False
+
+    def save_generation_run(self, record: Dict) -> bool:
+        """Save the metrics of one generation stage."""
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT INTO generation_runs
+                    (run_id, stage, model, started_at, wall_ms, validation_ms, prompt_tokens,
+                     completion_tokens, retries, cache_hit, validation_path, success, error)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (record.get("run_id"), record["stage"], record.get("model"), record.get("started_at"),
+                      record["wall_ms"], record.get("validation_ms", 0), record.get("prompt_tokens", 0),
+                      record.get("completion_tokens", 0), record.get("retries", 0), int(record.get("cache_hit", False)),
+                      record.get("validation_path"), int(record.get("success", False)), record.get("error")))
+                conn.commit()
+                return True
+        except Exception as e:
+            print(f"Error saving generation metrics: {e}")
+            return False
+
+    def list_generation_runs(self, since: Optional[str] = None, limit: int = 10000) -> List[Dict]:
+        """List recorded stage metrics, newest first, optionally only those started after since."""
+        columns = ["run_id", "stage", "model", "started_at", "wall_ms", "validation_ms", "prompt_tokens",
+                   "completion_tokens", "retries", "cache_hit", "validation_path", "success", "error"]
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                query = f"SELECT {', '.join(columns)} FROM generation_runs"
+                params = []
+                if since:
+                    query += " WHERE started_at >= ?"
+                    params.append(since)
+                cursor.execute(query + " ORDER BY id DESC LIMIT ?", params + [limit])
+                return [dict(zip(columns, row)) for row in cursor.fetchall()]
+        except Exception as e:
+            print(f"Error listing generation metrics: {e}")
+            return []
+
+    def _job_from_row(self, row: Tuple) -> Dict:
+        job = dict(zip(self.JOB_COLUMNS, row))
+        for field in ("params", "stages", "result"):
+            if job[field] is not None:
+                job[field] = json.loads(job[field])
+        return job
+
+    def create_job(self, job_id: str, kind: str, params: Dict) -> bool:
+        """Queue a background job."""
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    'INSERT INTO jobs (id, kind, params, created_at) VALUES (?, ?, ?, ?)',
+                    (job_id, kind, json.dumps(params), datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+                )
+                conn.commit()
+                return True
+        except Exception as e:
+            print(f"Error creating job: {e}")
+            return False
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        """Get a job with its parameters, progress and result."""
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f"SELECT {', '.join(self.JOB_COLUMNS)} FROM jobs WHERE id = ?", (job_id,))
+                row = cursor.fetchone()
+                return self._job_from_row(row) if row else None
+        except Exception as e:
+            print(f"Error retrieving job: {e}")
+            return None
+
+    def list_jobs(self, statuses: Optional[List[str]] = None, limit: int = 50) -> List[Dict]:
+        """List jobs, newest first, optionally only those in the given statuses."""
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                query = f"SELECT {', '.join(self.JOB_COLUMNS)} FROM jobs"
+                params = []
+                if statuses:
+                    query += f" WHERE status IN ({', '.join('?' for _ in statuses)})"
+                    params.extend(statuses)
+                cursor.execute(query + " ORDER BY created_at DESC, rowid DESC LIMIT ?", params + [limit])
+                return [self._job_from_row(row) for row in cursor.fetchall()]
+        except Exception as e:
+            print(f"Error listing jobs: {e}")
+            return []
+
+    def claim_job(self, job_id: str, owner: Optional[str] = None) -> bool:
+        """Move a queued job to running for owner. Returns False if it was cancelled or already claimed."""
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                cursor.execute('''
+                    UPDATE jobs
+                    SET status = 'running', attempts = attempts + 1, started_at = ?, owner = ?, heartbeat_at = ?
+                    WHERE id = ? AND status = 'queued'
+                ''', (now, owner, now, job_id))
+                conn.commit()
+                return cursor.rowcount == 1
+        except Exception as e:
+            print(f"Error claiming job: {e}")
+            return False
+
+    def update_job_stages(self, job_id: str, stages: List[str]) -> bool:
+        """Record the stages a running job has completed."""
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute('UPDATE jobs SET stages = ? WHERE id = ?', (json.dumps(stages), job_id))
+                conn.commit()
+                return True
+        except Exception as e:
+            print(f"Error updating job progress: {e}")
+            return False
+
+    def finish_job(self, job_id: str, status: str, result: Optional[Dict] = None, error: Optional[str] = None,
+                   error_stage: Optional[str] = None) -> bool:
+        """Mark a job succeeded, failed or cancelled. Jobs that already finished are left as they are."""
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    UPDATE jobs
+                    SET status = ?, result = ?, error = ?, error_stage = ?, finished_at = ?
+                    WHERE id = ? AND status IN ('queued', 'running')
+                ''', (status, json.dumps(result) if result is not None else None, error, error_stage,
+                      datetime.now().strftime('%Y-%m-%d %H:%M:%S'), job_id))
+                conn.commit()
+                return cursor.rowcount == 1
+        except Exception as e:
+            print(f"Error finishing job: {e}")
+            return False
+
+    def heartbeat_jobs(self, owner: str, job_ids: List[str]) -> bool:
+        """Record that owner is still running these jobs."""
+        if not job_ids:
+            return True
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f'''
+                    UPDATE jobs SET heartbeat_at = ?
+                    WHERE owner = ? AND status = 'running' AND id IN ({', '.join('?' for _ in job_ids)})
+                ''', [datetime.now().strftime('%Y-%m-%d %H:%M:%S'), owner] + list(job_ids))
+                conn.commit()
+                return True
+        except Exception as e:
+            print(f"Error recording job heartbeat: {e}")
+            return False
+
+    def requeue_interrupted_jobs(self, stale_after: float, max_attempts: int) -> List[str]:
+        """Recover running jobs whose owner stopped sending heartbeats and return every queued job ID.
+
+        A job counts as abandoned once its heartbeat is more than stale_after
+        seconds old, so jobs other live processes are running are left
+        alone. Abandoned jobs go back in the queue, or are marked failed once
+        they have been started max_attempts times, so a job that keeps
+        killing its process isn't retried forever.
+        """
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                now = datetime.now()
+                cutoff = (now - timedelta(seconds=stale_after)).strftime('%Y-%m-%d %H:%M:%S')
+                abandoned = "status = 'running' AND (heartbeat_at IS NULL OR heartbeat_at < ?)"
+                cursor.execute(f'''
+                    UPDATE jobs
+                    SET status = 'failed', error = ?, finished_at = ?
+                    WHERE {abandoned} AND attempts >= ?
+                ''', (f"Interrupted on each of its {max_attempts} attempts; not retrying",
+                      now.strftime('%Y-%m-%d %H:%M:%S'), cutoff, max_attempts))
+                cursor.execute(f"UPDATE jobs SET status = 'queued', owner = NULL WHERE {abandoned}", (cutoff,))
+                cursor.execute("SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at, rowid")
+                job_ids = [row[0] for row in cursor.fetchall()]
+                conn.commit()
+                return job_ids
+        except Exception as e:
+            print(f"Error requeueing jobs: {e}")
+            return []
+
+
+    EXPORT_TABLES = {
+        "resume": ("resumes", LISTABLE_FIELDS["resumes"][1:], "name"),
+        "cover_letter": ("cover_letters", LISTABLE_FIELDS["cover_letters"][1:], "name"),
+        "job_description": ("job_descriptions", LISTABLE_FIELDS["job_descriptions"][1:], "name"),
+        "biography": ("biography_versions", ["version", "content", "created_at", "notes"], "version"),
+        "prompt": ("ai_prompts", LISTABLE_FIELDS["ai_prompts"][1:], "name"),
+    }
+
+    def iter_export_records(self, types: Optional[List[str]] = None, batch_size: int = 500) -> Iterator[Dict]:
+        """Yield every document, biography version and prompt as a dict with its type.
+
+        Rows are read batch_size at a time on a separate connection inside one
+        read transaction, so the export is a consistent snapshot and, with
+        WAL, writers are not blocked while it is consumed. Biography versions
+        are rebuilt to their full content. Errors are raised, so a failed
+        export is not mistaken for a complete one.
+        """
+        types = types or list(self.EXPORT_TABLES)
+        unknown = [doc_type for doc_type in types if doc_type not in self.EXPORT_TABLES]
+        if unknown:
+            raise ValueError(f"Unknown export types: {', '.join(unknown)}")
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute("PRAGMA busy_timeout = 5000")
+            conn.execute("BEGIN")
+            for doc_type in types:
+                table, columns, order_column = self.EXPORT_TABLES[doc_type]
+                rows = conn.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY {order_column}")
+                lookup = conn.cursor()
+                while True:
+                    batch = rows.fetchmany(batch_size)
+                    if not batch:
+                        break
+                    for row in batch:
+                        record = {"type": doc_type, **dict(zip(columns, row))}
+                        if doc_type == "biography":
+                            # Stored content may be a diff, so rebuild it
+                            record["content"] = self._biography_content(lookup, record["version"])[0]
+                        yield record
+        finally:
+            conn.close()
+
+    def backup(self, path: str, pages: int = -1) -> bool:
+        """Copy the database to path with SQLite's online backup API.
+
+        With WAL the copy reads one snapshot while writers carry on. It is
+        written next to path and renamed into place, so path is never a
+        partial copy. pages > 0 copies in steps, releasing the database in
+        between, but restarts whenever another connection writes.
+        """
+        partial = f"{path}.partial"
+        try:
+            source = sqlite3.connect(self.db_path)
+            target = sqlite3.connect(partial)
+            try:
+                source.execute("PRAGMA busy_timeout = 5000")
+                source.backup(target, pages=pages)
+            finally:
+                target.close()
+                source.close()
+            os.replace(partial, path)
+            return True
+        except Exception as e:
+            print(f"Error backing up database: {e}")
+            if os.path.exists(partial):
+                os.remove(partial)
+            return False
+
+
+_shared_db: Optional[DocumentDB] = None
+_shared_db_lock = threading.Lock()
+
+
+def get_db() -> DocumentDB:
+    """Get the process-wide database, opening it (and creating its tables) on first use."""
+    global _shared_db
+    if _shared_db is None:
+        with _shared_db_lock:
+            if _shared_db is None:
+                _shared_db = DocumentDB()
+    return _shared_db
+
+
+class _SharedDocumentDB:
+    """Stands in for the shared DocumentDB so modules can import it without opening the database."""
+
+    def __getattr__(self, name):
+        return getattr(get_db(), name)
+
+
+# Import this rather than constructing a DocumentDB, so the CLI, the web app
+# and the job queue share one instance and the schema is only checked once
+shared_db = _SharedDocumentDB()
@@ -0,0 +1,134 @@
+import os
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from tokens import count_message_tokens, count_tokens
+from validation import LETTER_MIN_WORDS
+
+SALUTATION_PATTERN = re.compile(r"^\s*(Dear|To whom it may concern|Hello|Hi)\b.*$", re.IGNORECASE | re.MULTILINE)
+SIGN_OFF_PATTERN = re.compile(
+    r"^\s*(Sincerely|Best regards|Kind regards|Warm regards|Regards|Best|Respectfully|Thank you|Thanks)\b.*$",
+    re.IGNORECASE | re.MULTILINE
+)
+
+DRAFT_PLACEHOLDER = "[Revised cover letter - see the current draft above]"
+EARLIER_DRAFT_PLACEHOLDER = "[Revised cover letter - since superseded by a later draft]"
+
+
+def extract_letter(text: str) -> Optional[str]:
+    """Pull a complete cover letter (salutation through signature) out of an editor response."""
+    start = SALUTATION_PATTERN.search(text)
+    if not start:
+        return None
+    sign_offs = list(SIGN_OFF_PATTERN.finditer(text, start.end()))
+    if not sign_offs:
+        return None
+    # The signature is the sign-off plus the name on the line or two after it
+    tail = text[sign_offs[-1].end():].split("\n\n", 1)[0]
+    letter = text[start.start():sign_offs[-1].end()] + tail
+    if len(letter.split()) < LETTER_MIN_WORDS // 2:
+        return None
+    return letter.strip()
+
+
+@dataclass
+class Turn:
+    user: str
+    assistant: str
+    letter: Optional[str] = None  # the draft contained in the response, if any
+
+
+class EditorContext:
+    """The messages sent to the model on each turn of an editing session.
+
+    Every request carries the system prompt, the latest draft of the letter,
+    a running summary of older turns and every turn not yet in the summary
+    verbatim, so the prompt stays about the same size however long the
+    session runs. Once fold_batch turns are older than the last keep_turns
+    they are folded into the summary in one go; until then they stay in the
+    verbatim window, which so holds between keep_turns and
+    keep_turns + fold_batch - 1 turns and never drops a turn the summary
+    doesn't cover.
+    """
+
+    def __init__(self, system_prompt: str, letter: str, keep_turns: Optional[int] = None,
+                 fold_batch: Optional[int] = None):
+        self.system_prompt = system_prompt
+        self.draft = letter
+        self.keep_turns = keep_turns or int(os.getenv('EDITOR_KEEP_TURNS', '6'))
+        self.fold_batch = fold_batch or int(os.getenv('EDITOR_FOLD_BATCH', '4'))
+        self.summary = ""
+        self.turns: List[Turn] = []
+        self.folded = 0  # turns already covered by the summary
+
+    def _verbatim(self, turn: Turn) -> str:
+        """The response with any draft it contains replaced by a short placeholder.
+
+        The current draft is already in its own message, and superseded
+        drafts only cost tokens.
+        """
+        if not turn.letter:
+            return turn.assistant
+        placeholder = DRAFT_PLACEHOLDER if turn.letter == self.draft else EARLIER_DRAFT_PLACEHOLDER
+        return turn.assistant.replace(turn.letter, placeholder)
+
+    def window(self) -> List[Turn]:
+        """The turns sent verbatim: all those the summary doesn't cover yet."""
+        return self.turns[self.folded:]
+
+    def build_messages(self, message: str) -> List[Dict[str, str]]:
+        """Assemble the request for a new user message."""
+        messages = [{"role": "system", "content": self.system_prompt}]
+        if self.summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{self.summary}"})
+        messages.append({"role": "system", "content": f"Current draft of the cover letter:\n\n{self.draft}"})
+        for turn in self.window():
+            messages.append({"role": "user", "content": turn.user})
+            messages.append({"role": "assistant", "content": self._verbatim(turn)})
+        messages.append({"role": "user", "content": message})
+        return messages
+
+    def record_turn(self, message: str, response: str) -> bool:
+        """Add a finished turn; returns True if the response contained a new draft of the letter."""
+        letter = extract_letter(response)
+        self.turns.append(Turn(message, response, letter))
+        if letter and letter != self.draft:
+            self.draft = letter
+            return True
+        return False
+
+    def turns_to_fold(self) -> List[Turn]:
+        """Turns outside the verbatim window not yet summarized, once there are enough to fold."""
+        older = self.turns[self.folded:max(self.folded, len(self.turns) - self.keep_turns)]
+        return older if len(older) >= self.fold_batch else []
+
+    def fold(self, summary: str, count: int):
+        """Replace the summary after the next count turns have been summarized into it."""
+        self.summary = summary
+        self.folded += count
+
+    def summary_messages(self, turns: List[Turn]) -> List[Dict[str, str]]:
+        """The request that folds turns into the running summary."""
+        transcript = "\n\n".join(
+            f"User: {turn.user}\n\nEditor: {self._verbatim(turn)}" for turn in turns
+        )
+        return [{"role": "user", "content": f"""Update the running summary of a cover letter editing conversation.
+
+Current Summary:
+{self.summary or 'None yet'}
+
+New Turns:
+{transcript}
+
+Write a concise summary (under 200 words) that keeps the user's stated preferences, the changes they asked for or rejected, and any open requests. Do not include the text of the letter itself."""}]
+
+    def token_breakdown(self, messages: List[Dict[str, str]]) -> Dict[str, int]:
+        """Estimated tokens per part of a request."""
+        window = self.window()
+        return {
+            "total": count_message_tokens(messages),
+            "summary": count_tokens(self.summary),
+            "draft": count_tokens(self.draft),
+            "turns": len(window),
+        }
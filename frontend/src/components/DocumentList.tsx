@@ -1,4 +1,4 @@
-import React, { useState, ChangeEvent } from 'react';
+import React, { useEffect, useState, ChangeEvent } from 'react';
 import {
   List,
   ListItem,
@@ -13,25 +13,25 @@ import {
   DialogContent,
   DialogActions,
   TextField,
+  InputAdornment,
 } from '@mui/material';
 import {
   Delete as DeleteIcon,
   Edit as EditIcon,
   Add as AddIcon,
+  Search as SearchIcon,
 } from '@mui/icons-material';
-import { documentsApi } from '../services/api';
+import { documentsApi, searchApi, DocumentSummary, SearchResult } from '../services/api';
 
-interface Document {
-  name: string;
-  created_at: string;
-  content?: string;
-  company?: string;
-  position?: string;
-}
+const SEARCH_DEBOUNCE_MS = 300;
+
+// Search snippets wrap matches in <mark>; render those as elements rather than as HTML
+const renderSnippet = (snippet: string) =>
+  snippet.split(/<mark>(.*?)<\/mark>/g).map((part, i) => (i % 2 ? <mark key={i}>{part}</mark> : part));
 
 interface DocumentListProps {
   title: string;
-  documents: Document[];
+  documents: DocumentSummary[];
   documentType: 'cover_letter' | 'resume' | 'job_description';
   onAdd: (name: string, content: string) => void;
   onDelete: (name: string) => void;
@@ -50,9 +50,32 @@ const DocumentList = ({
 }: DocumentListProps) => {
   const [openDialog, setOpenDialog] = useState(false);
   const [dialogMode, setDialogMode] = useState<'add' | 'edit'>('add');
-  const [selectedDoc, setSelectedDoc] = useState<Document | null>(null);
   const [name, setName] = useState('');
   const [content, setContent] = useState('');
+  const [query, setQuery] = useState('');
+  const [results, setResults] = useState<SearchResult[] | null>(null);
+
+  // Search the full text on the server once typing pauses; rerun when the list changes
+  useEffect(() => {
+    const q = query.trim();
+    if (!q) {
+      setResults(null);
+      return;
+    }
+    let active = true;
+    const timer = setTimeout(async () => {
+      try {
+        const response = await searchApi.search(q, documentType);
+        if (active) setResults(response.data);
+      } catch (error) {
+        console.error('Error searching documents:', error);
+      }
+    }, SEARCH_DEBOUNCE_MS);
+    return () => {
+      active = false;
+      clearTimeout(timer);
+    };
+  }, [query, documentType, documents]);
 
   const handleAdd = () => {
     setDialogMode('add');
@@ -61,12 +84,11 @@ const DocumentList = ({
     setOpenDialog(true);
   };
 
-  const handleEdit = async (doc: Document) => {
+  const handleEdit = async (docName: string) => {
     setDialogMode('edit');
-    setSelectedDoc(doc);
-    setName(doc.name);
+    setName(docName);
     try {
-      const response = await documentsApi.get(documentType, doc.name);
+      const response = await documentsApi.get(documentType, docName);
       setContent(response.data.content);
     } catch (error) {
       console.error('Error fetching document content:', error);
@@ -79,7 +101,7 @@ const DocumentList = ({
     if (dialogMode === 'add') {
       onAdd(name, content);
     } else if (dialogMode === 'edit' && onEdit) {
-      onEdit(selectedDoc?.name || '', content);
+      onEdit(name, content);
     }
     setOpenDialog(false);
   };
@@ -99,29 +121,48 @@ const DocumentList = ({
         >
           Add New
         </Button>
+        <TextField
+          fullWidth
+          size="small"
+          placeholder={`Search ${title.toLowerCase()}`}
+          value={query}
+          onChange={(e: ChangeEvent<HTMLInputElement>) => setQuery(e.target.value)}
+          InputProps={{
+            startAdornment: (
+              <InputAdornment position="start">
+                <SearchIcon />
+              </InputAdornment>
+            ),
+          }}
+          sx={{ mb: 1 }}
+        />
         <List>
-          {documents.map((doc) => (
-            <ListItem key={doc.name} divider>
-              <ListItemText
-                primary={doc.name}
-                secondary={
-                  showCompanyInfo && doc.company
-                    ? `${doc.company} - ${doc.position}`
-                    : doc.created_at
-                }
-              />
+          {(results
+            ? results.map((result) => ({ name: result.name, secondary: renderSnippet(result.snippet) }))
+            : documents.map((doc) => ({
+                name: doc.name,
+                secondary: showCompanyInfo && doc.company ? `${doc.company} - ${doc.position}` : doc.created_at,
+              }))
+          ).map((item) => (
+            <ListItem key={item.name} divider>
+              <ListItemText primary={item.name} secondary={item.secondary} />
               <ListItemSecondaryAction>
                 {onEdit && (
-                  <IconButton edge="end" onClick={() => handleEdit(doc)} sx={{ mr: 1 }}>
+                  <IconButton edge="end" onClick={() => handleEdit(item.name)} sx={{ mr: 1 }}>
                     <EditIcon />
                   </IconButton>
                 )}
-                <IconButton edge="end" onClick={() => onDelete(doc.name)}>
+                <IconButton edge="end" onClick={() => onDelete(item.name)}>
                   <DeleteIcon />
                 </IconButton>
               </ListItemSecondaryAction>
             </ListItem>
           ))}
+          {results && results.length === 0 && (
+            <ListItem>
+              <ListItemText secondary="No matching documents" />
+            </ListItem>
+          )}
         </List>
       </Paper>
 
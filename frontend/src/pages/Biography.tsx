@@ -20,13 +20,13 @@ import {
   History as HistoryIcon,
   Restore as RestoreIcon,
 } from '@mui/icons-material';
-import { biographyApi, Biography } from '../services/api';
+import { biographyApi, Biography, BiographyVersion } from '../services/api';
 
 const BiographyPage: React.FC = () => {
   const [currentBio, setCurrentBio] = useState<Biography | null>(null);
   const [content, setContent] = useState('');
   const [notes, setNotes] = useState('');
-  const [versions, setVersions] = useState<Biography[]>([]);
+  const [versions, setVersions] = useState<BiographyVersion[]>([]);
   const [showHistory, setShowHistory] = useState(false);
 
   useEffect(() => {
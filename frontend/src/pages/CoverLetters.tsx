@@ -1,10 +1,10 @@
 import React, { useEffect, useState } from 'react';
 import { Container } from '@mui/material';
 import DocumentList from '../components/DocumentList';
-import { documentsApi, Document } from '../services/api';
+import { documentsApi, DocumentSummary } from '../services/api';
 
 const CoverLetters: React.FC = () => {
-  const [coverLetters, setCoverLetters] = useState<Document[]>([]);
+  const [coverLetters, setCoverLetters] = useState<DocumentSummary[]>([]);
 
   useEffect(() => {
     loadCoverLetters();
@@ -16,27 +16,90 @@ import {
   CircularProgress,
   Alert,
 } from '@mui/material';
-import { documentsApi, generatorApi, Document } from '../services/api';
+import { documentsApi, jobsApi, DocumentSummary, GenerationJob } from '../services/api';
 
 const steps = ['Select Documents', 'Add Preferences', 'Generate Letter'];
 
+// The running job is remembered so a reload picks up where it left off
+const JOB_STORAGE_KEY = 'generationJobId';
+
+const stageLabels: Record<string, string> = {
+  user_profile: 'Candidate Profile',
+  job_analysis: 'Job Analysis',
+  alignment: 'Profile Alignment',
+  cover_letter: 'Cover Letter',
+};
+
 const Generator: React.FC = () => {
   const [activeStep, setActiveStep] = useState(0);
-  const [resumes, setResumes] = useState<Document[]>([]);
-  const [coverLetters, setCoverLetters] = useState<Document[]>([]);
-  const [jobDescriptions, setJobDescriptions] = useState<Document[]>([]);
+  const [resumes, setResumes] = useState<DocumentSummary[]>([]);
+  const [coverLetters, setCoverLetters] = useState<DocumentSummary[]>([]);
+  const [jobDescriptions, setJobDescriptions] = useState<DocumentSummary[]>([]);
   const [selectedResume, setSelectedResume] = useState('');
   const [selectedSampleLetter, setSelectedSampleLetter] = useState('');
   const [selectedJobDescription, setSelectedJobDescription] = useState('');
   const [preferences, setPreferences] = useState('');
   const [generatedLetter, setGeneratedLetter] = useState('');
+  const [completedStages, setCompletedStages] = useState<string[]>([]);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState('');
+  const [jobId, setJobId] = useState<string | null>(() => localStorage.getItem(JOB_STORAGE_KEY));
 
   useEffect(() => {
     loadDocuments();
   }, []);
 
+  useEffect(() => {
+    if (!jobId) return;
+    setLoading(true);
+    setActiveStep(steps.length - 1);
+
+    // Stages and letter text arrive as the job runs; a reconnect replays what was missed
+    const stop = jobsApi.follow(jobId, {
+      onStage: (stage) =>
+        setCompletedStages((prev) => (prev.includes(stage) ? prev : [...prev, stage])),
+      onToken: (text) => setGeneratedLetter((prev) => prev + text),
+      onReset: () => setGeneratedLetter(''),
+      onDone: finishJob,
+      // The events request itself failed; find out from the job what became of it
+      onError: async () => {
+        try {
+          const { data: job } = await jobsApi.get(jobId);
+          if (job.status !== 'queued' && job.status !== 'running') {
+            finishJob(job);
+            return;
+          }
+        } catch (error: any) {
+          console.error('Error following generation job:', error);
+          if (error.response?.status === 404) {
+            finishJob(null);
+            return;
+          }
+        }
+        setError('Lost the connection to the generation job; reload the page to follow it again');
+        setLoading(false);
+      },
+    });
+    return stop;
+  }, [jobId]);
+
+  const finishJob = (job: GenerationJob | null) => {
+    localStorage.removeItem(JOB_STORAGE_KEY);
+    setJobId(null);
+    setLoading(false);
+    if (!job) {
+      setError('The generation job could not be found');
+    } else if (job.status === 'succeeded' && job.result) {
+      console.log('Generation Response:', job.result);
+      setGeneratedLetter(job.result.cover_letter);
+    } else if (job.status === 'failed') {
+      console.error('Generation error:', { message: job.error, stage: job.error_stage });
+      setError(job.error || 'Failed to generate cover letter');
+    } else if (job.status === 'cancelled') {
+      setError('Generation was cancelled');
+    }
+  };
+
   const loadDocuments = async () => {
     try {
       const [resumesRes, lettersRes, jobsRes] = await Promise.all([
@@ -68,48 +131,40 @@ const Generator: React.FC = () => {
   const handleGenerate = async () => {
     setLoading(true);
     setError('');
+    setGeneratedLetter('');
+    setCompletedStages([]);
     try {
-      console.log('Generation Request:', {
+      const request = {
         resume_name: selectedResume,
         job_description_name: selectedJobDescription,
         sample_letter_name: selectedSampleLetter,
         preferences,
-      });
+      };
+      console.log('Generation Request:', request);
 
-      const response = await generatorApi.generate({
-        resume_name: selectedResume,
-        job_description_name: selectedJobDescription,
-        sample_letter_name: selectedSampleLetter,
-        preferences,
-      });
-
-      console.log('Generation Response:', response.data);
-      
-      if (!response.data.cover_letter) {
-        throw new Error('No cover letter in response');
-      }
-
-      setGeneratedLetter(response.data.cover_letter);
-      console.log('Generated Letter Length:', response.data.cover_letter.length);
-      
-      // Log the analysis data too
-      if (response.data.user_profile) console.log('User Profile:', response.data.user_profile);
-      if (response.data.job_analysis) console.log('Job Analysis:', response.data.job_analysis);
-      if (response.data.alignment) console.log('Profile-Job Alignment:', response.data.alignment);
-
-      // Don't increment step since we're already on the last step
+      const response = await jobsApi.submit(request);
+      localStorage.setItem(JOB_STORAGE_KEY, response.data.job_id);
+      setJobId(response.data.job_id);
     } catch (error: any) {
       console.error('Detailed generation error:', {
         error,
-        message: error.message,
         response: error.response?.data,
+        status: error.response?.status,
       });
-      setError(error.response?.data?.error || error.message || 'Failed to generate cover letter');
-    } finally {
+      setError(error.response?.data?.error || 'Failed to generate cover letter');
       setLoading(false);
     }
   };
 
+  const handleCancel = async () => {
+    if (!jobId) return;
+    try {
+      await jobsApi.cancel(jobId);
+    } catch (error) {
+      console.error('Error cancelling generation job:', error);
+    }
+  };
+
   const handleSave = async () => {
     if (!generatedLetter) return;
 
@@ -193,12 +248,33 @@ const Generator: React.FC = () => {
           />
         );
       case 2:
-        return loading ? (
-          <Box sx={{ display: 'flex', justifyContent: 'center', p: 3 }}>
+        return loading && !generatedLetter ? (
+          <Box sx={{ display: 'flex', flexDirection: 'column', alignItems: 'center', gap: 2, p: 3 }}>
             <CircularProgress />
+            <Typography variant="body2" color="text.secondary">
+              {completedStages.length
+                ? `Completed: ${completedStages.map((stage) => stageLabels[stage] || stage).join(', ')}`
+                : 'Analyzing your profile and the job description...'}
+            </Typography>
+            <Typography variant="caption" color="text.secondary">
+              You can leave this page; generation continues in the background.
+            </Typography>
+            <Button variant="outlined" color="secondary" onClick={handleCancel} disabled={!jobId}>
+              Cancel
+            </Button>
           </Box>
         ) : (
           <Box>
+            {loading && (
+              <Box sx={{ display: 'flex', alignItems: 'center', justifyContent: 'space-between', mb: 1 }}>
+                <Typography variant="body2" color="text.secondary">
+                  Writing your cover letter...
+                </Typography>
+                <Button size="small" color="secondary" onClick={handleCancel} disabled={!jobId}>
+                  Cancel
+                </Button>
+              </Box>
+            )}
             <TextField
               fullWidth
               multiline
@@ -206,11 +282,13 @@ const Generator: React.FC = () => {
               value={generatedLetter}
               onChange={(e) => setGeneratedLetter(e.target.value)}
               variant="outlined"
+              InputProps={{ readOnly: loading }}
             />
             <Button
               variant="contained"
               color="primary"
               onClick={handleSave}
+              disabled={loading || !generatedLetter}
               sx={{ mt: 2 }}
             >
               Save Cover Letter
@@ -247,7 +325,7 @@ const Generator: React.FC = () => {
 
         <Box sx={{ display: 'flex', justifyContent: 'flex-end', mt: 3 }}>
           <Button
-            disabled={activeStep === 0}
+            disabled={activeStep === 0 || loading}
             onClick={handleBack}
             sx={{ mr: 1 }}
           >
@@ -257,10 +335,11 @@ const Generator: React.FC = () => {
             variant="contained"
             onClick={activeStep === steps.length - 1 ? handleGenerate : handleNext}
             disabled={
-              activeStep === 0 &&
-              (!selectedResume ||
-                !selectedSampleLetter ||
-                !selectedJobDescription)
+              loading ||
+              (activeStep === 0 &&
+                (!selectedResume ||
+                  !selectedSampleLetter ||
+                  !selectedJobDescription))
             }
           >
             {activeStep === steps.length - 1 ? 'Generate' : 'Next'}
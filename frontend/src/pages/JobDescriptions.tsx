@@ -1,10 +1,10 @@
 import React, { useEffect, useState } from 'react';
 import { Container } from '@mui/material';
 import DocumentList from '../components/DocumentList';
-import { documentsApi, Document } from '../services/api';
+import { documentsApi, DocumentSummary } from '../services/api';
 
 const JobDescriptions: React.FC = () => {
-  const [jobDescriptions, setJobDescriptions] = useState<Document[]>([]);
+  const [jobDescriptions, setJobDescriptions] = useState<DocumentSummary[]>([]);
 
   useEffect(() => {
     loadJobDescriptions();
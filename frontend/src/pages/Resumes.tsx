@@ -1,10 +1,10 @@
 import React, { useEffect, useState } from 'react';
 import { Container } from '@mui/material';
 import DocumentList from '../components/DocumentList';
-import { documentsApi, Document } from '../services/api';
+import { documentsApi, DocumentSummary } from '../services/api';
 
 const Resumes: React.FC = () => {
-  const [resumes, setResumes] = useState<Document[]>([]);
+  const [resumes, setResumes] = useState<DocumentSummary[]>([]);
 
   useEffect(() => {
     loadResumes();
@@ -20,12 +20,12 @@ import {
   Edit as EditIcon,
   Add as AddIcon,
 } from '@mui/icons-material';
-import { promptsApi, AIPrompt } from '../services/api';
+import { promptsApi, AIPromptSummary } from '../services/api';
 
 const Settings: React.FC = () => {
-  const [prompts, setPrompts] = useState<AIPrompt[]>([]);
+  const [prompts, setPrompts] = useState<AIPromptSummary[]>([]);
   const [openDialog, setOpenDialog] = useState(false);
-  const [selectedPrompt, setSelectedPrompt] = useState<AIPrompt | null>(null);
+  const [selectedPrompt, setSelectedPrompt] = useState<AIPromptSummary | null>(null);
   const [name, setName] = useState('');
   const [content, setContent] = useState('');
   const [description, setDescription] = useState('');
@@ -51,11 +51,18 @@ const Settings: React.FC = () => {
     setOpenDialog(true);
   };
 
-  const handleEdit = (prompt: AIPrompt) => {
+  const handleEdit = async (prompt: AIPromptSummary) => {
     setSelectedPrompt(prompt);
     setName(prompt.name);
-    setContent(prompt.content);
     setDescription(prompt.description || '');
+    // The prompt list only carries metadata, so fetch the full content
+    try {
+      const response = await promptsApi.get(prompt.name);
+      setContent(response.data.content);
+    } catch (error) {
+      console.error('Error fetching prompt content:', error);
+      setContent('');
+    }
     setOpenDialog(true);
   };
 
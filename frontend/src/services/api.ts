@@ -27,35 +27,116 @@ export interface AIPrompt {
   updated_at: string;
 }
 
+// List endpoints return metadata only; fetch a single item for its content
+export type BiographyVersion = Omit<Biography, 'content'>;
+export type AIPromptSummary = Omit<AIPrompt, 'content'>;
+export type DocumentSummary = Omit<Document, 'content'>;
+
 export const documentsApi = {
-  list: (type: string) => api.get<Document[]>(`/documents/${type}`),
+  list: (type: string) => api.get<DocumentSummary[]>(`/documents/${type}`),
   get: (type: string, name: string) => api.get<Document>(`/documents/${type}/${name}`),
   create: (type: string, data: { name: string; content: string; metadata?: any }) =>
     api.post(`/documents/${type}`, data),
   delete: (type: string, name: string) => api.delete(`/documents/${type}/${name}`),
 };
 
+export interface SearchResult {
+  doc_type: string;
+  name: string;
+  snippet: string;
+  rank: number;
+}
+
+export const searchApi = {
+  search: (q: string, type?: string, limit?: number) =>
+    api.get<SearchResult[]>('/search', { params: { q, type, limit } }),
+};
+
 export const biographyApi = {
   get: () => api.get<Biography>('/biography'),
   update: (content: string, notes?: string) => api.post('/biography', { content, notes }),
-  getVersions: () => api.get<Biography[]>('/biography/versions'),
+  getVersions: () => api.get<BiographyVersion[]>('/biography/versions'),
   getVersion: (version: number) => api.get<Biography>(`/biography/${version}`),
 };
 
 export const promptsApi = {
-  list: () => api.get<AIPrompt[]>('/prompts'),
+  list: () => api.get<AIPromptSummary[]>('/prompts'),
   get: (name: string) => api.get<AIPrompt>(`/prompts/${name}`),
   save: (name: string, content: string, description?: string) =>
     api.post(`/prompts/${name}`, { content, description }),
 };
 
+export interface GenerationRequest {
+  resume_name: string;
+  job_description_name: string;
+  sample_letter_name: string;
+  preferences?: string;
+}
+
+export interface GenerationResult {
+  cover_letter: string;
+  user_profile: string;
+  job_analysis: string;
+  alignment: string;
+  valid?: boolean;
+}
+
 export const generatorApi = {
-  generate: (data: {
-    resume_name: string;
-    job_description_name: string;
-    sample_letter_name: string;
-    preferences?: string;
-  }) => api.post('/generate-cover-letter', data),
+  generate: (data: GenerationRequest) => api.post<GenerationResult>('/generate-cover-letter', data),
+};
+
+export type JobStatus = 'queued' | 'running' | 'succeeded' | 'failed' | 'cancelled';
+
+export interface GenerationJob {
+  id: string;
+  kind: string;
+  status: JobStatus;
+  params: GenerationRequest;
+  stages: string[];
+  result?: GenerationResult | null;
+  error?: string | null;
+  error_stage?: string | null;
+  attempts: number;
+  created_at: string;
+  started_at?: string | null;
+  finished_at?: string | null;
+}
+
+export interface JobEventHandlers {
+  onStage?: (stage: string) => void;
+  onToken?: (text: string) => void;
+  // The streamed letter failed validation and is being rewritten
+  onReset?: () => void;
+  onDone?: (job: GenerationJob) => void;
+  onError?: () => void;
+}
+
+// Generation jobs run in the background on the server and survive page reloads
+export const jobsApi = {
+  submit: (data: GenerationRequest) =>
+    api.post<{ job_id: string; status: JobStatus }>('/jobs', data),
+  get: (jobId: string) => api.get<GenerationJob>(`/jobs/${jobId}`),
+  list: (status?: JobStatus[]) =>
+    api.get<Omit<GenerationJob, 'result'>[]>('/jobs', { params: { status: status?.join(',') } }),
+  cancel: (jobId: string) => api.post(`/jobs/${jobId}/cancel`),
+  // Follows a job as it runs; returns a function that stops following it
+  follow: (jobId: string, handlers: JobEventHandlers) => {
+    const source = new EventSource(`${api.defaults.baseURL}/jobs/${jobId}/events`);
+    const listen = (event: string, handle: (payload: any) => void) =>
+      source.addEventListener(event, (message) => handle(JSON.parse((message as MessageEvent).data)));
+    listen('stage', (payload) => handlers.onStage?.(payload.stage));
+    listen('token', (payload) => handlers.onToken?.(payload.text));
+    listen('reset', () => handlers.onReset?.());
+    listen('done', (payload) => {
+      source.close();
+      handlers.onDone?.(payload);
+    });
+    // EventSource reconnects by itself (resuming after the last event) unless the request failed outright
+    source.onerror = () => {
+      if (source.readyState === EventSource.CLOSED) handlers.onError?.();
+    };
+    return () => source.close();
+  },
 };
 
 export default api; 
\ No newline at end of file
@@ -0,0 +1,159 @@
+import math
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+
+_current_run: ContextVar[Optional[str]] = ContextVar("current_run", default=None)
+_current_stage: ContextVar[Optional["StageMetrics"]] = ContextVar("current_stage", default=None)
+
+
+@dataclass
+class StageMetrics:
+    """Timing and usage for one stage of one generation run."""
+    stage: str
+    model: str
+    run_id: Optional[str] = None
+    started_at: str = ""
+    wall_ms: float = 0.0
+    validation_ms: float = 0.0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    retries: int = 0
+    cache_hit: bool = False
+    validation_path: Optional[str] = None
+    success: bool = False
+    error: Optional[str] = None
+
+    def add_usage(self, usage):
+        """Add token counts from an OpenAI response's usage block."""
+        if usage is None:
+            return
+        self.prompt_tokens += getattr(usage, "prompt_tokens", 0) or 0
+        self.completion_tokens += getattr(usage, "completion_tokens", 0) or 0
+
+
+def _new_run_id(run_id: Optional[str]) -> str:
+    if run_id is None:
+        import uuid  # only generations start runs; the CLI's document commands don't pay for the import
+        run_id = uuid.uuid4().hex
+    return run_id
+
+
+@contextmanager
+def _timed(stage: str, model: str) -> Iterator[StageMetrics]:
+    """Time a block as the current stage; an exception marks it as failed."""
+    metrics = StageMetrics(
+        stage=stage,
+        model=model,
+        run_id=_current_run.get(),
+        started_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    )
+    token = _current_stage.set(metrics)
+    start = time.perf_counter()
+    try:
+        yield metrics
+    except Exception as e:
+        metrics.success = False
+        metrics.error = str(e)
+        raise
+    finally:
+        metrics.wall_ms = (time.perf_counter() - start) * 1000
+        _current_stage.reset(token)
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class MetricsRecorder:
+    def __init__(self, db):
+        """Record per-stage metrics into the generation_runs table of the given DocumentDB."""
+        self.db = db
+
+    @contextmanager
+    def run(self, name: str = "pipeline", run_id: Optional[str] = None) -> Iterator[str]:
+        """Group the stages recorded inside this block under one run ID.
+
+        The whole block is recorded as a stage of its own under name. Threads
+        started by the pipeline executor inherit the run through contextvars.
+        """
+        run_id = _new_run_id(run_id)
+        token = _current_run.set(run_id)
+        try:
+            with self.stage(name, "-") as metrics:
+                yield run_id
+                metrics.success = True
+        finally:
+            _current_run.reset(token)
+
+    @asynccontextmanager
+    async def arun(self, name: str = "pipeline", run_id: Optional[str] = None) -> AsyncIterator[str]:
+        """run() for the event loop: the run's own metrics are saved on a worker thread."""
+        run_id = _new_run_id(run_id)
+        token = _current_run.set(run_id)
+        try:
+            async with self.astage(name, "-") as metrics:
+                yield run_id
+                metrics.success = True
+        finally:
+            _current_run.reset(token)
+
+    @contextmanager
+    def stage(self, stage: str, model: str) -> Iterator[StageMetrics]:
+        """Time a stage and persist its metrics when it finishes.
+
+        The block fills in tokens, retries, cache hits and validation details
+        on the yielded StageMetrics; an exception marks the stage as failed.
+        """
+        try:
+            with _timed(stage, model) as metrics:
+                yield metrics
+        finally:
+            self.db.save_generation_run(asdict(metrics))
+
+    @asynccontextmanager
+    async def astage(self, stage: str, model: str) -> AsyncIterator[StageMetrics]:
+        """stage() for the event loop: the metrics are saved on a worker thread."""
+        import asyncio  # only the async pipeline records here; the CLI doesn't pay for the import
+        try:
+            with _timed(stage, model) as metrics:
+                yield metrics
+        finally:
+            await asyncio.to_thread(self.db.save_generation_run, asdict(metrics))
+
+    @staticmethod
+    def current_stage() -> Optional[StageMetrics]:
+        """The stage being recorded in this context, if any."""
+        return _current_stage.get()
+
+    def summary(self, since: Optional[str] = None) -> Dict[str, Dict]:
+        """Summarize recorded stages: count, p50/p95 wall time, tokens, retries and cache hits."""
+        by_stage: Dict[str, List[Dict]] = {}
+        for row in self.db.list_generation_runs(since):
+            by_stage.setdefault(row["stage"], []).append(row)
+
+        summary = {}
+        for stage, rows in sorted(by_stage.items()):
+            wall = [row["wall_ms"] for row in rows]
+            validation = [row["validation_ms"] for row in rows if not row["cache_hit"]]
+            summary[stage] = {
+                "count": len(rows),
+                "success_rate": sum(1 for row in rows if row["success"]) / len(rows),
+                "p50_ms": percentile(wall, 0.50),
+                "p95_ms": percentile(wall, 0.95),
+                "validation_p50_ms": percentile(validation, 0.50),
+                "validation_p95_ms": percentile(validation, 0.95),
+                "avg_prompt_tokens": sum(row["prompt_tokens"] for row in rows) / len(rows),
+                "avg_completion_tokens": sum(row["completion_tokens"] for row in rows) / len(rows),
+                "avg_retries": sum(row["retries"] for row in rows) / len(rows),
+                "cache_hit_rate": sum(1 for row in rows if row["cache_hit"]) / len(rows),
+                "models": sorted({row["model"] for row in rows}),
+            }
+        return summary
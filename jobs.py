@@ -0,0 +1,294 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from cover_letter_generator import COVER_LETTER_FORMAT, metrics
+from pipeline import build_generation_pipeline, PipelineError
+
+FINISHED_STATUSES = ("succeeded", "failed", "cancelled")
+
+# How often a listener on a job run by another process checks the jobs table
+EVENTS_POLL_INTERVAL = 1.0
+
+# How often a process records that its running jobs are still alive, and
+# sweeps for jobs whose owner stopped doing so
+JOB_HEARTBEAT_INTERVAL = float(os.getenv('JOB_HEARTBEAT_INTERVAL', '10'))
+# A running job with no heartbeat for this long is taken to be abandoned
+JOB_STALE_AFTER = float(os.getenv('JOB_STALE_AFTER', str(JOB_HEARTBEAT_INTERVAL * 3)))
+# Times an abandoned job is started before it is marked failed
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+
+
+class JobCancelled(Exception):
+    """Raised between pipeline stages to stop a job that has been cancelled."""
+
+
+class JobEvents:
+    """The stage, token and done events of one job, kept so late listeners can replay them."""
+
+    def __init__(self):
+        self.events: List[Tuple[str, Dict]] = []
+        self.finished = False
+        # Event IDs name the attempt, so IDs from before a restart aren't mistaken for this run's
+        self.attempt = 0
+        self._cond = threading.Condition()
+
+    def publish(self, event: str, data: Dict, final: bool = False):
+        with self._cond:
+            self.events.append((event, data))
+            self.finished = self.finished or final
+            self._cond.notify_all()
+
+    def wait(self, start: int, timeout: float) -> Tuple[List[Tuple[str, Dict]], bool]:
+        """Events from index start on, waiting up to timeout for one; also whether the job has finished."""
+        with self._cond:
+            self._cond.wait_for(lambda: len(self.events) > start or self.finished, timeout)
+            return self.events[start:], self.finished
+
+
+class JobQueue:
+    """Runs cover letter generation in the background on a pool of worker threads.
+
+    Jobs are stored in the jobs table, so their status and result outlive the
+    request that submitted them. Each running job is claimed by this queue's
+    owner ID and kept alive with a heartbeat, so several processes (say,
+    uvicorn workers) can share the table: resume() and a periodic sweep pick
+    up jobs that are queued or whose owner stopped, without touching jobs
+    another live process is running, and give up on a job after
+    JOB_MAX_ATTEMPTS starts. A cancelled job stops after the stage it is
+    running finishes.
+    """
+
+    def __init__(self, db, generator, max_workers: Optional[int] = None):
+        self.db = db
+        self.generator = generator
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers or int(os.getenv('JOB_WORKERS', '2')),
+            thread_name_prefix="generation-job"
+        )
+        self._cancel_events: Dict[str, threading.Event] = {}
+        self._events: Dict[str, JobEvents] = {}
+        self._lock = threading.Lock()
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._running: set = set()
+        self._stopped = threading.Event()
+        self._heartbeat: Optional[threading.Thread] = None
+
+    def submit(self, params: Dict) -> Optional[str]:
+        """Queue a cover letter generation and return its job ID.
+
+        params holds resume_name, job_description_name, sample_letter_name and
+        preferences, as for /api/generate-cover-letter.
+        """
+        job_id = uuid.uuid4().hex
+        if not self.db.create_job(job_id, "cover_letter", params):
+            return None
+        self._schedule(job_id)
+        return job_id
+
+    def resume(self) -> int:
+        """Schedule queued jobs and requeue those abandoned by a stopped process."""
+        job_ids = self.db.requeue_interrupted_jobs(JOB_STALE_AFTER, JOB_MAX_ATTEMPTS)
+        with self._lock:
+            job_ids = [job_id for job_id in job_ids if job_id not in self._events]
+        for job_id in job_ids:
+            self._schedule(job_id)
+        if job_ids:
+            print(f"Resuming {len(job_ids)} generation job(s)")
+        self._start_heartbeat()
+        return len(job_ids)
+
+    def _start_heartbeat(self):
+        with self._lock:
+            if self._heartbeat is not None or self._stopped.is_set():
+                return
+            self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="generation-job-heartbeat",
+                                               daemon=True)
+        self._heartbeat.start()
+
+    def _heartbeat_loop(self):
+        """Keep this process's running jobs alive, and take over jobs whose owner died."""
+        while not self._stopped.wait(JOB_HEARTBEAT_INTERVAL):
+            with self._lock:
+                running = list(self._running)
+            self.db.heartbeat_jobs(self.owner, running)
+            try:
+                self.resume()
+            except RuntimeError:
+                return  # the pool has been shut down
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job. Returns False if it has already finished."""
+        with self._lock:
+            event = self._cancel_events.get(job_id)
+        if event:
+            event.set()
+        return self.db.finish_job(job_id, "cancelled")
+
+    def events(self, job_id: str, last_event_id: str = "",
+               timeout: float = 15.0) -> Iterator[Optional[Tuple[str, str, Dict]]]:
+        """Follow a job as (event ID, event, data) tuples, ending with a done event holding the job.
+
+        Jobs run by this queue stream their stage events and the letter's
+        token events, replayed from the one after last_event_id (or, if that
+        ID is from an earlier attempt, from a reset event and the start);
+        other jobs are followed through the jobs table, stage by stage, with
+        empty IDs. None is yielded when nothing has happened for timeout
+        seconds, so the caller can keep its connection alive. Yields nothing
+        if there is no such job.
+        """
+        with self._lock:
+            log = self._events.get(job_id)
+        if log is None:
+            yield from self._table_events(job_id, timeout)
+            return
+        attempt, _, index = last_event_id.partition(".")
+        index = int(index) + 1 if index.isdigit() else 0
+        if last_event_id and attempt != str(log.attempt):
+            yield "", "reset", {}
+            index = 0
+        while True:
+            events, finished = log.wait(index, timeout)
+            if not events and not finished:
+                yield None
+            for event, data in events:
+                if event == "handoff":
+                    # Another process claimed the job first; follow it there
+                    yield from self._table_events(job_id, timeout)
+                    return
+                yield f"{log.attempt}.{index}", event, data
+                index += 1
+            if finished and not events:
+                return
+
+    def _table_events(self, job_id: str, timeout: float) -> Iterator[Optional[Tuple[str, str, Dict]]]:
+        reported = 0
+        quiet_since = time.monotonic()
+        while True:
+            job = self.db.get_job(job_id)
+            if job is None:
+                return
+            for stage in job["stages"][reported:]:
+                yield "", "stage", {"stage": stage}
+                quiet_since = time.monotonic()
+            reported = len(job["stages"])
+            if job["status"] in FINISHED_STATUSES:
+                yield "", "done", job
+                return
+            if time.monotonic() - quiet_since >= timeout:
+                yield None
+                quiet_since = time.monotonic()
+            time.sleep(EVENTS_POLL_INTERVAL)
+
+    def shutdown(self, wait: bool = True):
+        """Stop accepting jobs. Queued jobs stay in the table and are resumed on the next start."""
+        self._stopped.set()
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+
+    def _schedule(self, job_id: str):
+        with self._lock:
+            self._cancel_events[job_id] = threading.Event()
+            self._events[job_id] = JobEvents()
+        self._pool.submit(self._run, job_id)
+        self._start_heartbeat()
+
+    def _run(self, job_id: str):
+        cancelled = self._cancel_events[job_id]
+        log = self._events[job_id]
+        if not self.db.claim_job(job_id, self.owner):
+            with self._lock:
+                self._cancel_events.pop(job_id, None)
+                self._events.pop(job_id, None)
+            log.publish("handoff", {}, final=True)
+            return
+        with self._lock:
+            self._running.add(job_id)
+        try:
+            job = self.db.get_job(job_id)
+            log.attempt = job["attempts"]
+            params = job["params"]
+            resume = self.db.get_document('resume', params.get('resume_name'))
+            job_desc = self.db.get_document('job_description', params.get('job_description_name'))
+            sample_letter = self.db.get_document('cover_letter', params.get('sample_letter_name'))
+            if not all([resume, job_desc, sample_letter]):
+                self.db.finish_job(job_id, "failed", error="Missing required documents")
+                return
+
+            completed = []
+
+            def record_stage(stage: str, output: str):
+                completed.append(stage)
+                self.db.update_job_stages(job_id, completed)
+                log.publish("stage", {"stage": stage})
+                if cancelled.is_set():
+                    raise JobCancelled()
+
+            print(f"\nRunning generation job {job_id}...")
+            # Stop the pipeline after the alignment so the letter can be streamed
+            pipeline = build_generation_pipeline(
+                self.generator,
+                resume['content'],
+                [sample_letter['content']],
+                params.get('preferences', ''),
+                job_desc['content'],
+                None
+            )
+            with metrics.run():
+                results = pipeline.run(on_stage_complete=record_stage)
+                results["cover_letter"] = self._write_letter(results["alignment"], sample_letter['content'],
+                                                             log, cancelled)
+                record_stage("cover_letter", results["cover_letter"])
+
+            self.db.finish_job(job_id, "succeeded", result={
+                "cover_letter": results["cover_letter"],
+                "user_profile": results["user_profile"],
+                "job_analysis": results["job_analysis"],
+                "alignment": results["alignment"]
+            })
+            print(f"Generation job {job_id} complete")
+        except JobCancelled:
+            print(f"Generation job {job_id} cancelled")
+        except PipelineError as e:
+            print(f"\nError in generation job {job_id}, stage '{e.stage}': {e}")
+            self.db.finish_job(job_id, "failed", error=str(e), error_stage=e.stage)
+        except Exception as e:
+            print(f"\nError in generation job {job_id}: {e}")
+            self.db.finish_job(job_id, "failed", error=str(e))
+        finally:
+            with self._lock:
+                self._cancel_events.pop(job_id, None)
+                self._events.pop(job_id, None)
+                self._running.discard(job_id)
+            log.publish("done", self.db.get_job(job_id) or {"id": job_id, "status": "failed"}, final=True)
+
+    def _write_letter(self, alignment: str, sample_letter: str, log: JobEvents, cancelled: threading.Event) -> str:
+        """Stream the cover letter to the job's listeners as it is written.
+
+        A streamed letter that fails validation is replaced by one from the
+        validated, retried request; listeners get a reset event and the
+        replacement in the done event.
+        """
+        parts = []
+        try:
+            for text in self.generator.generate_cover_letter_stream(alignment, sample_letter):
+                if cancelled.is_set():
+                    raise JobCancelled()
+                parts.append(text)
+                log.publish("token", {"text": text})
+        except JobCancelled:
+            raise
+        except Exception as e:
+            raise PipelineError("cover_letter", str(e)) from e
+        letter = "".join(parts)
+        if self.generator.validate_response(letter, COVER_LETTER_FORMAT):
+            return letter
+
+        print("Streamed cover letter failed validation; regenerating")
+        log.publish("reset", {"stage": "cover_letter"})
+        letter = self.generator.generate_cover_letter(alignment, sample_letter)
+        if letter.startswith("Error"):
+            raise PipelineError("cover_letter", letter)
+        return letter
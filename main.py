@@ -1,26 +1,64 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
+import io
 import os
-from cover_letter_generator import CoverLetterGenerator
-from database import DocumentDB
+import json
+import shutil
+import tempfile
+import zipfile
+from datetime import datetime
+from bulk_import import import_documents, iter_jsonl, iter_uploads, iter_zip
+from data_export import EXPORT_TYPES, iter_jsonl_export, iter_zip_export
+from cover_letter_generator import CoverLetterGenerator, COVER_LETTER_FORMAT, metrics
+from database import DOCUMENT_TABLES, shared_db as db
+from pipeline import build_generation_pipeline, run_batch_generation, PipelineError
+from jobs import JobQueue
+from prompt_registry import prompt_registry
+from rate_limiter import rate_limiter, request_class
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
-CORS(app)  # Enable CORS for React frontend
+CORS(app, expose_headers=["X-Next-Cursor"])  # Enable CORS for React frontend
 
 # Initialize our classes
-db = DocumentDB()
 generator = CoverLetterGenerator()
+job_queue = JobQueue(db, generator)
+# Prompt edits apply to the next generation; log when a new set goes live
+prompt_registry.subscribe(lambda version: print(f"Loaded AI prompts (version {version})"))
+
+def request_user() -> str:
+    """Who a request is for, so the rate limiter can share API capacity fairly between users."""
+    return request.headers.get('X-User-Id') or request.remote_addr or "local"
+
+def paginated_list(list_func, cursor_field: str, cursor_type=str):
+    """Call a DocumentDB list method with the ?fields=, ?limit= and ?after= query parameters.
+    
+    When a full page is returned, the cursor for the next page is sent in the
+    X-Next-Cursor header.
+    """
+    fields = request.args.get('fields')
+    fields = [field.strip() for field in fields.split(',') if field.strip()] if fields else None
+    limit = request.args.get('limit', type=int)
+    after = request.args.get('after', type=cursor_type)
+    
+    try:
+        rows = list_func(limit=limit, after=after, fields=fields)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    response = jsonify(rows)
+    if limit and len(rows) == limit:
+        response.headers["X-Next-Cursor"] = str(rows[-1][cursor_field])
+    return response
 
 # Document Management Routes
 @app.route('/api/documents/<doc_type>', methods=['GET'])
 def list_documents(doc_type):
-    """List all documents of a specific type."""
-    documents = db.list_documents(doc_type)
-    return jsonify(documents)
+    """List documents of a specific type (supports ?fields=, ?limit= and ?after=)."""
+    return paginated_list(lambda **kwargs: db.list_documents(doc_type, **kwargs), "name")
 
 @app.route('/api/documents/<doc_type>/<name>', methods=['GET'])
 def get_document(doc_type, name):
@@ -44,12 +82,101 @@ def create_document(doc_type):
     success = db.save_document(doc_type, name, content, metadata)
     return jsonify({"error": "Failed to save document"}), 500
 
+@app.route('/api/documents/<doc_type>/bulk', methods=['POST'])
+def bulk_import_documents(doc_type):
+    """Import many documents of one type at once.
+    
+    Send files as multipart `files` (.zip, .jsonl, .txt, .md or .pdf), a zip
+    archive as an application/zip body, or JSON lines with name and content
+    (plus company and position for job descriptions) as the body. Responds
+    with how many documents were imported, skipped and failed.
+    """
+    if doc_type not in DOCUMENT_TABLES:
+        return jsonify({"error": f"Unknown document type '{doc_type}'"}), 400
+    
+    if request.files:
+        uploads = [(os.path.basename(upload.filename or "upload"), upload.stream)
+                   for upload in request.files.getlist('files')]
+        documents = iter_uploads(uploads)
+    elif request.mimetype in ('application/zip', 'application/x-zip-compressed'):
+        # Zip archives are read from the end, so spool the body first
+        archive = tempfile.SpooledTemporaryFile(max_size=32 * 1024 * 1024)
+        shutil.copyfileobj(request.stream, archive)
+        archive.seek(0)
+        documents = iter_zip(archive)
+    else:
+        # Read lines from a buffer; the raw request stream reads a byte at a time
+        documents = iter_jsonl(io.BufferedReader(request.stream, 1 << 16), "body")
+    
+    try:
+        report = import_documents(db, doc_type, documents)
+    except zipfile.BadZipFile as e:
+        return jsonify({"error": f"Invalid zip archive: {e}"}), 400
+    print(f"Bulk import of {doc_type}: {report.describe()}")
+    return jsonify(report.to_dict())
+
+@app.route('/api/export', methods=['GET'])
+def export_data():
+    """Download documents, biography versions and prompts as they are read.
+    
+    ?format=jsonl (default) sends one JSON object per line, ?format=zip a zip
+    of text files with a manifest, and ?format=sqlite an online backup of the
+    whole database. ?types= limits a JSONL or zip export to some of resume,
+    cover_letter, job_description, biography and prompt.
+    """
+    export_format = request.args.get('format', 'jsonl')
+    types = request.args.get('types')
+    types = [t.strip() for t in types.split(',') if t.strip()] if types else None
+    if types and any(t not in EXPORT_TYPES for t in types):
+        return jsonify({"error": f"Unknown export types; expected some of {', '.join(EXPORT_TYPES)}"}), 400
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    
+    if export_format == 'sqlite':
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        if not db.backup(path):
+            os.remove(path)
+            return jsonify({"error": "Failed to back up the database"}), 500
+        
+        def stream_backup():
+            try:
+                with open(path, 'rb') as f:
+                    yield from iter(lambda: f.read(1 << 16), b'')
+            finally:
+                os.remove(path)
+        
+        return Response(stream_backup(), mimetype='application/vnd.sqlite3', headers={
+            "Content-Disposition": f'attachment; filename="documents-{stamp}.db"',
+            "Content-Length": str(os.path.getsize(path))
+        })
+    if export_format == 'zip':
+        return Response(iter_zip_export(db, types), mimetype='application/zip', headers={
+            "Content-Disposition": f'attachment; filename="export-{stamp}.zip"'
+        })
+    if export_format == 'jsonl':
+        return Response(iter_jsonl_export(db, types), mimetype='application/x-ndjson', headers={
+            "Content-Disposition": f'attachment; filename="export-{stamp}.jsonl"'
+        })
+    return jsonify({"error": "format must be jsonl, zip or sqlite"}), 400
+
 @app.route('/api/documents/<doc_type>/<name>', methods=['DELETE'])
 def delete_document(doc_type, name):
     """Delete a document."""
     success = db.delete_document(doc_type, name)
     return jsonify({"error": "Failed to delete document"}), 500
 
+@app.route('/api/search', methods=['GET'])
+def search_documents():
+    """Full-text search across documents (?q=, optional ?type= and ?limit=)."""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "Query parameter 'q' is required"}), 400
+    
+    doc_type = request.args.get('type')
+    # SQLite treats a negative LIMIT as no limit, so clamp both ends
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    return jsonify(db.search_documents(query, doc_type, limit))
+
 # Biography Routes
 @app.route('/api/biography', methods=['GET'])
 def get_biography():
@@ -76,9 +203,8 @@ def update_biography():
 
 @app.route('/api/biography/versions', methods=['GET'])
 def list_biography_versions():
-    """List all biography versions."""
-    versions = db.list_biography_versions()
-    return jsonify(versions)
+    """List biography versions, newest first (supports ?fields=, ?limit= and ?after=)."""
+    return paginated_list(db.list_biography_versions, "version", cursor_type=int)
 
 @app.route('/api/biography/<int:version>', methods=['GET'])
 def get_biography_version(version):
@@ -117,51 +243,273 @@ def generate_cover_letter():
         return jsonify({"error": error_msg}), 400
     
     try:
-        print("\nProcessing user information...")
-        # Process user information
-        user_profile = generator.process_user_info(
+        print("\nRunning generation pipeline...")
+        # Profile and job analysis run in parallel, then alignment, then the letter
+        pipeline = build_generation_pipeline(
+            generator,
             resume['content'],
             [sample_letter['content']],
-            preferences
+            preferences,
+            job_desc['content'],
+            sample_letter['content']
         )
-        print("User profile generated successfully")
-        
-        print("\nAnalyzing job...")
-        # Analyze job
-        job_analysis = generator.analyze_job(job_desc['content'])
-        print("Job analysis completed successfully")
-        
-        print("\nAligning profile with job...")
-        # Match profile with job
-        alignment = generator.align_profile_with_job(user_profile, job_analysis)
-        print("Profile-job alignment completed successfully")
-        
-        print("\nGenerating cover letter...")
-        # Generate cover letter
-        cover_letter = generator.generate_cover_letter(alignment, sample_letter['content'])
-        print("Cover letter generated successfully")
+        with metrics.run(), request_class(user=request_user()):
+            results = pipeline.run(
+                on_stage_complete=lambda stage, output: print(f"Stage '{stage}' completed successfully")
+            )
         
         result = {
-            "cover_letter": cover_letter,
-            "user_profile": user_profile,
-            "job_analysis": job_analysis,
-            "alignment": alignment
+            "cover_letter": results["cover_letter"],
+            "user_profile": results["user_profile"],
+            "job_analysis": results["job_analysis"],
+            "alignment": results["alignment"]
         }
         print("\n=== Generation Complete ===")
         return jsonify(result)
     
+    except PipelineError as e:
+        error_msg = str(e)
+        print(f"\nError during generation stage '{e.stage}': {error_msg}")
+        return jsonify({"error": error_msg, "stage": e.stage}), 500
     except Exception as e:
         error_msg = str(e)
         print(f"\nError during generation: {error_msg}")
         print("Full error:", e)
         return jsonify({"error": error_msg}), 500
 
+@app.route('/api/jobs', methods=['POST'])
+def submit_generation_job():
+    """Queue a cover letter generation and return its job ID without waiting for it."""
+    data = request.get_json()
+    params = {
+        "resume_name": data.get('resume_name'),
+        "job_description_name": data.get('job_description_name'),
+        "sample_letter_name": data.get('sample_letter_name'),
+        "preferences": data.get('preferences', '')
+    }
+    
+    documents = [
+        db.get_document('resume', params["resume_name"]),
+        db.get_document('job_description', params["job_description_name"]),
+        db.get_document('cover_letter', params["sample_letter_name"])
+    ]
+    if not all(documents):
+        return jsonify({"error": "Missing required documents"}), 400
+    
+    job_id = job_queue.submit(params)
+    if not job_id:
+        return jsonify({"error": "Failed to queue generation job"}), 500
+    print(f"\nQueued generation job {job_id}")
+    return jsonify({"job_id": job_id, "status": "queued"}), 202
+
+@app.route('/api/jobs', methods=['GET'])
+def list_generation_jobs():
+    """List recent jobs without their results (optional ?status=queued,running&limit=)."""
+    statuses = request.args.get('status')
+    statuses = [status.strip() for status in statuses.split(',') if status.strip()] if statuses else None
+    jobs = db.list_jobs(statuses, limit=request.args.get('limit', 50, type=int))
+    for job in jobs:
+        job.pop('result', None)
+    return jsonify(jobs)
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_generation_job(job_id):
+    """Get a job's status, completed stages and, once it has succeeded, its result."""
+    job = db.get_job(job_id)
+    if job:
+        return jsonify(job)
+    return jsonify({"error": "Job not found"}), 404
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_generation_job(job_id):
+    """Cancel a queued or running job."""
+    if job_queue.cancel(job_id):
+        return jsonify({"success": True})
+    if db.get_job(job_id):
+        return jsonify({"error": "Job has already finished"}), 409
+    return jsonify({"error": "Job not found"}), 404
+
+def sse_event(event: str, data: dict, event_id: str = "") -> str:
+    """Format a Server-Sent Events message; event_id, if given, is sent back as Last-Event-ID on reconnect."""
+    id_line = f"id: {event_id}\n" if event_id else ""
+    return f"{id_line}event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def stream_generation_job(job_id):
+    """Follow a job as Server-Sent Events.
+    
+    Emits a `stage` event as each stage finishes and `token` events while
+    the letter is written (after a `reset` event, the letter so far is
+    discarded and streamed again),
+    then a `done` event with the job. Reconnecting with Last-Event-ID picks
+    up after that event.
+    """
+    if not db.get_job(job_id):
+        return jsonify({"error": "Job not found"}), 404
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    
+    def generate():
+        for message in job_queue.events(job_id, last_event_id):
+            if message is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield sse_event(message[1], message[2], message[0])
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.route('/api/generate-cover-letter/stream', methods=['POST'])
+def generate_cover_letter_stream():
+    """Generate a cover letter, streaming progress and letter text as Server-Sent Events.
+    
+    Emits a `stage` event as each analysis stage finishes, `token` events
+    while the letter is written, then a `done` event with the full result or
+    an `error` event.
+    """
+    data = request.get_json()
+    print("\n=== Starting Streaming Cover Letter Generation ===")
+    print("Request Data:", data)
+    
+    resume = db.get_document('resume', data.get('resume_name'))
+    job_desc = db.get_document('job_description', data.get('job_description_name'))
+    sample_letter = db.get_document('cover_letter', data.get('sample_letter_name'))
+    preferences = data.get('preferences', '')
+    
+    if not all([resume, job_desc, sample_letter]):
+        error_msg = "Missing required documents"
+        print(f"\nError: {error_msg}")
+        return jsonify({"error": error_msg}), 400
+    
+    user = request_user()
+    
+    def generate():
+        result = {}
+        try:
+            with metrics.run(), request_class(user=user):
+                yield sse_event("stage", {"stage": "started"})
+                # Stop the pipeline after the alignment so the letter can be streamed
+                pipeline = build_generation_pipeline(
+                    generator,
+                    resume['content'],
+                    [sample_letter['content']],
+                    preferences,
+                    job_desc['content'],
+                    None
+                )
+                for stage_name, output in pipeline.iter_stages():
+                    print(f"Stage '{stage_name}' completed successfully")
+                    result[stage_name] = output
+                    yield sse_event("stage", {"stage": stage_name, "output": output})
+            
+                parts = []
+                for text in generator.generate_cover_letter_stream(result["alignment"], sample_letter['content']):
+                    parts.append(text)
+                    yield sse_event("token", {"text": text})
+                result["cover_letter"] = "".join(parts)
+                yield sse_event("stage", {"stage": "cover_letter"})
+            
+                # Tokens are already on screen, so validation only flags a bad letter
+                result["valid"] = generator.validate_response(result["cover_letter"], COVER_LETTER_FORMAT)
+                print("\n=== Streaming Generation Complete ===")
+                yield sse_event("done", result)
+        except PipelineError as e:
+            print(f"\nError during generation stage '{e.stage}': {e}")
+            yield sse_event("error", {"error": str(e), "stage": e.stage})
+        except Exception as e:
+            print(f"\nError during generation: {e}")
+            yield sse_event("error", {"error": str(e), "stage": "cover_letter"})
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.route('/api/generate-batch', methods=['POST'])
+def generate_batch():
+    """Generate cover letters for several job descriptions from one resume.
+    
+    Results are streamed back as newline-delimited JSON, one object per job,
+    in the order the jobs finish.
+    """
+    data = request.get_json()
+    print("\n=== Starting Batch Cover Letter Generation ===")
+    print("Request Data:", data)
+    
+    resume_name = data.get('resume_name')
+    sample_letter_name = data.get('sample_letter_name')
+    job_desc_names = data.get('job_description_names', [])
+    preferences = data.get('preferences', '')
+    max_concurrency = data.get('max_concurrency', 4)
+    
+    if not job_desc_names:
+        return jsonify({"error": "At least one job description is required"}), 400
+    try:
+        max_concurrency = max(1, min(int(max_concurrency), 8))
+    except (TypeError, ValueError):
+        return jsonify({"error": "max_concurrency must be an integer"}), 400
+    
+    resume = db.get_document('resume', resume_name)
+    sample_letter = db.get_document('cover_letter', sample_letter_name)
+    if not all([resume, sample_letter]):
+        error_msg = "Missing required documents"
+        print(f"\nError: {error_msg}")
+        return jsonify({"error": error_msg}), 400
+    
+    job_descriptions = {}
+    missing = []
+    for name in job_desc_names:
+        job_desc = db.get_document('job_description', name)
+        if job_desc:
+            job_descriptions[name] = job_desc['content']
+        else:
+            missing.append(name)
+    
+    user = request_user()
+    
+    def generate():
+        for name in missing:
+            yield json.dumps({"job_description_name": name, "error": "Job description not found"}) + "\n"
+        if not job_descriptions:
+            return
+        with metrics.run("batch_pipeline"), request_class(user=user):
+            yield from generate_results()
+        print("\n=== Batch Generation Complete ===")
+    
+    def generate_results():
+        for result in run_batch_generation(
+            generator,
+            resume['content'],
+            [sample_letter['content']],
+            preferences,
+            job_descriptions,
+            sample_letter['content'],
+            max_concurrency=max_concurrency
+        ):
+            print(f"Batch job '{result['job_description_name']}' finished"
+                  f"{' with error: ' + result['error'] if 'error' in result else ''}")
+            yield json.dumps(result) + "\n"
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Per-stage latency (p50/p95), token, retry and cache-hit summaries (optional ?since=)."""
+    return jsonify(metrics.summary(request.args.get('since')))
+
+@app.route('/api/metrics/rate-limits', methods=['GET'])
+def get_rate_limits():
+    """Per-model rate limits, queue depth and recent wait times (p50/p95) for API requests."""
+    return jsonify(rate_limiter.stats())
+
 # AI Prompt Routes
 @app.route('/api/prompts', methods=['GET'])
 def list_prompts():
-    """List all AI prompts."""
-    prompts = db.list_prompts()
-    return jsonify(prompts)
+    """List AI prompts (supports ?fields=, ?limit= and ?after=)."""
+    return paginated_list(db.list_prompts, "name")
 
 @app.route('/api/prompts/<name>', methods=['GET'])
 def get_prompt(name):
@@ -183,11 +531,14 @@ def save_prompt(name):
     
     success = db.save_prompt(name, content, description)
     if success:
-        return jsonify({"success": True})
+        return jsonify({"success": True, "version": db.prompt_version})
     return jsonify({"error": "Failed to save prompt"}), 500
 
 if __name__ == '__main__':
     # Initialize database with default prompts if they don't exist
-    if not db.list_prompts():
+    if not db.list_prompts(limit=1):
         db.initialize_default_prompts()
+    # With the reloader on, only the child process that serves requests runs jobs
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        job_queue.resume()
     app.run(host='127.0.0.1', port=5000, debug=True) 
\ No newline at end of file
@@ -0,0 +1,246 @@
+"""A local stand-in for the OpenAI chat completions API, for offline load testing.
+
+Start it, then point the app at it through the environment:
+
+    python mock_openai_server.py --port 8001 --latency 0.5
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=mock python main.py
+
+Responses are canned per pipeline stage and shaped like each stage's
+expected format, so they pass validation.
+"""
+import argparse
+import json
+import random
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+CANNED_RESPONSES = {
+    "user_profile": """# Professional Profile
+Backend engineer with six years of experience building data-heavy web services, focused on reliability and developer tooling.
+
+# Key Qualifications
+* Python, Go and SQL in production at scale
+* Cut p95 API latency by 40% through query and caching work
+* Mentored four junior engineers
+
+# Experience Highlights
+* Led migration of a monolith to event-driven services
+* Built internal deployment tooling used by 60 engineers
+
+# Education & Certifications
+* B.S. Computer Science, 2018
+
+# Additional Insights
+* Prefers collaborative, product-minded teams""",
+    "job_analysis": """# Core Requirements
+* 5+ years of backend development
+* Strong Python and SQL skills
+* Experience operating production services
+
+# Preferred Qualifications
+* Experience with event-driven architectures
+* Mentoring experience
+
+# Key Responsibilities
+* Design and build APIs for the core product
+* Improve reliability and performance of existing services
+
+# Company & Culture
+* Small, remote-first team that values ownership
+
+# Writing Style Guide
+* Tone: Friendly and direct
+* Keywords: ownership, reliability, impact""",
+    "alignment": """# Key Matches
+* Six years of backend work covers the experience requirement
+* Production Python and SQL match the core stack
+* Latency and reliability work maps directly to the responsibilities
+
+# Areas to Address
+* No explicit remote-team experience; highlight async collaboration
+
+# Recommended Focus Points
+* The 40% latency reduction
+* Leading the event-driven migration
+* Mentoring junior engineers
+
+# Suggested Approach
+* Friendly, direct tone emphasizing ownership""",
+    "cover_letter": """Dear Hiring Manager,
+
+I am excited to apply for the Backend Engineer role. Over the past six years I have built and operated data-heavy web services in Python and Go, and I care most about the things your team emphasizes: ownership, reliability and real impact for users.
+
+In my current role I led the migration of a large monolith to event-driven services, which let our teams ship independently and made incidents far easier to contain. I also drove a performance effort that cut p95 API latency by 40% through query tuning and careful caching, work that maps closely to the reliability goals in your description.
+
+Beyond my own code, I enjoy making the people around me more effective. I built deployment tooling now used by sixty engineers and have mentored four junior developers as they grew into confident owners of their services. While most of my work has been in a shared office, our team ran largely asynchronously across time zones, and I am comfortable with the written, remote-first collaboration you describe.
+
+I would welcome the chance to bring this experience to your team and to help build APIs that are fast, dependable and pleasant to work with. Thank you for your time and consideration.
+
+Sincerely,
+Alex Candidate""",
+    "biography": """# Professional Summary
+Backend engineer with six years of experience building reliable web services.
+
+# Experience
+* Led an event-driven migration of a monolith
+* Reduced p95 API latency by 40%
+
+# Education
+* B.S. Computer Science, 2018""",
+    "validator": "VALID",
+    "summary": """The user wants a friendlier, more direct tone and asked to lead with the 40% latency reduction. They rejected adding a hobbies paragraph and prefer keeping the letter under 300 words. Open request: tighten the closing paragraph.""",
+    "editor": """Here is a tightened version of your opening paragraph:
+
+I am excited to apply for the Backend Engineer role, where I can bring six years of experience building reliable, fast web services.
+
+This leads with your strongest qualification and removes filler.""",
+}
+
+
+def detect_stage(messages: List[Dict[str, str]]) -> str:
+    """Work out which pipeline stage a request comes from by its prompt text."""
+    text = "\n".join(message.get("content") or "" for message in messages).lower()
+    if "reply with exactly valid or invalid" in text:
+        return "validator"
+    if "provide a candidate profile" in text:
+        return "user_profile"
+    if "analyze the following job description" in text:
+        return "job_analysis"
+    if "how well the candidate matches" in text:
+        return "alignment"
+    if "generate a compelling, natural-sounding cover letter" in text:
+        return "cover_letter"
+    if "running summary of a cover letter editing conversation" in text:
+        return "summary"
+    if "biographical information update" in text:
+        return "biography"
+    return "editor"
+
+
+def count_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)."""
+    return max(1, len(text) // 4)
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+    latency = 0.0
+    jitter = 0.0
+    tokens_per_second = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        messages = request.get("messages", [])
+        model = request.get("model", "gpt-4o")
+        content = CANNED_RESPONSES[detect_stage(messages)]
+
+        time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+        completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        prompt_tokens = sum(count_tokens(message.get("content") or "") for message in messages)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": count_tokens(content),
+            "total_tokens": prompt_tokens + count_tokens(content),
+        }
+
+        if request.get("stream"):
+            self._stream(completion_id, created, model, content)
+            return
+
+        self._send_json(200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        })
+
+    def _stream(self, completion_id: str, created: int, model: str, content: str):
+        """Send the response as server-sent event chunks of a few words each."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send_event(payload: str):
+            data = f"data: {payload}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        words = content.split(" ")
+        for i in range(0, len(words), 3):
+            piece = " ".join(words[i:i + 3]) + (" " if i + 3 < len(words) else "")
+            if self.tokens_per_second:
+                time.sleep(count_tokens(piece) / self.tokens_per_second)
+            send_event(json.dumps({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+            }))
+        send_event(json.dumps({
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        }))
+        send_event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def make_server(host: str = "127.0.0.1", port: int = 8001, latency: float = 0.0, jitter: float = 0.0,
+                tokens_per_second: float = 0.0) -> ThreadingHTTPServer:
+    """Create a mock server; call serve_forever() on it to start handling requests."""
+    handler = type("ConfiguredMockOpenAIHandler", (MockOpenAIHandler,), {
+        "latency": latency,
+        "jitter": jitter,
+        "tokens_per_second": tokens_per_second,
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a mock OpenAI chat completions server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds before each response starts")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Random +/- seconds added to the latency")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0,
+                        help="Throttle streamed responses to this rate (0 = unthrottled)")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.latency, args.jitter, args.tokens_per_second)
+    print(f"Mock OpenAI server listening on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
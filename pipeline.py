@@ -0,0 +1,196 @@
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from rate_limiter import BATCH, run_with_priority
+from retry_policy import deadline_after, run_with_deadline
+
+
+class PipelineError(Exception):
+    """Raised when a pipeline stage fails."""
+
+    def __init__(self, stage: str, message: str):
+        super().__init__(message)
+        self.stage = stage
+
+
+@dataclass
+class Stage:
+    """A single pipeline stage and the stages whose outputs it consumes."""
+    name: str
+    func: Callable[..., str]
+    depends_on: List[str] = field(default_factory=list)
+
+
+class PipelineExecutor:
+    def __init__(self, stages: List[Stage], max_workers: int = 4, deadline: Optional[float] = None):
+        """Build the stage dependency graph and check that it can be run.
+
+        deadline is how many seconds a run may take in total (PIPELINE_DEADLINE
+        by default); API requests made by the stages are cut short to fit it.
+        """
+        self.stages = {stage.name: stage for stage in stages}
+        self.max_workers = max_workers
+        self.deadline = deadline
+
+        for stage in stages:
+            for dependency in stage.depends_on:
+                if dependency not in self.stages:
+                    raise ValueError(f"Stage '{stage.name}' depends on unknown stage '{dependency}'")
+        self._check_acyclic()
+
+    def _check_acyclic(self):
+        """Make sure the dependency graph has no cycles."""
+        visiting, done = set(), set()
+
+        def visit(name: str):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Pipeline has a dependency cycle through '{name}'")
+            visiting.add(name)
+            for dependency in self.stages[name].depends_on:
+                visit(dependency)
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self.stages:
+            visit(name)
+
+    def iter_stages(self) -> Iterator[Tuple[str, str]]:
+        """Run all stages, yielding (stage, output) pairs in the order they finish.
+
+        Each stage starts as soon as its dependencies have finished and receives
+        their outputs as keyword arguments. Stage methods on CoverLetterGenerator
+        report failures by returning a string starting with "Error", so such a
+        result stops the pipeline with a PipelineError.
+        """
+        results: Dict[str, str] = {}
+        pending = dict(self.stages)
+        running = {}
+        target = deadline_after(self.deadline)
+
+        pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            while pending or running:
+                for name, stage in list(pending.items()):
+                    if all(dependency in results for dependency in stage.depends_on):
+                        kwargs = {dependency: results[dependency] for dependency in stage.depends_on}
+                        # Copy the context so stages see the caller's contextvars (run ID etc.)
+                        running[pool.submit(contextvars.copy_context().run, run_with_deadline, target,
+                                            stage.func, **kwargs)] = name
+                        del pending[name]
+
+                finished, _ = wait(running, timeout=max(0.0, target - time.monotonic()),
+                                   return_when=FIRST_COMPLETED)
+                if not finished:
+                    raise PipelineError(next(iter(running.values())), "Pipeline deadline exceeded")
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        output = future.result()
+                    except Exception as e:
+                        raise PipelineError(name, str(e)) from e
+
+                    if output.startswith("Error"):
+                        raise PipelineError(name, output)
+
+                    results[name] = output
+                    yield name, output
+        finally:
+            # Don't start stages that are still queued, and don't wait for
+            # ones still running after a failure
+            for future in running:
+                future.cancel()
+            pool.shutdown(wait=False)
+
+    def run(self, on_stage_complete: Optional[Callable[[str, str], None]] = None) -> Dict[str, str]:
+        """Run all stages and return their outputs by stage name.
+
+        The optional callback is invoked from the calling thread as each stage
+        finishes.
+        """
+        results = {}
+        for name, output in self.iter_stages():
+            results[name] = output
+            if on_stage_complete:
+                on_stage_complete(name, output)
+        return results
+
+
+def build_job_pipeline(generator, user_profile: Callable[[], str], job_description: str,
+                       sample_letter: Optional[str]) -> PipelineExecutor:
+    """Build the pipeline for one job, taking the candidate profile from a callable.
+
+    The callable may compute the profile itself or wait on a profile shared
+    with other jobs. It runs in parallel with the job analysis; alignment waits
+    for both and the letter waits for the alignment. Without a sample letter
+    the pipeline stops after the alignment, leaving the letter to the caller.
+    """
+    stages = [
+        Stage("user_profile", user_profile),
+        Stage("job_analysis", lambda: generator.analyze_job(job_description)),
+        Stage("alignment",
+              lambda user_profile, job_analysis: generator.align_profile_with_job(user_profile, job_analysis),
+              depends_on=["user_profile", "job_analysis"]),
+    ]
+    if sample_letter is not None:
+        stages.append(Stage("cover_letter",
+                            lambda alignment: generator.generate_cover_letter(alignment, sample_letter),
+                            depends_on=["alignment"]))
+    return PipelineExecutor(stages, max_workers=2)
+
+
+def build_generation_pipeline(generator, resume: str, previous_letters: List[str], preferences: Optional[str],
+                              job_description: str, sample_letter: Optional[str],
+                              biography: Optional[str] = None) -> PipelineExecutor:
+    """Build the cover letter pipeline for a single job."""
+    return build_job_pipeline(
+        generator,
+        lambda: generator.process_user_info(resume, previous_letters, preferences, biography, job_description),
+        job_description,
+        sample_letter
+    )
+
+
+def run_batch_generation(generator, resume: str, previous_letters: List[str], preferences: Optional[str],
+                         job_descriptions: Dict[str, str], sample_letter: str,
+                         max_concurrency: int = 4, biography: Optional[str] = None) -> Iterator[Dict[str, str]]:
+    """Generate one cover letter per job description, yielding results as they finish.
+
+    The candidate profile is computed once and shared by every job, trimmed
+    to what is relevant to any of the job descriptions. At most
+    max_concurrency jobs run at a time. Each result holds the job name and
+    either the stage outputs or an error and the stage that failed. Its API
+    requests queue behind editor turns and single generations.
+    """
+    with ThreadPoolExecutor(max_workers=1) as profile_pool, \
+            ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as job_pool:
+        profile_future = profile_pool.submit(contextvars.copy_context().run, run_with_priority, BATCH,
+                                             run_with_deadline, deadline_after(),
+                                             generator.process_user_info, resume, previous_letters, preferences,
+                                             biography, "\n\n".join(job_descriptions.values()))
+
+        def generate_for_job(job_description: str) -> Dict[str, str]:
+            pipeline = build_job_pipeline(generator, profile_future.result, job_description, sample_letter)
+            return pipeline.run()
+
+        futures = {
+            job_pool.submit(contextvars.copy_context().run, run_with_priority, BATCH, generate_for_job, content): name
+            for name, content in job_descriptions.items()
+        }
+        try:
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    result = {"job_description_name": name}
+                    result.update(future.result())
+                    yield result
+                except PipelineError as e:
+                    yield {"job_description_name": name, "error": str(e), "stage": e.stage}
+        finally:
+            # Don't start queued jobs if the consumer stopped reading early
+            for future in futures:
+                future.cancel()
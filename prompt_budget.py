@@ -0,0 +1,202 @@
+import math
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from biography_merge import _terms
+from tokens import MESSAGE_OVERHEAD, REPLY_OVERHEAD, count_tokens
+
+# Most prompt tokens a stage may send, system prompt included
+STAGE_TOKEN_BUDGETS = {
+    "process_user_info": int(os.getenv('USER_INFO_TOKEN_BUDGET', '6000')),
+}
+
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+# Paragraphs longer than this are split at sentence ends so they can be trimmed in part
+MAX_CHUNK_TOKENS = 200
+
+
+@dataclass
+class Chunk:
+    """A paragraph, or run of sentences from a long paragraph, of a document in a trimmable section."""
+    document: int
+    paragraph: int
+    position: int
+    text: str
+    tokens: int
+    score: float = 0.0
+
+
+@dataclass
+class TrimmedSection:
+    """What was kept of a section's documents, and its token counts before and after trimming."""
+    documents: List[str]
+    tokens: int
+    original_tokens: int
+
+
+@dataclass
+class BudgetReport:
+    """Tokens each part of a prompt contributed, and how many were trimmed to fit the budget."""
+    budget: int
+    sections: Dict[str, int] = field(default_factory=dict)
+    trimmed: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def total(self) -> int:
+        return sum(self.sections.values())
+
+    def describe(self) -> str:
+        parts = []
+        for name, tokens in self.sections.items():
+            trimmed = self.trimmed.get(name)
+            parts.append(f"{name} {tokens}" + (f" (-{trimmed})" if trimmed else ""))
+        return f"{self.total}/{self.budget} tokens: " + ", ".join(parts)
+
+
+def _split_paragraph(paragraph: str) -> List[str]:
+    """Split a long paragraph into runs of whole sentences of at most about MAX_CHUNK_TOKENS."""
+    pieces, current, current_tokens = [], [], 0
+    for sentence in SENTENCE_END.split(paragraph):
+        tokens = count_tokens(sentence)
+        if current and current_tokens + tokens > MAX_CHUNK_TOKENS:
+            pieces.append(" ".join(current))
+            current, current_tokens = [], 0
+        current.append(sentence)
+        current_tokens += tokens
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def _split_chunks(documents: List[str]) -> List[Chunk]:
+    chunks = []
+    for document, text in enumerate(documents):
+        paragraphs = [p.strip() for p in PARAGRAPH_BREAK.split(text) if p.strip()]
+        for number, paragraph in enumerate(paragraphs):
+            tokens = count_tokens(paragraph)
+            pieces = _split_paragraph(paragraph) if tokens > MAX_CHUNK_TOKENS else [paragraph]
+            for piece in pieces:
+                chunks.append(Chunk(document, number, len(chunks), piece,
+                                    tokens if len(pieces) == 1 else count_tokens(piece)))
+    return chunks
+
+
+def _score_chunks(chunks: List[Chunk], query: str) -> None:
+    """Score each chunk by the IDF-weighted terms it shares with query, per token.
+
+    Without a query every chunk scores zero, and ties keep document order.
+    """
+    query_terms = _terms(query)
+    if not query_terms:
+        return
+    chunk_terms = [_terms(chunk.text) for chunk in chunks]
+    document_frequency = {}
+    for terms in chunk_terms:
+        for term in terms & query_terms:
+            document_frequency[term] = document_frequency.get(term, 0) + 1
+    for chunk, terms in zip(chunks, chunk_terms):
+        weight = sum(math.log((len(chunks) + 1) / (1 + document_frequency[term])) + 1 for term in terms & query_terms)
+        # Favour dense paragraphs over long ones that mention the same terms in passing
+        chunk.score = weight / math.sqrt(max(chunk.tokens, 1))
+
+
+def trim_documents(documents: List[str], budget: int, query: str = "", separator_tokens: int = 0) -> TrimmedSection:
+    """Keep the paragraphs of documents most relevant to query that fit in budget tokens.
+
+    Kept paragraphs stay in their original order, and a document with
+    nothing kept is dropped. Each kept document after the first also costs
+    separator_tokens.
+    """
+    chunks = _split_chunks(documents)
+    document_count = len({chunk.document for chunk in chunks})
+    original = sum(chunk.tokens for chunk in chunks) + separator_tokens * max(0, document_count - 1)
+    if original <= budget:
+        return TrimmedSection([document for document in documents if document.strip()], original, original)
+
+    _score_chunks(chunks, query)
+    kept, used, kept_documents = [], 0, set()
+    for chunk in sorted(chunks, key=lambda chunk: (-chunk.score, chunk.position)):
+        cost = chunk.tokens
+        if kept_documents and chunk.document not in kept_documents:
+            cost += separator_tokens
+        if used + cost <= budget:
+            kept.append(chunk)
+            kept_documents.add(chunk.document)
+            used += cost
+    kept.sort(key=lambda chunk: chunk.position)
+
+    # Sentences from the same paragraph are rejoined on one line
+    by_document: Dict[int, Dict[int, List[str]]] = {}
+    for chunk in kept:
+        by_document.setdefault(chunk.document, {}).setdefault(chunk.paragraph, []).append(chunk.text)
+    documents = ["\n\n".join(" ".join(pieces) for pieces in paragraphs.values())
+                 for paragraphs in by_document.values()]
+    return TrimmedSection(documents, used, original)
+
+
+def split_budget(budget: int, sizes: Dict[str, int], shares: Dict[str, float]) -> Dict[str, int]:
+    """Divide budget between sections by share, passing what a section doesn't need on to the others."""
+    allowance = {name: 0 for name in sizes}
+    remaining = budget
+    pending = [name for name in sizes if sizes[name] > 0]
+    while pending and remaining > 0:
+        total_share = sum(shares[name] for name in pending)
+        offers = {name: int(remaining * shares[name] / total_share) for name in pending}
+        satisfied = [name for name in pending if sizes[name] - allowance[name] <= offers[name]]
+        if not satisfied:
+            for name in pending:
+                allowance[name] += offers[name]
+            break
+        for name in satisfied:
+            remaining -= sizes[name] - allowance[name]
+            allowance[name] = sizes[name]
+            pending.remove(name)
+    return allowance
+
+
+def fit_sections(budget: int, fixed: Dict[str, str], trimmable: Dict[str, Tuple[List[str], float]],
+                 query: str = "", separator: str = "") -> Tuple[Dict[str, List[str]], BudgetReport]:
+    """Fit a prompt's sections into a token budget.
+
+    Fixed sections (the system prompt, instructions and labels, the resume)
+    are always sent in full. Trimmable sections are lists of documents, to be
+    joined with separator, with a share of what's left; each is cut down to
+    its allowance by relevance to query. Returns the kept documents per
+    trimmable section and the token report.
+    """
+    separator_tokens = count_tokens(separator)
+    report = BudgetReport(budget)
+    for name, text in fixed.items():
+        report.sections[name] = count_tokens(text)
+    overhead = MESSAGE_OVERHEAD * 2 + REPLY_OVERHEAD
+    remaining = max(0, budget - report.total - overhead)
+
+    sizes = {name: sum(count_tokens(document) for document in documents)
+             + separator_tokens * max(0, len(documents) - 1)
+             for name, (documents, _) in trimmable.items()}
+    allowance = split_budget(remaining, sizes, {name: share for name, (_, share) in trimmable.items()})
+
+    sections = {name: trim_documents(documents, allowance[name], query, separator_tokens)
+                for name, (documents, _) in trimmable.items()}
+    # Paragraphs rarely fill an allowance exactly; offer what's unused to sections that were cut
+    spare = remaining - sum(section.tokens for section in sections.values())
+    for name, (documents, _) in trimmable.items():
+        section = sections[name]
+        if spare <= 0:
+            break
+        if section.original_tokens > section.tokens:
+            sections[name] = trim_documents(documents, section.tokens + spare, query, separator_tokens)
+            spare -= sections[name].tokens - section.tokens
+
+    kept = {}
+    for name, section in sections.items():
+        kept[name] = section.documents
+        report.sections[name] = section.tokens
+        if section.original_tokens > section.tokens:
+            report.trimmed[name] = section.original_tokens - section.tokens
+    report.sections["overhead"] = overhead
+    return kept, report
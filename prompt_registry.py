@@ -0,0 +1,61 @@
+import threading
+from typing import Callable, Dict, List
+
+from database import shared_db
+
+
+class PromptRegistry:
+    """In-memory copy of the AI prompts, shared by every generator in the process.
+
+    Reads are a dictionary lookup. Every process that saves or deletes a
+    prompt bumps the prompt_version stored in the database; the next read
+    after that reloads all prompts in one query and tells subscribers the new
+    version, so edits made through the API or the CLI apply to the next
+    generation without a restart. Edits from another process are picked up
+    within PROMPT_VERSION_CHECK_INTERVAL seconds.
+    """
+
+    def __init__(self, db=shared_db):
+        self.db = db
+        self.version = -1  # the prompt_version the cached prompts were loaded at
+        self._prompts: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._subscribers: List[Callable[[int], None]] = []
+
+    def get(self, name: str) -> str:
+        """Get the current content of a prompt."""
+        if self.is_stale():
+            self.refresh()
+        prompt = self._prompts.get(name)
+        if prompt is None:
+            raise ValueError(f"Prompt '{name}' not found in database. Please initialize prompts first.")
+        return prompt
+
+    def is_stale(self) -> bool:
+        """Whether a prompt has been saved or deleted since the prompts were loaded."""
+        return self.version != self.db.prompt_version
+
+    def refresh(self) -> None:
+        """Reload every prompt from the database."""
+        with self._lock:
+            # Read the version first, so a save made during the load triggers another refresh
+            version = self.db.prompt_version
+            if version == self.version:
+                return
+            rows = self.db.list_prompts(fields=["name", "content"])
+            self._prompts = {row["name"]: row["content"] for row in rows}
+            self.version = version
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(version)
+            except Exception as e:
+                print(f"Error notifying prompt subscriber: {e}")
+
+    def subscribe(self, callback: Callable[[int], None]) -> None:
+        """Call callback with the new version whenever the prompts are reloaded."""
+        with self._lock:
+            self._subscribers.append(callback)
+
+
+prompt_registry = PromptRegistry()
@@ -0,0 +1,346 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Deque, Dict, Iterator, List, Optional
+
+from instrumentation import percentile
+from retry_policy import DeadlineExceeded, time_remaining
+from tokens import count_message_tokens
+
+# Request classes, served in this order when they compete for the same model
+INTERACTIVE = 0  # editor turns someone is waiting on
+PIPELINE = 1  # single generations from the web app, the API and jobs
+BATCH = 2  # batch generation
+
+PRIORITY_NAMES = {INTERACTIVE: "interactive", PIPELINE: "pipeline", BATCH: "batch"}
+
+# Completion tokens reserved for a request that doesn't set max_tokens; the
+# difference is settled once the response reports its usage
+DEFAULT_COMPLETION_TOKENS = int(os.getenv('RATE_LIMIT_COMPLETION_ESTIMATE', '800'))
+
+# How often waiting coroutines, and threads that aren't next in line, look again
+POLL_INTERVAL = 0.05
+
+_priority: ContextVar[int] = ContextVar("rate_limit_priority", default=PIPELINE)
+_user: ContextVar[str] = ContextVar("rate_limit_user", default="local")
+
+
+@dataclass
+class ModelLimits:
+    """Requests and tokens per minute; None leaves that dimension unlimited."""
+    requests_per_minute: Optional[int]
+    tokens_per_minute: Optional[int]
+
+
+def _limits_from_env(model: str) -> Optional[ModelLimits]:
+    """The model's limits from {MODEL}_RPM and {MODEL}_TPM, or None when neither is set."""
+    prefix = model.upper().replace("-", "_").replace(".", "_")
+    values = {}
+    for suffix in ("RPM", "TPM"):
+        raw = os.getenv(f"{prefix}_{suffix}")
+        if not raw:
+            continue
+        value = int(raw)
+        if value <= 0:
+            raise ValueError(f"{prefix}_{suffix} must be a positive number per minute, got {raw}")
+        values[suffix] = value
+    if not values:
+        return None
+    return ModelLimits(values.get("RPM"), values.get("TPM"))
+
+
+# Per-model budgets. Models are only paced once their limits are set, e.g.
+# GPT_4O_RPM and GPT_4O_TPM to match your account's tier; the API's own 429s
+# (retried by RetryPolicy) are the only limit otherwise.
+MODEL_LIMITS: Dict[str, ModelLimits] = {}
+for _model in ("gpt-4o", "o1-preview"):
+    _limits = _limits_from_env(_model)
+    if _limits is not None:
+        MODEL_LIMITS[_model] = _limits
+
+
+@contextmanager
+def request_class(priority: Optional[int] = None, user: Optional[str] = None):
+    """Queue the API requests made inside the block with this priority and/or on behalf of this user."""
+    tokens = []
+    if priority is not None:
+        tokens.append((_priority, _priority.set(priority)))
+    if user is not None:
+        tokens.append((_user, _user.set(user)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def run_with_priority(priority: int, func, /, *args, **kwargs):
+    """Call func with its requests queued at priority; used as the entry point of worker threads."""
+    with request_class(priority):
+        return func(*args, **kwargs)
+
+
+class TokenBucket:
+    """Allows up to per_minute units a minute, refilled continuously, with bursts up to a minute's worth."""
+
+    def __init__(self, per_minute: int):
+        if per_minute <= 0:
+            raise ValueError(f"A token bucket needs a positive rate, got {per_minute} per minute")
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until(self, amount: float) -> float:
+        """Seconds until amount (capped at the capacity) is available."""
+        self._refill()
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float):
+        """Spend amount; the level may go negative when a request used more than was reserved."""
+        self._refill()
+        self.level -= amount
+
+    def give(self, amount: float):
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+
+@dataclass
+class _Ticket:
+    model: str
+    user: str
+    priority: int
+    tokens: int
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class RateLimiter:
+    """Process-wide scheduler for OpenAI requests.
+
+    Each model has a requests bucket and a tokens bucket sized from its
+    per-minute limits. Waiting requests are served strictly by priority
+    (interactive, then pipeline, then batch) and round-robin between users
+    within a priority, and only the request at the head of the line may
+    spend from the buckets, so a large request is never starved by small
+    ones behind it. Models without limits are not queued.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, ModelLimits]] = None, history: int = 1000):
+        self.limits = MODEL_LIMITS if limits is None else limits
+        self._cond = threading.Condition()
+        self._buckets: Dict[str, tuple] = {}
+        # model -> priority -> user -> that user's waiting tickets, users in round-robin order
+        self._queues: Dict[str, Dict[int, "OrderedDict[str, Deque[_Ticket]]"]] = {}
+        self._waits: Dict[str, Deque[float]] = {}
+        self._history = history
+        self._granted: Dict[str, int] = {}
+
+    def _buckets_for(self, model: str):
+        if model not in self._buckets:
+            limits = self.limits[model]
+            self._buckets[model] = tuple(TokenBucket(per_minute) if per_minute else None
+                                         for per_minute in (limits.requests_per_minute, limits.tokens_per_minute))
+        return self._buckets[model]
+
+    def _enqueue(self, model: str, tokens: int) -> _Ticket:
+        ticket = _Ticket(model, _user.get(), _priority.get(), tokens)
+        with self._cond:
+            users = self._queues.setdefault(model, {}).setdefault(ticket.priority, OrderedDict())
+            users.setdefault(ticket.user, deque()).append(ticket)
+        return ticket
+
+    def _head(self, model: str) -> Optional[_Ticket]:
+        for priority in sorted(self._queues.get(model, {})):
+            users = self._queues[model][priority]
+            if users:
+                return next(iter(users.values()))[0]
+        return None
+
+    def _remove(self, ticket: _Ticket):
+        users = self._queues[ticket.model][ticket.priority]
+        queue = users[ticket.user]
+        queue.remove(ticket)
+        del users[ticket.user]
+        if queue:
+            # The user goes to the back of the line for their next request
+            users[ticket.user] = queue
+        self._cond.notify_all()
+
+    def _try_grant(self, ticket: _Ticket) -> Optional[float]:
+        """Grant the ticket if it is next in line and the buckets allow it.
+
+        Returns 0 once granted, the seconds until the buckets will allow it if
+        it is next in line, or None while other requests are ahead of it.
+        """
+        if self._head(ticket.model) is not ticket:
+            return None
+        requests, tokens = self._buckets_for(ticket.model)
+        wait = max(requests.time_until(1) if requests else 0.0, tokens.time_until(ticket.tokens) if tokens else 0.0)
+        if wait > 0:
+            return wait
+        if requests:
+            requests.take(1)
+        if tokens:
+            tokens.take(ticket.tokens)
+        self._remove(ticket)
+        waited = time.monotonic() - ticket.enqueued_at
+        self._waits.setdefault(ticket.model, deque(maxlen=self._history)).append(waited)
+        self._granted[ticket.model] = self._granted.get(ticket.model, 0) + 1
+        return 0.0
+
+    def _next_wait(self, ticket: _Ticket, wait: Optional[float]) -> float:
+        """How long to sleep before trying again; gives up if the pipeline deadline would pass first."""
+        delay = POLL_INTERVAL if wait is None else wait
+        remaining = time_remaining()
+        if remaining is not None and (remaining <= 0 or (wait is not None and wait >= remaining)):
+            self._remove(ticket)
+            raise DeadlineExceeded(f"Pipeline deadline exceeded waiting for the {ticket.model} rate limit")
+        return delay
+
+    def acquire(self, model: str, tokens: int) -> float:
+        """Block until a request of about tokens tokens may be sent to model; returns the seconds waited."""
+        if model not in self.limits:
+            return 0.0
+        ticket = self._enqueue(model, tokens)
+        with self._cond:
+            while True:
+                wait = self._try_grant(ticket)
+                if wait == 0:
+                    return time.monotonic() - ticket.enqueued_at
+                # Woken early when the line moves or a response returns unused tokens
+                self._cond.wait(self._next_wait(ticket, wait))
+
+    async def acquire_async(self, model: str, tokens: int) -> float:
+        """Wait without blocking the event loop until a request may be sent to model."""
+        import asyncio  # only the async pipeline waits here; the CLI doesn't pay for the import
+        if model not in self.limits:
+            return 0.0
+        ticket = self._enqueue(model, tokens)
+        while True:
+            with self._cond:
+                wait = self._try_grant(ticket)
+                if wait == 0:
+                    return time.monotonic() - ticket.enqueued_at
+                delay = min(self._next_wait(ticket, wait), POLL_INTERVAL * 10)
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                with self._cond:
+                    self._remove(ticket)
+                raise
+
+    def settle(self, model: str, reserved: int, used: Optional[int]):
+        """Correct the tokens bucket once a response reports how many tokens it actually used."""
+        if model not in self.limits or used is None:
+            return
+        with self._cond:
+            _, tokens = self._buckets_for(model)
+            if tokens is None:
+                return
+            if used < reserved:
+                tokens.give(reserved - used)
+            else:
+                tokens.take(used - reserved)
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Dict]:
+        """Queue depth (by priority) and recent wait times for each model."""
+        with self._cond:
+            stats = {}
+            for model in self.limits:
+                queues = self._queues.get(model, {})
+                depth = {PRIORITY_NAMES[priority]: sum(len(queue) for queue in users.values())
+                         for priority, users in sorted(queues.items())}
+                waits: List[float] = list(self._waits.get(model, []))
+                stats[model] = {
+                    "requests_per_minute": self.limits[model].requests_per_minute,
+                    "tokens_per_minute": self.limits[model].tokens_per_minute,
+                    "queue_depth": sum(depth.values()),
+                    "queue_depth_by_priority": depth,
+                    "granted": self._granted.get(model, 0),
+                    "wait_p50_ms": percentile([w * 1000 for w in waits], 0.50),
+                    "wait_p95_ms": percentile([w * 1000 for w in waits], 0.95),
+                    "wait_max_ms": max(waits) * 1000 if waits else None,
+                }
+            return stats
+
+    def wrap(self, client):
+        """A stand-in for an OpenAI client whose chat completions wait for the rate limiter."""
+        return SimpleNamespace(chat=SimpleNamespace(completions=_LimitedCompletions(client, self)))
+
+    def wrap_async(self, client):
+        """A stand-in for an AsyncOpenAI client whose chat completions wait for the rate limiter."""
+        return SimpleNamespace(chat=SimpleNamespace(completions=_AsyncLimitedCompletions(client, self)))
+
+
+def estimate_tokens(messages: List[Dict[str, str]], kwargs: Dict) -> int:
+    """Tokens to reserve for a request: its prompt plus the completion it may produce."""
+    completion = kwargs.get("max_completion_tokens") or kwargs.get("max_tokens") or DEFAULT_COMPLETION_TOKENS
+    return count_message_tokens(messages) + completion
+
+
+def _total_tokens(usage) -> Optional[int]:
+    if usage is None:
+        return None
+    total = getattr(usage, "total_tokens", None)
+    if total is None:
+        total = (getattr(usage, "prompt_tokens", 0) or 0) + (getattr(usage, "completion_tokens", 0) or 0)
+    return total
+
+
+class _LimitedCompletions:
+    def __init__(self, client, limiter: RateLimiter):
+        self.client = client
+        self.limiter = limiter
+
+    def create(self, model: str, messages: List[Dict[str, str]], **kwargs):
+        reserved = estimate_tokens(messages, kwargs)
+        self.limiter.acquire(model, reserved)
+        try:
+            response = self.client.chat.completions.create(model=model, messages=messages, **kwargs)
+        except BaseException:
+            # A failed request doesn't spend its tokens; give them back
+            self.limiter.settle(model, reserved, 0)
+            raise
+        if kwargs.get("stream"):
+            return self._settle_stream(model, reserved, response)
+        self.limiter.settle(model, reserved, _total_tokens(getattr(response, "usage", None)))
+        return response
+
+    def _settle_stream(self, model: str, reserved: int, stream) -> Iterator:
+        for chunk in stream:
+            if getattr(chunk, "usage", None):
+                self.limiter.settle(model, reserved, _total_tokens(chunk.usage))
+            yield chunk
+
+
+class _AsyncLimitedCompletions:
+    def __init__(self, client, limiter: RateLimiter):
+        self.client = client
+        self.limiter = limiter
+
+    async def create(self, model: str, messages: List[Dict[str, str]], **kwargs):
+        reserved = estimate_tokens(messages, kwargs)
+        await self.limiter.acquire_async(model, reserved)
+        try:
+            response = await self.client.chat.completions.create(model=model, messages=messages, **kwargs)
+        except BaseException:
+            self.limiter.settle(model, reserved, 0)
+            raise
+        self.limiter.settle(model, reserved, _total_tokens(getattr(response, "usage", None)))
+        return response
+
+
+rate_limiter = RateLimiter()
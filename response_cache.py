@@ -0,0 +1,73 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from database import shared_db
+
+WHITESPACE = re.compile(r"\s+")
+
+# Stored in the stage_cache table under this stage name
+CACHE_STAGE = "editor_turn"
+
+
+def normalize_message(message: Dict[str, str]) -> str:
+    """The content of a message with whitespace collapsed.
+
+    Case and punctuation are kept: "to ACME" and "to Acme", or a question
+    and the same words as an instruction, ask for different replies.
+    """
+    return WHITESPACE.sub(" ", message.get("content") or "").strip()
+
+
+def history_key(model: str, messages: List[Dict[str, str]]) -> str:
+    """Hash the model and the normalized messages of a request into a cache key."""
+    payload = json.dumps([CACHE_STAGE, model, [[message["role"], normalize_message(message)] for message in messages]])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Exact-match cache of editor responses, keyed by model and chat history.
+
+    Recently used responses are kept in memory (least recently used evicted
+    first) in front of the stage_cache table, which keeps them across
+    sessions under its TTL. The table keeps up to stored_entries editor
+    responses, evicted separately from the pipeline stages' entries so
+    editing doesn't push generations out of the cache.
+    """
+
+    def __init__(self, db=shared_db, max_entries: Optional[int] = None, stored_entries: Optional[int] = None):
+        self.db = db
+        self.max_entries = max_entries or int(os.getenv('EDITOR_CACHE_SIZE', '128'))
+        self.stored_entries = stored_entries or int(os.getenv('EDITOR_CACHE_STORED', '1000'))
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, key: str, response: str) -> None:
+        with self._lock:
+            self._entries[key] = response
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, model: str, messages: List[Dict[str, str]]) -> Optional[str]:
+        """Get the cached response to exactly this request, or None."""
+        key = history_key(model, messages)
+        with self._lock:
+            response = self._entries.get(key)
+            if response is not None:
+                self._entries.move_to_end(key)
+                return response
+        response = self.db.get_cached_stage(key)
+        if response is not None:
+            self._remember(key, response)
+        return response
+
+    def put(self, model: str, messages: List[Dict[str, str]], response: str) -> None:
+        """Cache the response to a request."""
+        key = history_key(model, messages)
+        self._remember(key, response)
+        self.db.save_cached_stage(key, CACHE_STAGE, model, response, max_entries=self.stored_entries)
@@ -0,0 +1,150 @@
+import os
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional
+
+# Error classes, from the API error or exception raised by a request
+RATE_LIMIT = "rate_limit"
+TIMEOUT = "timeout"  # timeouts and dropped connections
+SERVER_ERROR = "server_error"  # 5xx and other transient API failures
+PERMANENT = "permanent"  # bad requests, auth, quota: retrying won't help
+
+# Seconds a whole generation pipeline may take before it fails
+PIPELINE_DEADLINE = float(os.getenv('PIPELINE_DEADLINE', '300'))
+
+# Absolute time.monotonic() by which the current pipeline must finish. It is
+# copied into pipeline worker threads along with the rest of the context.
+_deadline: ContextVar[Optional[float]] = ContextVar("pipeline_deadline", default=None)
+
+TIMEOUT_ERRORS = {"APITimeoutError", "Timeout", "TimeoutException", "ReadTimeout", "ConnectTimeout",
+                  "APIConnectionError", "ConnectError", "RemoteProtocolError"}
+
+
+class DeadlineExceeded(Exception):
+    """Raised when the pipeline deadline leaves no time for another request."""
+
+
+def deadline_after(seconds: Optional[float] = None) -> float:
+    """The deadline seconds from now (PIPELINE_DEADLINE by default), or the current one if sooner."""
+    target = time.monotonic() + (PIPELINE_DEADLINE if seconds is None else seconds)
+    current = _deadline.get()
+    return target if current is None else min(current, target)
+
+
+@contextmanager
+def deadline_scope(target: float):
+    """Apply an absolute deadline to the requests made inside the block."""
+    token = _deadline.set(target)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def run_with_deadline(target: float, func: Callable, /, *args, **kwargs):
+    """Call func with the deadline applied; used as the entry point of pipeline worker threads."""
+    with deadline_scope(target):
+        return func(*args, **kwargs)
+
+
+def time_remaining() -> Optional[float]:
+    """Seconds left before the current deadline, or None without one."""
+    target = _deadline.get()
+    return None if target is None else target - time.monotonic()
+
+
+def request_options() -> Dict[str, float]:
+    """Extra arguments for an API request so it times out no later than the deadline."""
+    remaining = time_remaining()
+    if remaining is None:
+        return {}
+    if remaining <= 0:
+        raise DeadlineExceeded("Pipeline deadline exceeded")
+    return {"timeout": remaining}
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def classify_error(error: Exception) -> str:
+    """Sort an exception from an API request into one of the error classes.
+
+    Works from the status code and exception type name, so it applies to the
+    OpenAI SDK's errors without importing it.
+    """
+    status = _status_code(error)
+    if status == 429:
+        # An exhausted quota is reported as a 429 too, but waiting won't fix it
+        code = getattr(error, "code", None) or ""
+        return PERMANENT if code == "insufficient_quota" else RATE_LIMIT
+    if status == 408 or isinstance(error, TimeoutError) or type(error).__name__ in TIMEOUT_ERRORS:
+        return TIMEOUT
+    if status is not None and (status >= 500 or status == 409):
+        return SERVER_ERROR
+    if isinstance(error, ConnectionError):
+        return TIMEOUT
+    if type(error).__name__ == "InternalServerError":
+        return SERVER_ERROR
+    return PERMANENT
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Seconds the server asked us to wait, from the Retry-After (or retry-after-ms) header."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            from email.utils import parsedate_to_datetime  # an HTTP date is rare; the CLI doesn't pay for the import
+            when = parsedate_to_datetime(value)
+            return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass
+class RetryPolicy:
+    """Exponential backoff with full jitter for retryable API errors.
+
+    Rate limits back off from a longer base delay and never retry sooner
+    than the server's Retry-After. Permanent errors are not retried.
+    """
+    base_delay: float = float(os.getenv('RETRY_BASE_DELAY', '1.0'))
+    rate_limit_base_delay: float = float(os.getenv('RETRY_RATE_LIMIT_BASE_DELAY', '4.0'))
+    max_delay: float = float(os.getenv('RETRY_MAX_DELAY', '30.0'))
+
+    def should_retry(self, kind: str) -> bool:
+        return kind != PERMANENT
+
+    def delay(self, attempt: int, kind: str, error: Optional[Exception] = None) -> float:
+        """Seconds to wait before retry number attempt + 1 after an error of the given class."""
+        base = self.rate_limit_base_delay if kind == RATE_LIMIT else self.base_delay
+        delay = random.uniform(0, min(self.max_delay, base * 2 ** attempt))
+        hint = retry_after(error) if error is not None else None
+        if hint is not None:
+            # Spread out clients that were all told the same time
+            delay = max(delay, hint + random.uniform(0, self.base_delay))
+        return delay
+
+    def wait(self, attempt: int, kind: str, error: Optional[Exception] = None) -> float:
+        """The delay before the next attempt; raises DeadlineExceeded if it would run past the deadline."""
+        delay = self.delay(attempt, kind, error)
+        remaining = time_remaining()
+        if remaining is not None and delay >= remaining:
+            raise DeadlineExceeded(f"Pipeline deadline exceeded: {remaining:.1f}s left, next retry in {delay:.1f}s")
+        return delay
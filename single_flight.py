@@ -0,0 +1,99 @@
+import threading
+import weakref
+from typing import Any, Callable, Dict, Tuple
+
+from retry_policy import DeadlineExceeded, time_remaining
+
+
+class _Call:
+    """One in-flight call and, once it finishes, its result or error."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one.
+
+    The first caller for a key runs the function; callers that arrive while
+    it runs wait for it and get the same result. If it raises, the waiting
+    callers start over, so one failure is not passed on to everyone. Once a
+    call finishes its key is forgotten, so later calls run again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+
+    def do(self, key: str, func: Callable, /, *args, **kwargs) -> Tuple[Any, bool]:
+        """Run func, or wait for the same call already running; returns (result, shared)."""
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+            if leader:
+                try:
+                    call.result = func(*args, **kwargs)
+                    return call.result, False
+                except BaseException as e:
+                    call.error = e
+                    raise
+                finally:
+                    with self._lock:
+                        del self._calls[key]
+                    call.done.set()
+            remaining = time_remaining()
+            if not call.done.wait(None if remaining is None else max(0.0, remaining)):
+                raise DeadlineExceeded("Pipeline deadline exceeded waiting for an in-flight request")
+            if call.error is None:
+                return call.result, True
+
+    def in_flight(self) -> int:
+        """How many calls are running."""
+        with self._lock:
+            return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines; calls are only collapsed within one event loop."""
+
+    def __init__(self):
+        self._calls: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+    async def do(self, key: str, func: Callable, /, *args, **kwargs) -> Tuple[Any, bool]:
+        """Await func(*args, **kwargs), or the same call already running; returns (result, shared)."""
+        import asyncio
+        calls = self._calls.setdefault(asyncio.get_running_loop(), {})
+        while True:
+            future = calls.get(key)
+            if future is None:
+                future = calls[key] = asyncio.get_running_loop().create_future()
+                try:
+                    result = await func(*args, **kwargs)
+                    future.set_result(result)
+                    return result, False
+                except BaseException:
+                    # Waiting callers start over rather than sharing the error
+                    future.set_result(_FAILED)
+                    raise
+                finally:
+                    del calls[key]
+            remaining = time_remaining()
+            try:
+                result = await asyncio.wait_for(asyncio.shield(future), remaining)
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded("Pipeline deadline exceeded waiting for an in-flight request")
+            if result is not _FAILED:
+                return result, True
+
+
+_FAILED = object()
+
+# Shared by every generator in the process, so identical stage calls from
+# different requests collapse into one API request
+stage_flights = SingleFlight()
+async_stage_flights = AsyncSingleFlight()
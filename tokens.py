@@ -0,0 +1,26 @@
+import re
+from typing import Dict, List
+
+# Words, numbers and single punctuation marks, roughly as a BPE tokenizer splits text
+TOKEN_PATTERN = re.compile(r"[A-Za-z]+|\d{1,3}|[^\sA-Za-z\d]")
+
+# Chat messages carry a few tokens of framing each, plus the reply's priming
+MESSAGE_OVERHEAD = 4
+REPLY_OVERHEAD = 3
+
+
+def count_tokens(text: str) -> int:
+    """Estimate the number of tokens in text without calling the API.
+
+    Common English words are one token and long words are split into pieces
+    of about seven letters, which is close to what GPT-4-class tokenizers
+    produce for prose.
+    """
+    if not text:
+        return 0
+    return sum(1 + (len(piece) - 1) // 7 if piece[0].isalpha() else 1 for piece in TOKEN_PATTERN.findall(text))
+
+
+def count_message_tokens(messages: List[Dict[str, str]]) -> int:
+    """Estimate the prompt tokens a list of chat messages will use."""
+    return sum(count_tokens(message.get("content") or "") + MESSAGE_OVERHEAD for message in messages) + REPLY_OVERHEAD
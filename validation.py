@@ -0,0 +1,116 @@
+import re
+from dataclasses import dataclass
+from typing import List, Optional
+
+# Phrases that mean the model refused or failed instead of doing the task
+REFUSAL_PATTERNS = [
+    re.compile(r"^\s*(I'm sorry|I am sorry|I apologize|Sorry,)", re.IGNORECASE),
+    re.compile(r"\bI (can't|cannot|can not) (help|assist) with\b", re.IGNORECASE),
+    re.compile(r"\bI('m| am) (unable|not able) to (help|assist|provide|complete)\b", re.IGNORECASE),
+    re.compile(r"\bas an AI (language )?model\b", re.IGNORECASE),
+]
+
+HEADING_PATTERN = re.compile(r"^\s{0,3}#{1,6}\s+(.+?)\s*#*\s*$", re.MULTILINE)
+BULLET_PATTERN = re.compile(r"^\s*([*\-+]|\d+[.)])\s+\S", re.MULTILINE)
+
+MIN_WORDS = 20
+MAX_WORDS = 4000
+LETTER_MIN_WORDS = 120
+LETTER_MAX_WORDS = 900
+
+
+@dataclass
+class ValidationResult:
+    """Outcome of a validation; valid is None when the local check can't decide."""
+    valid: Optional[bool]
+    reason: str
+    path: str = "local"
+
+
+def normalize_heading(heading: str) -> str:
+    return re.sub(r"[^a-z0-9&]+", " ", heading.lower()).strip()
+
+
+def _required_sections(expected_format: str) -> List[dict]:
+    """Extract headings from an expected_format template and whether each expects bullets."""
+    sections = []
+    matches = list(HEADING_PATTERN.finditer(expected_format))
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(expected_format)
+        body = expected_format[match.end():end]
+        sections.append({
+            "heading": normalize_heading(match.group(1)),
+            "bullets": bool(BULLET_PATTERN.search(body)),
+        })
+    return sections
+
+
+def _split_sections(response: str) -> dict:
+    """Map each normalized heading in the response to the text under it."""
+    sections = {}
+    matches = list(HEADING_PATTERN.finditer(response))
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(response)
+        sections[normalize_heading(match.group(1))] = response[match.end():end]
+    return sections
+
+
+def validate_locally(response: str, expected_format: str = "") -> ValidationResult:
+    """Check a response against its expected_format template without calling a model.
+
+    Templates with Markdown headings (the analysis stages) are checked for
+    every required section and for bullets where the template has them.
+    Templates without headings (letters, biographies) are checked for length
+    and paragraph structure. Anything in between is left undecided so the
+    caller can fall back to the LLM validator.
+    """
+    text = response.strip() if response else ""
+    if not text:
+        return ValidationResult(False, "empty response")
+    if text.startswith("Error"):
+        return ValidationResult(False, "error message")
+    for pattern in REFUSAL_PATTERNS:
+        if pattern.search(text[:500]):
+            return ValidationResult(False, "refusal or apology")
+
+    required = _required_sections(expected_format)
+    # Short Markdown with the expected structure (e.g. a single updated
+    # biography section) is judged on its structure, not its length
+    structured = bool(required) or ("markdown" in expected_format.lower() and HEADING_PATTERN.search(text))
+    words = len(text.split())
+    if words < MIN_WORDS and not structured:
+        return ValidationResult(False, f"too short ({words} words)")
+    if words > MAX_WORDS:
+        return ValidationResult(False, f"too long ({words} words)")
+
+    if required:
+        found = _split_sections(text)
+        missing = [section["heading"] for section in required if section["heading"] not in found]
+        if len(missing) == len(required):
+            return ValidationResult(False, "none of the required sections present")
+        if missing:
+            return ValidationResult(None, f"missing sections: {', '.join(missing)}")
+        without_bullets = [
+            section["heading"] for section in required
+            if section["bullets"] and not BULLET_PATTERN.search(found[section["heading"]])
+        ]
+        if without_bullets:
+            return ValidationResult(None, f"sections without bullets: {', '.join(without_bullets)}")
+        return ValidationResult(True, "all required sections present")
+
+    paragraphs = [p for p in re.split(r"\n\s*\n", text) if p.strip()]
+    if "letter" in expected_format.lower():
+        if words < LETTER_MIN_WORDS // 2:
+            return ValidationResult(False, f"letter too short ({words} words)")
+        if LETTER_MIN_WORDS <= words <= LETTER_MAX_WORDS and len(paragraphs) >= 3:
+            return ValidationResult(True, "letter length and paragraphs within bounds")
+        return ValidationResult(None, f"unusual letter shape ({words} words, {len(paragraphs)} paragraphs)")
+
+    if "markdown" in expected_format.lower():
+        if HEADING_PATTERN.search(text) or len(paragraphs) >= 2:
+            return ValidationResult(True, "structured markdown")
+        return ValidationResult(None, "no markdown structure")
+
+    if len(paragraphs) >= 2:
+        return ValidationResult(True, "multi-paragraph response")
+    return ValidationResult(None, "no structural signal")